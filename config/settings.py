@@ -235,3 +235,41 @@ REST_FRAMEWORK = {
 }
 
 LOGIN_REDIRECT_URL = '/admin/'
+
+# シフト生成ジョブを実行するワーカープロセス数 (0 の場合はリクエスト内で同期実行)
+# プールは Webワーカーごとに作られ、CP-SAT も探索ワーカー数 0 (既定) では全コアを使うため、既定は1にする
+SOLVER_JOB_WORKERS = int(os.environ.get('SOLVER_JOB_WORKERS', 1))
+# この秒数を過ぎても待機中・実行中のままのジョブは、ワーカーが終了したものとして失敗にする
+SOLVER_JOB_TIMEOUT_SECONDS = int(os.environ.get('SOLVER_JOB_TIMEOUT_SECONDS', 30 * 60))
+
+# シフト生成結果キャッシュの最大件数と有効期間 (秒)
+SOLVER_CACHE_MAX_ENTRIES = int(os.environ.get('SOLVER_CACHE_MAX_ENTRIES', 200))
+SOLVER_CACHE_TTL_SECONDS = int(os.environ.get('SOLVER_CACHE_TTL_SECONDS', 7 * 24 * 60 * 60))
+
+# Excel エクスポートのジョブを実行するスレッド数 (0 の場合はリクエスト内で同期実行)
+EXPORT_JOB_WORKERS = int(os.environ.get('EXPORT_JOB_WORKERS', 2))
+# この秒数を過ぎても待機中・実行中のままのエクスポートジョブは、Webワーカーが終了したものとして失敗にする
+EXPORT_JOB_TIMEOUT_SECONDS = int(os.environ.get('EXPORT_JOB_TIMEOUT_SECONDS', 10 * 60))
+# 一括エクスポート (zip) の部門ごとのブックを並列に書き出すプロセス数 (0 の場合はジョブのスレッドで順に書き出す)
+# プールは Webワーカーごとに作られるため、Webワーカー数×この値のプロセスが起動しうる。既定は小さくしておく
+EXPORT_WORKBOOK_PROCESSES = int(os.environ.get('EXPORT_WORKBOOK_PROCESSES', 2))
+# 作成した Excel ファイルのキャッシュの保存先・合計サイズの上限 (バイト)・有効期間 (秒)
+EXPORT_CACHE_DIR = Path(os.environ.get('EXPORT_CACHE_DIR', BASE_DIR / 'export_cache'))
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get('EXPORT_CACHE_MAX_BYTES', 500 * 1024 * 1024))
+EXPORT_CACHE_TTL_SECONDS = int(os.environ.get('EXPORT_CACHE_TTL_SECONDS', 7 * 24 * 60 * 60))
+
+# シフト表の変更履歴を残す版数の範囲。これより古い版数からの差分同期は全件の再取得になる
+SCHEDULE_CHANGE_MAX_VERSIONS = int(os.environ.get('SCHEDULE_CHANGE_MAX_VERSIONS', 1000))
+
+# core のログ (警告・エラー) をコンソールに出力する。
+# シフト生成の計測結果 (core.instrumentation) は INFO で出力するため、必要な場合は CORE_LOG_LEVEL=INFO にする
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core': {'handlers': ['console'], 'level': os.environ.get('CORE_LOG_LEVEL', 'WARNING')},
+    },
+}
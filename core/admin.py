@@ -2,12 +2,13 @@ from django.contrib import admin
 from django.urls import path, reverse
 from django.shortcuts import render, redirect
 from django.contrib.auth import get_user_model # Add this import
+from .versioning import department_writes
 from .forms import BulkLeaveRequestForm, BulkUpdateMinDaysOffForm, BulkAssignmentForm, BulkFixedAssignmentForm, BulkOtherAssignmentForm, BulkPaidLeaveForm
 from .models import (
     Member, DayGroup, ShiftPattern, MemberAvailability,
     LeaveRequest, TimeSlotRequirement, RelationshipGroup, GroupMember, Assignment, OtherAssignment,
     FixedAssignment, SpecificDateRequirement, SpecificTimeSlotRequirement, MemberShiftPatternPreference,
-    Department, DesignatedHoliday, PaidLeave, SolverSettings
+    Department, DesignatedHoliday, PaidLeave, SolverSettings, SolveRun
 )
 
 User = get_user_model() # Define User model
@@ -222,7 +223,9 @@ class MemberAdmin(admin.ModelAdmin):
                 if not request.user.is_superuser:
                     members_to_update = members_to_update.filter(created_by=request.user)
 
-                updated_count = members_to_update.update(min_monthly_days_off=new_days_off)
+                # update() はシグナルを送らないため、部門の版数はまとめて上げる
+                with department_writes(*members_to_update.values_list('department_id', flat=True).distinct()):
+                    updated_count = members_to_update.update(min_monthly_days_off=new_days_off)
                 self.message_user(request, f"{updated_count}人の従業員の最低公休日数を更新しました。")
                 return redirect('admin:core_member_changelist')
         else:
@@ -271,7 +274,9 @@ class MemberAdmin(admin.ModelAdmin):
                 if not request.user.is_superuser:
                     members_to_update = members_to_update.filter(created_by=request.user)
 
-                updated_count = members_to_update.update(min_monthly_days_off=new_days_off)
+                # update() はシグナルを送らないため、部門の版数はまとめて上げる
+                with department_writes(*members_to_update.values_list('department_id', flat=True).distinct()):
+                    updated_count = members_to_update.update(min_monthly_days_off=new_days_off)
                 self.message_user(request, f"{updated_count}人の従業員の最低公休日数を更新しました。")
                 return redirect('admin:core_member_changelist')
         else:
@@ -380,7 +385,9 @@ class MemberAvailabilityAdmin(admin.ModelAdmin):
                 if not request.user.is_superuser:
                     members_to_update = members_to_update.filter(created_by=request.user)
 
-                updated_count = members_to_update.update(min_monthly_days_off=new_days_off)
+                # update() はシグナルを送らないため、部門の版数はまとめて上げる
+                with department_writes(*members_to_update.values_list('department_id', flat=True).distinct()):
+                    updated_count = members_to_update.update(min_monthly_days_off=new_days_off)
                 self.message_user(request, f"{updated_count}人の従業員の最低公休日数を更新しました。")
                 return redirect('admin:core_member_changelist')
         else:
@@ -1215,6 +1222,16 @@ class SolverSettingsAdmin(admin.ModelAdmin):
                 'shift_preference_bonus',
             )
         }),
+        ('ソルバーエンジン', {
+            'fields': (
+                'max_time_in_seconds',
+                'num_search_workers',
+                'relative_gap_limit',
+                'no_improvement_timeout',
+                'random_seed',
+                'linearization_level',
+            )
+        }),
     )
 
     def get_queryset(self, request):
@@ -1260,6 +1277,24 @@ class SolverSettingsAdmin(admin.ModelAdmin):
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
+class SolveRunAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'department', 'start_date', 'end_date', 'status', 'is_repair', 'total_seconds', 'total_queries', 'num_variables', 'num_constraints', 'gap')
+    list_filter = ('department', 'status', 'is_repair')
+    readonly_fields = [field.name for field in SolveRun._meta.fields]
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        if request.user.is_superuser:
+            return qs
+        return qs.filter(department__created_by=request.user)
+
+    def has_add_permission(self, request):
+        return False # 実行記録はシフト生成時に自動で作成される
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 # --- モデルの登録 ---
 admin.site.register(Member, MemberAdmin)
 admin.site.register(Department, DepartmentAdmin)
@@ -1277,4 +1312,5 @@ admin.site.register(FixedAssignment, FixedAssignmentAdmin)
 admin.site.register(OtherAssignment, OtherAssignmentAdmin)
 admin.site.register(DesignatedHoliday, DesignatedHolidayAdmin)
 admin.site.register(Assignment, AssignmentAdmin)
-admin.site.register(SolverSettings, SolverSettingsAdmin)
\ No newline at end of file
+admin.site.register(SolverSettings, SolverSettingsAdmin)
+admin.site.register(SolveRun, SolveRunAdmin)
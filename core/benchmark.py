@@ -0,0 +1,160 @@
+import random
+from collections import defaultdict
+from datetime import date, time, timedelta
+
+from .coverage import SlotCoverage, SLOT_MINUTES
+from .models import (
+    Department, Member, ShiftPattern, DayGroup, TimeSlotRequirement, MemberShiftPatternPreference,
+    LeaveRequest, RelationshipGroup, GroupMember, FixedAssignment, SolverSettings, SolveRun
+)
+from .solver import RequirementIndex, generate_schedule
+
+# ベンチマークの規模 (従業員数 × 日数)
+BENCHMARK_MEMBER_COUNTS = (10, 50, 200)
+BENCHMARK_DAY_COUNTS = (7, 31, 92)
+# 月曜日から始まる期間で生成する
+BENCHMARK_START_DATE = date(2025, 9, 1)
+
+# (パターン名, 開始, 終了, 夜勤)
+BENCHMARK_PATTERNS = (
+    ('早番', time(7, 0), time(16, 0), False),
+    ('日勤', time(9, 0), time(18, 0), False),
+    ('遅番', time(13, 0), time(22, 0), False),
+    ('夜勤', time(22, 0), time(7, 0), True),
+)
+
+
+def case_name(num_members, num_days):
+    return f'{num_members}x{num_days}'
+
+
+def build_benchmark_department(num_members, num_days, seed=0):
+    """
+    乱数シードから、従業員数・日数に応じた規模の部門データを作成する。
+    同じ引数であれば常に同じデータになる。戻り値は (部門, 開始日, 終了日)。
+    """
+    rng = random.Random(f'{seed}-{num_members}-{num_days}')
+    start_date = BENCHMARK_START_DATE
+    end_date = start_date + timedelta(days=num_days - 1)
+    days = [start_date + timedelta(days=i) for i in range(num_days)]
+
+    department = Department.objects.create(name=f'ベンチマーク {case_name(num_members, num_days)}')
+    patterns = [
+        ShiftPattern.objects.create(
+            department=department, pattern_name=name, start_time=start, end_time=end,
+            break_minutes=60, is_night_shift=is_night
+        )
+        for name, start, end, is_night in BENCHMARK_PATTERNS
+    ]
+    weekdays = DayGroup.objects.create(
+        group_name=f'平日 {department.id}', is_monday=True, is_tuesday=True, is_wednesday=True,
+        is_thursday=True, is_friday=True
+    )
+    weekends = DayGroup.objects.create(group_name=f'土日 {department.id}', is_saturday=True, is_sunday=True)
+
+    # 必要人数は従業員数に比例させる (日中は夜間の2倍)
+    base = max(1, num_members // 10)
+    for day_group, scale in ((weekdays, 1.0), (weekends, 0.5)):
+        for start, end, headcount in (
+            (time(0, 0), time(7, 0), base),
+            (time(7, 0), time(9, 0), base),
+            (time(9, 0), time(18, 0), 2 * base),
+            (time(18, 0), time(22, 0), base),
+            (time(22, 0), time(23, 59), base),
+        ):
+            min_headcount = max(1, round(headcount * scale))
+            TimeSlotRequirement.objects.create(
+                department=department, day_group=day_group, start_time=start, end_time=end,
+                min_headcount=min_headcount, max_headcount=2 * min_headcount + 1
+            )
+
+    members = []
+    preferences = []
+    for i in range(num_members):
+        is_hourly = rng.random() < 0.7
+        hourly_wage = rng.randrange(1000, 1600, 50) if is_hourly else None
+        member = Member.objects.create(
+            department=department,
+            name=f'従業員{i + 1:03d}',
+            employee_type='hourly' if is_hourly else 'salaried',
+            hourly_wage=hourly_wage,
+            monthly_salary=None if is_hourly else rng.randrange(200000, 350000, 10000),
+            min_monthly_salary=hourly_wage * 8 * num_days // 3 if is_hourly and rng.random() < 0.3 else None,
+            max_monthly_salary=hourly_wage * 8 * num_days * 2 // 3 if is_hourly and rng.random() < 0.3 else None,
+            min_monthly_days_off=round(num_days * 8 / 30),
+            priority_score=rng.randint(1, 99),
+        )
+        if rng.random() < 0.2:
+            member.allowed_day_groups.add(weekdays)
+        for priority, pattern in enumerate(rng.sample(patterns, rng.randint(2, len(patterns))), start=1):
+            preferences.append(MemberShiftPatternPreference(member=member, shift_pattern=pattern, priority=priority))
+        members.append(member)
+    MemberShiftPatternPreference.objects.bulk_create(preferences)
+    # 固定シフト同士が勤務間インターバル (ハード制約) に違反しないよう、固定するのは日中のパターンだけにする
+    fixable_patterns = defaultdict(list)
+    for preference in preferences:
+        if not preference.shift_pattern.is_night_shift:
+            fixable_patterns[preference.member.id].append(preference.shift_pattern)
+
+    # 希望休 (約5%) と固定シフト (約2%)
+    leaves = []
+    fixed_assignments = []
+    for member in members:
+        for d in days:
+            r = rng.random()
+            if r < 0.05:
+                leaves.append(LeaveRequest(member=member, leave_date=d, status='approved'))
+            elif r < 0.07 and fixable_patterns[member.id]:
+                fixed_assignments.append(
+                    FixedAssignment(member=member, shift_date=d, shift_pattern=rng.choice(fixable_patterns[member.id]))
+                )
+    LeaveRequest.objects.bulk_create(leaves)
+    FixedAssignment.objects.bulk_create(fixed_assignments)
+
+    # 相性の悪い組 (従業員10人ごとに1組) とペアリング (20人ごとに1組)
+    for rule_type, count in (('incompatible', max(1, num_members // 10)), ('pairing', max(1, num_members // 20))):
+        for i in range(count):
+            group = RelationshipGroup.objects.create(group_name=f'{rule_type} {department.id}-{i}', rule_type=rule_type)
+            GroupMember.objects.bulk_create(GroupMember(group=group, member=m) for m in rng.sample(members, 2))
+
+    SolverSettings.objects.create(department=department, name='Benchmark', is_default=True)
+    return department, start_date, end_date
+
+
+def headcount_shortfall(department, start_date, end_date, assignments):
+    """生成結果の時間帯ごとの不足人数の合計 (人×時間帯) を返す"""
+    patterns = ShiftPattern.objects.filter(department=department)
+    coverage = SlotCoverage(patterns, start_date, end_date, SLOT_MINUTES)
+    counts = coverage.counts((a['shift_date'], a['shift_pattern_id']) for a in assignments)
+    requirement_index = RequirementIndex(department.id, [], set(), SLOT_MINUTES)
+
+    shortfall = 0
+    for day_offset in range(coverage.num_days):
+        d = start_date + timedelta(days=day_offset)
+        for t, rule in requirement_index.slot_rules(d):
+            shortfall += max(0, rule.min_headcount - int(counts[day_offset, t // SLOT_MINUTES]))
+    return shortfall
+
+
+def run_benchmark_case(num_members, num_days, seed=0, time_limit=30.0, workers=8):
+    """1つの規模でデータを作成して generate_schedule を実行し、計測結果 (実行条件を含む) を返す"""
+    department, start_date, end_date = build_benchmark_department(num_members, num_days, seed)
+    SolverSettings.objects.filter(department=department).update(
+        max_time_in_seconds=time_limit, num_search_workers=workers, random_seed=seed
+    )
+
+    result = generate_schedule(department.id, start_date.isoformat(), end_date.isoformat(), warm_start=False)
+    run = SolveRun.objects.filter(department=department).latest('created_at')
+    build_seconds = sum(run.phases.get(phase, {}).get('seconds', 0) for phase in ('load', 'variables', 'constraints'))
+    return {
+        'time_limit': time_limit,
+        'workers': workers,
+        'status': run.status,
+        'num_variables': run.num_variables,
+        'num_constraints': run.num_constraints,
+        'build_seconds': round(build_seconds, 3),
+        'solve_seconds': run.phases.get('solve', {}).get('seconds'),
+        'objective': run.objective_value,
+        'gap': run.gap,
+        'shortfall': headcount_shortfall(department, start_date, end_date, result['assignments']) if result['success'] else None,
+    }
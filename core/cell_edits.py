@@ -0,0 +1,168 @@
+from collections import defaultdict
+from datetime import date
+
+from django.db import transaction
+
+from .models import Member, ShiftPattern, Assignment, FixedAssignment, OtherAssignment, DesignatedHoliday, PaidLeave, LeaveRequest
+from .versioning import CELL_MODELS, department_writes, record_bulk_created, record_cell_change
+
+# 操作の種類ごとに、同じセルから先に削除するモデル
+CLEARED_MODELS = {
+    'assignment': (DesignatedHoliday, PaidLeave, Assignment, OtherAssignment),
+    'other': (DesignatedHoliday, PaidLeave, Assignment, OtherAssignment),
+    'fixed': (DesignatedHoliday, PaidLeave, Assignment),
+    # 指定休日は、新しく作成したセルだけ他のデータを削除する
+    'designated_holiday': (Assignment, FixedAssignment, OtherAssignment, PaidLeave),
+    'paid_leave': (Assignment, FixedAssignment, OtherAssignment, DesignatedHoliday, LeaveRequest),
+    'clear_paid_leave': (PaidLeave,),
+}
+
+
+class CellOperationError(Exception):
+    """セル操作の内容が不正な場合のエラー。status_code はレスポンスのステータス"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def parse_cell_operations(operations):
+    """
+    リクエストのセル操作を検証し、(従業員ID, 日付) ごとの操作の辞書を返す。
+    同じセルへの操作が複数ある場合は最後の操作だけを使う。
+    """
+    if not isinstance(operations, list) or not operations:
+        raise CellOperationError('operations must be a non-empty list')
+
+    cells = {}
+    for operation in operations:
+        try:
+            op_type = operation['type']
+            member_id = int(operation['member_id'])
+            day = date.fromisoformat(str(operation['date']))
+        except (KeyError, TypeError, ValueError):
+            raise CellOperationError('each operation needs type, member_id and date')
+        if op_type not in CLEARED_MODELS:
+            raise CellOperationError(f'unknown operation type: {op_type}')
+        pattern_id = operation.get('pattern_id') or None
+        cells[member_id, day] = {
+            'type': op_type,
+            'pattern_id': int(pattern_id) if pattern_id is not None else None,
+            'activity_name': operation.get('activity_name') or '',
+        }
+    return cells
+
+
+def _cell_ids(model, cells):
+    """
+    model の行のうち (従業員ID, 日付) が cells に含まれるものの ID のリストを、セルごとに返す (IN で絞り込む1クエリ)。
+    Assignment と LeaveRequest は (従業員, 日付) が一意でないため、同じセルの行をすべて返す。
+    """
+    date_field = CELL_MODELS[model][1]
+    rows = model.objects.filter(
+        member_id__in={member_id for member_id, _ in cells}, **{f'{date_field}__in': {day for _, day in cells}}
+    ).values_list('id', 'member_id', date_field)
+    row_ids = defaultdict(list)
+    for row_id, member_id, day in rows:
+        if (member_id, day) in cells:
+            row_ids[member_id, day].append(row_id)
+    return row_ids
+
+
+def apply_cell_operations(user, operations):
+    """
+    シフト表のセル操作をまとめて1つのトランザクションで適用し、種類ごとの作成件数・削除件数を返す。
+    操作の種類 (type):
+      assignment: pattern_id のシフトを割り当てる (pattern_id がなければ消す)
+      fixed: pattern_id の固定シフトにする (pattern_id がなければ固定シフトを消す)
+      other: activity_name のその他の業務を割り当てる (activity_name がなければ消す)
+      designated_holiday: 指定休日にする
+      paid_leave: 有給休暇にする
+      clear_paid_leave: 有給休暇を消す
+    従業員の所有者の確認は1クエリで行い、削除はモデルごとに IN で絞り込むため、クエリ数はセル数に依存しない。
+    """
+    cells = parse_cell_operations(operations)
+
+    member_departments = dict(
+        Member.objects.filter(id__in={member_id for member_id, _ in cells}, created_by=user)
+        .values_list('id', 'department_id')
+    )
+    if len(member_departments) != len({member_id for member_id, _ in cells}):
+        raise CellOperationError('Invalid member ID included', status_code=403)
+
+    # シフトパターンは従業員と同じ部門のものに限る
+    pattern_cells = {cell: op['pattern_id'] for cell, op in cells.items() if op['type'] in ('assignment', 'fixed') and op['pattern_id']}
+    if pattern_cells:
+        pattern_departments = dict(
+            ShiftPattern.objects.filter(id__in=set(pattern_cells.values())).values_list('id', 'department_id')
+        )
+        for (member_id, _), pattern_id in pattern_cells.items():
+            if pattern_departments.get(pattern_id) != member_departments[member_id]:
+                raise CellOperationError(f'Invalid pattern ID: {pattern_id}')
+
+    created = defaultdict(int)
+    deleted = defaultdict(int)
+    with transaction.atomic(), department_writes():
+        # 既に指定休日のセルは何も変えない
+        holiday_cells = {cell for cell, op in cells.items() if op['type'] == 'designated_holiday'}
+        if holiday_cells:
+            for cell in _cell_ids(DesignatedHoliday, holiday_cells):
+                del cells[cell]
+
+        cleared = defaultdict(set)
+        for cell, op in cells.items():
+            for model in CLEARED_MODELS[op['type']]:
+                cleared[model].add(cell)
+            if op['type'] == 'fixed' and not op['pattern_id']:
+                cleared[FixedAssignment].add(cell)
+        for model, model_cells in cleared.items():
+            row_ids = [row_id for ids in _cell_ids(model, model_cells).values() for row_id in ids]
+            if row_ids:
+                model.objects.filter(id__in=row_ids).delete()
+                deleted[CELL_MODELS[model][0]] += len(row_ids)
+
+        # 固定シフトは既存の行のパターンを更新し (update_or_create と同じ)、ない場合だけ作成する
+        fixed_cells = {cell: op['pattern_id'] for cell, op in cells.items() if op['type'] == 'fixed' and op['pattern_id']}
+        existing_fixed = _cell_ids(FixedAssignment, fixed_cells) if fixed_cells else {}
+        if existing_fixed:
+            # 固定シフトは (従業員, 日付) が一意のため、セルごとに1行
+            updated = [
+                FixedAssignment(
+                    id=fixed_id, member_id=member_id, department_id=member_departments[member_id], shift_date=day,
+                    shift_pattern_id=fixed_cells[member_id, day], created_by=user
+                )
+                for (member_id, day), (fixed_id,) in existing_fixed.items()
+            ]
+            FixedAssignment.objects.bulk_update(updated, ['shift_pattern', 'created_by'])
+            for fixed in updated:
+                record_cell_change(fixed.department_id, 'fixed_assignments', 'delete', fixed.id, fixed.member_id, fixed.shift_date)
+                record_cell_change(fixed.department_id, 'fixed_assignments', 'insert', fixed.id, fixed.member_id, fixed.shift_date)
+
+        # 有給休暇は既にあれば残す (get_or_create と同じ)
+        leave_cells = {cell for cell, op in cells.items() if op['type'] == 'paid_leave'}
+        existing_leaves = _cell_ids(PaidLeave, leave_cells) if leave_cells else {}
+
+        new_rows = defaultdict(list)
+        for (member_id, day), op in cells.items():
+            # 部門は所有者の確認で取得済みのため、bulk_create で問い合わせないよう設定しておく
+            cell = {'member_id': member_id, 'department_id': member_departments[member_id], 'created_by': user}
+            row = None
+            if op['type'] == 'assignment' and op['pattern_id']:
+                row = Assignment(**cell, shift_pattern_id=op['pattern_id'], shift_date=day)
+            elif op['type'] == 'other' and op['activity_name']:
+                row = OtherAssignment(**cell, shift_date=day, activity_name=op['activity_name'])
+            elif op['type'] == 'fixed' and op['pattern_id'] and (member_id, day) not in existing_fixed:
+                row = FixedAssignment(**cell, shift_pattern_id=op['pattern_id'], shift_date=day)
+            elif op['type'] == 'designated_holiday':
+                row = DesignatedHoliday(**cell, date=day)
+            elif op['type'] == 'paid_leave' and (member_id, day) not in existing_leaves:
+                row = PaidLeave(**cell, date=day)
+            if row is not None:
+                new_rows[type(row)].append(row)
+
+        for model, rows in new_rows.items():
+            model.objects.bulk_create(rows)
+            created[CELL_MODELS[model][0]] += len(rows)
+            record_bulk_created(rows)
+
+    return {'created': dict(created), 'deleted': dict(deleted)}
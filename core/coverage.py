@@ -0,0 +1,76 @@
+from datetime import timedelta
+
+import numpy as np
+
+SLOT_MINUTES = 30
+
+
+class SlotCoverage:
+    """
+    シフトパターン × 時間帯の被覆行列。
+    行はシフトパターン、列は勤務日の0時から数えた時間帯 (2日分) で、
+    夜勤のように日付をまたぐパターンは翌日側の列が True になる。
+    時間帯は slot_minutes 単位のグリッドで、開始時刻がグリッドからずれているパターンは直前の時間帯に丸める。
+    """
+    def __init__(self, patterns, start_date, end_date, slot_minutes=SLOT_MINUTES):
+        self.start_date = start_date
+        self.num_days = (end_date - start_date).days + 1
+        self.slot_minutes = slot_minutes
+        self.slots_per_day = 24 * 60 // slot_minutes
+
+        patterns = list(patterns)
+        self.pattern_index = {p.id: i for i, p in enumerate(patterns)}
+        self.matrix = np.zeros((len(patterns), 2 * self.slots_per_day), dtype=bool)
+        for i, p in enumerate(patterns):
+            start_minutes = p.start_time.hour * 60 + p.start_time.minute
+            end_minutes = p.end_time.hour * 60 + p.end_time.minute
+            if p.end_time < p.start_time:
+                end_minutes += 24 * 60
+            first_slot = start_minutes // slot_minutes
+            num_slots = max(end_minutes - start_minutes, 0) // slot_minutes
+            self.matrix[i, first_slot:first_slot + num_slots] = True
+
+    def _absolute_slots(self, dates, pattern_ids):
+        """(日付, パターン) の組ごとに、期間の先頭から数えた時間帯番号を返す。戻り値は (組の番号, 時間帯番号)"""
+        day_offsets = np.fromiter(((d - self.start_date).days for d in dates), dtype=np.int64, count=len(dates))
+        rows = np.fromiter((self.pattern_index[pid] for pid in pattern_ids), dtype=np.int64, count=len(pattern_ids))
+        entry_idx, slot_idx = np.nonzero(self.matrix[rows])
+        absolute = day_offsets[entry_idx] * self.slots_per_day + slot_idx
+        in_period = (absolute >= 0) & (absolute < self.num_days * self.slots_per_day)
+        return entry_idx[in_period], absolute[in_period]
+
+    def slot_key(self, absolute_slot):
+        """時間帯番号を (日付, 0時からの経過分) に変換する"""
+        day_offset, slot = divmod(int(absolute_slot), self.slots_per_day)
+        return self.start_date + timedelta(days=day_offset), slot * self.slot_minutes
+
+    def counts(self, entries):
+        """
+        (日付, pattern_id) の組から時間帯ごとの人数を数える。
+        戻り値は shape (日数, 1日の時間帯数) の配列。
+        """
+        entries = list(entries)
+        counts = np.zeros(self.num_days * self.slots_per_day, dtype=np.int64)
+        if entries:
+            dates, pattern_ids = zip(*entries)
+            _, absolute = self._absolute_slots(dates, pattern_ids)
+            np.add.at(counts, absolute, 1)
+        return counts.reshape(self.num_days, self.slots_per_day)
+
+    def group(self, entries):
+        """
+        (日付, pattern_id, 任意の値) の組を時間帯ごとにまとめる。
+        戻り値は {(日付, 0時からの経過分): [値, ...]}。
+        """
+        entries = list(entries)
+        if not entries:
+            return {}
+        dates, pattern_ids, payloads = zip(*entries)
+        entry_idx, absolute = self._absolute_slots(dates, pattern_ids)
+        order = np.argsort(absolute, kind='stable')
+        entry_idx, absolute = entry_idx[order], absolute[order]
+        slots, first_positions = np.unique(absolute, return_index=True)
+        grouped = {}
+        for slot, members in zip(slots, np.split(entry_idx, first_positions[1:])):
+            grouped[self.slot_key(slot)] = [payloads[i] for i in members]
+        return grouped
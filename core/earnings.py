@@ -0,0 +1,67 @@
+from collections import defaultdict
+from functools import lru_cache
+
+from django.db.models import Count, Sum
+
+# 深夜割増の時間帯 (22:00〜翌5:00) と割増率
+NIGHT_PREMIUM_START_MINUTES = 22 * 60
+NIGHT_PREMIUM_END_MINUTES = 5 * 60
+NIGHT_PREMIUM_RATE = 1.25
+
+
+@lru_cache(maxsize=None)
+def pattern_minutes(start_time, end_time, break_minutes):
+    """
+    シフトパターンの (通常の勤務分数, 深夜割増の分数) を返す。
+    深夜割増の分数は休憩を含む拘束時間のうち 22:00〜翌5:00 にかかる分数で、休憩は通常の勤務分数から差し引く。
+    """
+    start = start_time.hour * 60 + start_time.minute
+    end = end_time.hour * 60 + end_time.minute
+    if end_time < start_time:
+        end += 24 * 60
+
+    premium_minutes = 0
+    # 勤務は最大で翌日にまたがるため、前日・当日・翌日の深夜帯との重なりを数える
+    for day_offset in (-24 * 60, 0, 24 * 60):
+        premium_start = NIGHT_PREMIUM_START_MINUTES + day_offset
+        premium_end = NIGHT_PREMIUM_END_MINUTES + 24 * 60 + day_offset
+        premium_minutes += max(0, min(end, premium_end) - max(start, premium_start))
+
+    work_minutes = end - start - break_minutes
+    return work_minutes - premium_minutes, premium_minutes
+
+
+def shift_earnings(start_time, end_time, break_minutes, hourly_wage):
+    """時給 hourly_wage の従業員がシフトパターン1回の勤務で得る給与 (円, 小数を含む)"""
+    normal_minutes, premium_minutes = pattern_minutes(start_time, end_time, break_minutes)
+    return (normal_minutes * hourly_wage + premium_minutes * hourly_wage * NIGHT_PREMIUM_RATE) / 60
+
+
+def period_earnings(assignments, paid_leaves):
+    """
+    Assignment と PaidLeave のクエリセットから、時給制の従業員ごとの給与見込み (円) を返す。
+    シフトは (従業員, シフトパターン) ごとの件数、有給は従業員ごとの時間数を1回の集計クエリで取得する。
+    """
+    earnings_map = defaultdict(float)
+    shift_counts = (
+        assignments.filter(member__employee_type='hourly', member__hourly_wage__gt=0)
+        .values_list(
+            'member_id', 'member__hourly_wage',
+            'shift_pattern__start_time', 'shift_pattern__end_time', 'shift_pattern__break_minutes'
+        )
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    for member_id, hourly_wage, start_time, end_time, break_minutes, count in shift_counts:
+        earnings_map[member_id] += count * shift_earnings(start_time, end_time, break_minutes, hourly_wage)
+
+    paid_leave_hours = (
+        paid_leaves.filter(member__employee_type='hourly', member__hourly_wage__gt=0)
+        .values_list('member_id', 'member__hourly_wage')
+        .annotate(hours=Sum('hours'))
+        .order_by()
+    )
+    for member_id, hourly_wage, hours in paid_leave_hours:
+        earnings_map[member_id] += hours * hourly_wage
+
+    return {member_id: round(total) for member_id, total in earnings_map.items()}
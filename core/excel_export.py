@@ -0,0 +1,196 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import NamedStyle, PatternFill, Alignment, Font, Border, Side
+from openpyxl.utils import get_column_letter
+
+from .models import Member, Assignment, OtherAssignment, PaidLeave, DesignatedHoliday, LeaveRequest
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+ZIP_CONTENT_TYPE = 'application/zip'
+
+# Excel のシート名の制限
+INVALID_SHEET_TITLE_CHARS = set('[]:*?/\\')
+MAX_SHEET_TITLE_LENGTH = 31
+
+_thin = Side(style='thin')
+_border = Border(left=_thin, right=_thin, top=_thin, bottom=_thin)
+_center = Alignment(horizontal='center', vertical='center')
+_fills = {
+    5: PatternFill(start_color="ADD8E6", end_color="ADD8E6", fill_type="solid"),  # 土曜日
+    6: PatternFill(start_color="FFC0CB", end_color="FFC0CB", fill_type="solid"),  # 日曜日
+}
+
+
+def _named_styles():
+    """シフト表で使うセルの書式。{(見出しか, 曜日の番号 (土日以外は None)): NamedStyle}"""
+    styles = {}
+    for is_header in (True, False):
+        for weekday in (None, 5, 6):
+            name = f"shift_{'header' if is_header else 'cell'}_{weekday or 'weekday'}"
+            style = NamedStyle(name=name, border=_border, alignment=_center)
+            if is_header:
+                style.font = Font(bold=True)
+            if weekday is not None:
+                style.fill = _fills[weekday]
+            styles[is_header, weekday] = style
+    return styles
+
+
+def sheet_title(start_date):
+    return f"{start_date.strftime('%Y年%m月')} シフト表"
+
+
+def export_filename(start_date, extension='xlsx'):
+    return f'shift_schedule_{start_date.strftime("%Y%m")}.{extension}'
+
+
+def batch_export_filename(start_date, end_date, layout):
+    extension = 'zip' if layout == 'zip' else 'xlsx'
+    return f'shift_schedule_{start_date.strftime("%Y%m")}-{end_date.strftime("%Y%m")}.{extension}'
+
+
+def _safe_name(department_name):
+    """部門名から Excel のシート名やファイル名に使えない文字を _ に置き換える"""
+    return ''.join('_' if c in INVALID_SHEET_TITLE_CHARS else c for c in department_name)
+
+
+def department_workbook_filename(department_id, department_name, start_date, end_date):
+    """一括エクスポート (zip) に含める部門ごとのブックのファイル名"""
+    return f'{department_id}_{_safe_name(department_name)}_{start_date.strftime("%Y%m")}-{end_date.strftime("%Y%m")}.xlsx'
+
+
+def batch_sheet_title(department_name, month_start):
+    """部門名と月からシート名を作る (Excel のシート名に使えない文字を除き、31文字以内にする)"""
+    name = _safe_name(department_name)
+    suffix = f" {month_start.strftime('%Y年%m月')}"
+    return name[:MAX_SHEET_TITLE_LENGTH - len(suffix)] + suffix
+
+
+def month_ranges(start_date, end_date):
+    """期間を月ごとの (開始日, 終了日) に分ける (最初と最後の月は期間で切り詰める)"""
+    ranges = []
+    month_start = start_date
+    while month_start <= end_date:
+        next_month = (month_start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        month_end = min(end_date, next_month - timedelta(days=1))
+        ranges.append((month_start, month_end))
+        month_start = next_month
+    return ranges
+
+
+# シフト表の各日の表示のもとになるデータ: (モデル, 日付のフィールド, 表示にするフィールド, 固定の表示, 絞り込み)
+# 後のものほど優先する (シフトパターン名 < その他の業務名 < 有 (有給) < / (指定休日) < ❌ (希望休))
+SHIFT_LABEL_SOURCES = (
+    (Assignment, 'shift_date', 'shift_pattern__pattern_name', None, {}),
+    (OtherAssignment, 'shift_date', 'activity_name', None, {}),
+    (PaidLeave, 'date', None, '有', {}),
+    (DesignatedHoliday, 'date', None, '/', {}),
+    (LeaveRequest, 'leave_date', None, '❌', {'status': 'approved'}),
+)
+# 何もない日の表示
+EMPTY_LABEL = '/'
+
+
+def shift_label_rows(user, department_ids, start_date, end_date, *order_by):
+    """
+    SHIFT_LABEL_SOURCES の順に、各データの (従業員ID, 日付, 表示) を返すクエリセットのリストを返す。
+    固定の表示のデータは (従業員ID, 日付) だけを返す。order_by を指定した場合は、その順 (同じ従業員内は日付順) に並べる。
+    """
+    querysets = []
+    for model, date_field, label_field, _, filters in SHIFT_LABEL_SOURCES:
+        queryset = model.objects.filter(
+            created_by=user, department_id__in=department_ids,
+            **{f'{date_field}__range': [start_date, end_date]}, **filters
+        )
+        if order_by:
+            queryset = queryset.order_by(*order_by, date_field)
+        querysets.append(queryset.values_list('member_id', date_field, *([label_field] if label_field else [])))
+    return querysets
+
+
+def shift_tables(user, department_ids, start_date, end_date):
+    """
+    エクスポートするシフト表を部門ごとに {部門ID: (日付のリスト, [(従業員名, [各日の表示]), ...])} で返す。
+    表示は SHIFT_LABEL_SOURCES の順に上書きし、何もない日は / にする。
+    部門の数に関係なく、データの種類ごとに1クエリで全部門分を取得する。
+    """
+    dates = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+    members = Member.objects.filter(created_by=user, department_id__in=department_ids).order_by('sort_order', 'name')
+
+    shift_data = defaultdict(dict)
+    label_rows = shift_label_rows(user, department_ids, start_date, end_date)
+    for rows, (_, _, _, fixed_label, _) in zip(label_rows, SHIFT_LABEL_SOURCES):
+        for member_id, day, *label in rows:
+            shift_data[day][member_id] = label[0] if label else fixed_label
+
+    tables = {int(department_id): (dates, []) for department_id in department_ids}
+    for member_id, department_id, name in members.values_list('id', 'department_id', 'name'):
+        tables[department_id][1].append((name, [shift_data[d].get(member_id, EMPTY_LABEL) for d in dates]))
+    return tables
+
+
+def shift_table(user, department_id, start_date, end_date):
+    """1部門のシフト表を (日付のリスト, 行) で返す"""
+    return shift_tables(user, [department_id], start_date, end_date)[int(department_id)]
+
+
+def month_sheets(department_name, dates, rows):
+    """shift_tables() の1部門分の表を、月ごとのシート (シート名, 日付のリスト, 行) に分ける"""
+    sheets = []
+    offset = 0
+    for month_start, month_end in month_ranges(dates[0], dates[-1]):
+        days = (month_end - month_start).days + 1
+        sheets.append((
+            batch_sheet_title(department_name, month_start),
+            dates[offset:offset + days],
+            [(name, values[offset:offset + days]) for name, values in rows],
+        ))
+        offset += days
+    return sheets
+
+
+def _column_widths(header, rows):
+    """列幅を事前に計算する (従業員名の列は広め、日付の列は文字数に合わせて狭め)"""
+    lengths = [len(str(value)) for value in header]
+    for name, values in rows:
+        lengths[0] = max(lengths[0], len(str(name)))
+        for i, value in enumerate(values, start=1):
+            lengths[i] = max(lengths[i], len(str(value)))
+    return [lengths[0] + 5] + [length * 1.2 + 2 for length in lengths[1:]]
+
+
+def write_shift_workbook(file, sheets):
+    """
+    sheets の各 (シート名, 日付のリスト, 行) を1シートずつ、書き込み専用モードのブックとして file に保存する。
+    行は書き込んだそばからディスク上の一時ファイルに出力されるため、表の大きさに比例してメモリを使わない。
+    書式は名前付きスタイルを1回だけ登録し、列幅は書き込む前に計算しておく。
+    """
+    wb = Workbook(write_only=True)
+    styles = _named_styles()
+    for style in styles.values():
+        wb.add_named_style(style)
+
+    for title, dates, rows in sheets:
+        ws = wb.create_sheet(title=title)
+        header = ['従業員名'] + [d.strftime('%d日(%a)') for d in dates]
+        for i, width in enumerate(_column_widths(header, rows), start=1):
+            ws.column_dimensions[get_column_letter(i)].width = width
+
+        weekdays = [None] + [d.weekday() if d.weekday() in _fills else None for d in dates]
+
+        def styled_row(values, is_header):
+            cells = []
+            for value, weekday in zip(values, weekdays):
+                cell = WriteOnlyCell(ws, value=value)
+                cell.style = styles[is_header, weekday].name
+                cells.append(cell)
+            return cells
+
+        ws.append(styled_row(header, True))
+        for name, values in rows:
+            ws.append(styled_row([name, *values], False))
+
+    wb.save(file)
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+import zipfile
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+from .excel_export import (
+    department_workbook_filename, month_sheets, sheet_title, shift_table, shift_tables, write_shift_workbook
+)
+from .jobs import write_workbook_files
+from .models import Department
+
+# 出力するファイルの形式 (書式や列) を変更したときは値を上げ、古いキャッシュを使わないようにする
+EXPORT_CACHE_VERSION = 1
+
+
+def export_key(user_id, department_id, start_date, end_date, version):
+    """
+    出力ファイルのキャッシュのキー (SHA-256) を返す。
+    部門データの版数を含むため、セルや従業員が変わると別のキーになる。
+    出力するデータは作成者で絞り込むため、作成者もキーに含める。
+    """
+    key = [EXPORT_CACHE_VERSION, user_id, int(department_id), start_date.isoformat(), end_date.isoformat(), version]
+    return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+
+def batch_export_key(user_id, department_versions, start_date, end_date, layout):
+    """一括エクスポートのキャッシュのキー。department_versions は [(部門ID, 版数), ...]"""
+    key = [EXPORT_CACHE_VERSION, user_id, sorted(department_versions), start_date.isoformat(), end_date.isoformat(), layout]
+    return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+
+def _cache_path(cache_key, layout='single'):
+    return Path(settings.EXPORT_CACHE_DIR) / f"{cache_key}.{'zip' if layout == 'zip' else 'xlsx'}"
+
+
+def get_cached_export(cache_key, layout='single'):
+    """キャッシュ済みのファイルのパスを返す (なければ None)。使ったファイルは更新日時を新しくする"""
+    path = _cache_path(cache_key, layout)
+    try:
+        # 更新日時を最終利用日時として、容量超過時に古いものから削除する
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+@contextmanager
+def _cache_file(path):
+    """キャッシュに保存するファイルを書き込む。書き込み途中のファイルを他のリクエストに返さないよう、一時ファイルに書いてから置き換える"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=path.parent, suffix='.tmp', delete=False) as file:
+        try:
+            yield file
+        except BaseException:
+            os.unlink(file.name)
+            raise
+    os.replace(file.name, path)
+    evict_export_cache()
+
+
+def build_export(user, department_id, start_date, end_date, cache_key):
+    """シフト表の Excel ファイルを作成してキャッシュに保存し、そのパスを返す"""
+    path = _cache_path(cache_key)
+    dates, rows = shift_table(user, department_id, start_date, end_date)
+    with _cache_file(path) as file:
+        write_shift_workbook(file, [(sheet_title(start_date), dates, rows)])
+    return path
+
+
+def build_batch_export(user, department_ids, start_date, end_date, layout, cache_key):
+    """
+    複数部門・複数月のシフト表を作成してキャッシュに保存し、そのパスを返す。
+    layout が workbook の場合は部門×月ごとのシートを持つ1つのブック、zip の場合は部門ごとのブック (シートは月ごと) の zip。
+    データは全部門分をまとめて取得し、zip の部門ごとのブックはワーカープロセスで並列に書き出す。
+    """
+    path = _cache_path(cache_key, layout)
+    departments = list(
+        Department.objects.filter(id__in=department_ids, created_by=user).order_by('name').values_list('id', 'name')
+    )
+    tables = shift_tables(user, [department_id for department_id, _ in departments], start_date, end_date)
+    sheets = {department_id: month_sheets(name, *tables[department_id]) for department_id, name in departments}
+
+    with _cache_file(path) as file:
+        if layout != 'zip':
+            write_shift_workbook(file, [sheet for department_id, _ in departments for sheet in sheets[department_id]])
+            return path
+
+        with tempfile.TemporaryDirectory() as work_dir:
+            files = {
+                Path(work_dir) / department_workbook_filename(department_id, name, start_date, end_date): sheets[department_id]
+                for department_id, name in departments
+            }
+            write_workbook_files(files)
+            # xlsx は既に圧縮されているため、zip では圧縮しない
+            with zipfile.ZipFile(file, 'w', zipfile.ZIP_STORED) as archive:
+                for workbook_path in files:
+                    archive.write(workbook_path, workbook_path.name)
+    return path
+
+
+def evict_export_cache():
+    """有効期間を過ぎたファイルを削除し、合計サイズが上限を超える分は最終利用日時の古いものから削除する"""
+    cache_dir = Path(settings.EXPORT_CACHE_DIR)
+    expires_before = time.time() - settings.EXPORT_CACHE_TTL_SECONDS
+    files = []
+    for path in cache_dir.glob('*'):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        if stat.st_mtime < expires_before:
+            path.unlink(missing_ok=True)
+        elif path.suffix in ('.xlsx', '.zip'):
+            files.append((stat.st_mtime, stat.st_size, path))
+
+    total_size = 0
+    for _, size, path in sorted(files, reverse=True):
+        total_size += size
+        if total_size > settings.EXPORT_CACHE_MAX_BYTES:
+            path.unlink(missing_ok=True)
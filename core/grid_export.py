@@ -0,0 +1,114 @@
+import csv
+import json
+import tempfile
+from datetime import timedelta
+
+from .earnings import period_earnings
+from .excel_export import EMPTY_LABEL, SHIFT_LABEL_SOURCES, shift_label_rows
+from .models import Member, Assignment, PaidLeave
+
+CSV_CONTENT_TYPE = 'text/csv; charset=utf-8'
+JSONL_CONTENT_TYPE = 'application/x-ndjson'
+PARQUET_CONTENT_TYPE = 'application/vnd.apache.parquet'
+
+# 従業員の並び順 (同じ順で各データを並べ、従業員ごとにマージする)
+MEMBER_ORDER = ('sort_order', 'name', 'id')
+# Parquet の1つの行グループに入れる従業員数
+PARQUET_ROW_GROUP_SIZE = 1000
+
+
+def grid_columns(start_date, end_date):
+    """(日付のリスト, 列名のリスト) を返す。列は従業員ID・従業員名・給与見込み・各日の表示"""
+    dates = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+    return dates, ['member_id', 'member_name', 'earnings', *(d.isoformat() for d in dates)]
+
+
+def iter_shift_grid(user, department_id, start_date, end_date):
+    """
+    従業員×日付の表を、1従業員ずつ [従業員ID, 従業員名, 給与見込み, 各日の表示...] で返すジェネレーター。
+    各日の表示は Excel のエクスポートと同じ優先順位で決める。
+    データは種類ごとに従業員の並び順・日付順のイテレーターで読み、従業員ごとにマージするため、
+    セルの数に比例してメモリを使わない。給与見込みは月給制などで計算しない従業員は None。
+    """
+    dates, _ = grid_columns(start_date, end_date)
+    date_index = {d: i for i, d in enumerate(dates)}
+    members = list(
+        Member.objects.filter(created_by=user, department_id=department_id).order_by(*MEMBER_ORDER).values_list('id', 'name')
+    )
+    member_ids = {member_id for member_id, _ in members}
+    earnings = period_earnings(
+        Assignment.objects.filter(created_by=user, department_id=department_id, shift_date__range=[start_date, end_date]),
+        PaidLeave.objects.filter(created_by=user, department_id=department_id, date__range=[start_date, end_date]),
+    )
+
+    order_by = [f'member__{field}' for field in MEMBER_ORDER]
+    sources = [
+        (iter(rows.iterator()), fixed_label)
+        for rows, (_, _, _, fixed_label, _) in zip(
+            shift_label_rows(user, [department_id], start_date, end_date, *order_by), SHIFT_LABEL_SOURCES
+        )
+    ]
+    heads = [next(rows, None) for rows, _ in sources]
+
+    for member_id, name in members:
+        labels = [EMPTY_LABEL] * len(dates)
+        for i, (rows, fixed_label) in enumerate(sources):
+            row = heads[i]
+            # 従業員の一覧にない従業員 (他のユーザーが作成した従業員など) の行は読み飛ばす
+            while row is not None and (row[0] == member_id or row[0] not in member_ids):
+                if row[0] == member_id:
+                    labels[date_index[row[1]]] = row[2] if len(row) > 2 else fixed_label
+                row = next(rows, None)
+            heads[i] = row
+        yield [member_id, name, earnings.get(member_id), *labels]
+
+
+class _Echo:
+    """csv.writer の書き込み先。書き込んだ行をそのまま返す"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(start_date, end_date, grid_rows):
+    """表を CSV の行 (bytes) として1行ずつ返す"""
+    writer = csv.writer(_Echo())
+    _, columns = grid_columns(start_date, end_date)
+    yield writer.writerow(columns).encode()
+    for row in grid_rows:
+        yield writer.writerow(row).encode()
+
+
+def iter_jsonl(start_date, end_date, grid_rows):
+    """表を JSON Lines (1従業員1行の {列名: 値}) として1行ずつ返す"""
+    _, columns = grid_columns(start_date, end_date)
+    for row in grid_rows:
+        yield (json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n').encode()
+
+
+def write_parquet(start_date, end_date, grid_rows):
+    """
+    表を Parquet 形式で一時ファイルに書き出し、先頭に戻したファイルを返す。
+    Parquet はファイルの最後にメタデータを書くため、PARQUET_ROW_GROUP_SIZE 人ずつ行グループとして書き出す。
+    pyarrow がインストールされていない場合は ImportError になる。
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    _, columns = grid_columns(start_date, end_date)
+    schema = pa.schema(
+        [('member_id', pa.int64()), ('member_name', pa.string()), ('earnings', pa.int64())]
+        + [(column, pa.string()) for column in columns[3:]]
+    )
+    file = tempfile.TemporaryFile()
+    with pq.ParquetWriter(file, schema) as writer:
+        batch = []
+        for row in grid_rows:
+            batch.append(row)
+            if len(batch) >= PARQUET_ROW_GROUP_SIZE:
+                writer.write_table(pa.Table.from_pylist([dict(zip(columns, r)) for r in batch], schema=schema))
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist([dict(zip(columns, r)) for r in batch], schema=schema))
+    file.seek(0)
+    return file
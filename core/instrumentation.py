@@ -0,0 +1,118 @@
+import json
+import logging
+from datetime import date
+from time import monotonic
+
+from django.db import connection
+
+from .models import SolveRun
+
+logger = logging.getLogger(__name__)
+
+# CP-SAT の応答から記録する統計値 (num_booleans / num_integers は前処理後のモデルの大きさ)
+SOLVER_STAT_FIELDS = (
+    'num_booleans', 'num_integers', 'num_fixed_booleans', 'num_conflicts', 'num_branches',
+    'num_restarts', 'num_lp_iterations', 'wall_time', 'user_time', 'deterministic_time',
+)
+
+
+class SolveRunRecorder:
+    """
+    generate_schedule のフェーズごとの経過時間とクエリ数を計測するコンテキストマネージャ。
+    終了時に計測結果をログに出力し、SolveRun として保存する。
+    クエリ数は呼び出し元のスレッドの接続だけを数える。探索中に SolveMonitor の監視スレッドが
+    進捗の保存などで発行したクエリは、solve フェーズの monitor_queries に別に記録する。
+    """
+    def __init__(self, department_id, start_date_str, end_date_str, is_repair=False):
+        self.department_id = department_id
+        self.start_date = date.fromisoformat(start_date_str)
+        self.end_date = date.fromisoformat(end_date_str)
+        self.is_repair = is_repair
+        self.status = None
+        self.model_size = {}
+        self.solve_result = {}
+        self.phases = {}
+        self._query_count = 0
+        self._monitor_queries = None
+        self._phase = None
+
+    def __enter__(self):
+        self._query_wrapper = connection.execute_wrapper(self._count_query)
+        self._query_wrapper.__enter__()
+        self._started = monotonic()
+        self.phase('load')
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._end_phase()
+        self._query_wrapper.__exit__(exc_type, exc, tb)
+        if exc_type is not None:
+            self.status = 'ERROR'
+        # 計測は補助的な情報のため、記録の失敗で生成結果や元の例外を失わないようログに残すだけにする
+        try:
+            self._save(monotonic() - self._started)
+        except Exception:
+            logger.exception('generate_schedule の実行記録を保存できませんでした')
+        return False
+
+    def _count_query(self, execute, sql, params, many, context):
+        self._query_count += 1
+        return execute(sql, params, many, context)
+
+    def _end_phase(self):
+        if self._phase is None:
+            return
+        self.phases[self._phase] = {
+            'seconds': round(monotonic() - self._phase_started, 3),
+            'queries': self._query_count - self._phase_queries,
+        }
+        self._phase = None
+
+    def phase(self, name):
+        """現在のフェーズを終了し、次のフェーズの計測を開始する"""
+        self._end_phase()
+        self._phase = name
+        self._phase_started = monotonic()
+        self._phase_queries = self._query_count
+
+    def record_model(self, model):
+        proto = model.Proto()
+        self.model_size = {'num_variables': len(proto.variables), 'num_constraints': len(proto.constraints)}
+
+    def record_solve(self, solver, status):
+        self.status = solver.StatusName(status)
+        response = solver.ResponseProto()
+        self.solve_result = {'solver_stats': {field: getattr(response, field) for field in SOLVER_STAT_FIELDS}}
+        if response.solution:
+            objective = solver.ObjectiveValue()
+            bound = solver.BestObjectiveBound()
+            self.solve_result.update({
+                'objective_value': objective,
+                'best_bound': bound,
+                'gap': abs(bound - objective) / max(1.0, abs(objective)),
+            })
+
+    def record_monitor(self, monitor):
+        """SolveMonitor の監視スレッドが発行したクエリ数を記録する"""
+        self._monitor_queries = monitor.query_count
+
+    def record_cached(self):
+        self.status = 'CACHED'
+
+    def _save(self, total_seconds):
+        if self._monitor_queries is not None and 'solve' in self.phases:
+            self.phases['solve']['monitor_queries'] = self._monitor_queries
+        record = {
+            'department_id': self.department_id,
+            'start_date': self.start_date,
+            'end_date': self.end_date,
+            'status': self.status or 'UNKNOWN',
+            'is_repair': self.is_repair,
+            'total_seconds': round(total_seconds, 3),
+            'total_queries': self._query_count,
+            'phases': self.phases,
+            **self.model_size,
+            **self.solve_result,
+        }
+        logger.info('generate_schedule %s', json.dumps(record, default=str, ensure_ascii=False))
+        SolveRun.objects.create(**record)
@@ -0,0 +1,184 @@
+import multiprocessing
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+# Webワーカーごとに1つだけ作成するプロセスプール
+_executor = None
+# Excel エクスポートのジョブは I/O が中心のため、プロセスではなくスレッドで実行する
+_export_executor = None
+# 一括エクスポートのブックを並列に書き出すプロセスプール
+_workbook_executor = None
+
+
+def _init_worker():
+    """spawn された子プロセスで Django を初期化する"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    import django
+    django.setup()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.SOLVER_JOB_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+        )
+    return _executor
+
+
+def fail_stale_jobs(model, timeout_seconds, **filters):
+    """
+    待機中のまま登録から、または実行中のまま開始から timeout_seconds を過ぎたジョブを失敗にし、その件数を返す。
+    プールはWebワーカーのプロセス内にあるため、Webワーカーの再起動やワーカープロセスの異常終了で
+    ジョブが失われると状態が更新されない。クライアントが永久にポーリングしないよう、状態を読むときに呼ぶ。
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=timeout_seconds)
+    return model.objects.filter(
+        Q(status='queued', created_at__lt=cutoff) | Q(status='running', started_at__lt=cutoff), **filters
+    ).update(status='failed', error_message='Job timed out: the worker running it may have stopped', finished_at=now)
+
+
+def enqueue_solver_job(job):
+    """ジョブをプロセスプールに投入する。SOLVER_JOB_WORKERS が 0 の場合はその場で実行する"""
+    if settings.SOLVER_JOB_WORKERS <= 0:
+        run_solver_job(job.id)
+        return
+    get_executor().submit(run_solver_job, job.id)
+
+
+def run_solver_job(job_id):
+    """ワーカープロセス内でシフト生成を実行し、結果をジョブに保存する"""
+    # 子プロセスではこの関数の読み込みが django.setup() より先に行われるため、モデルはここで import する
+    from .models import SolverJob
+    from .serializers import AssignmentSerializer
+    from .solver import generate_schedule, save_generated_assignments
+
+    close_old_connections()
+    # 他のワーカーが既に取得したジョブは実行しない
+    claimed = SolverJob.objects.filter(id=job_id, status='queued').update(
+        status='running', started_at=timezone.now()
+    )
+    if not claimed:
+        return
+
+    job = SolverJob.objects.select_related('created_by').get(id=job_id)
+    progress = []
+
+    def on_progress(events):
+        progress.extend(events)
+        SolverJob.objects.filter(id=job_id).update(progress=progress)
+
+    def should_stop():
+        return SolverJob.objects.filter(id=job_id, stop_requested=True).exists()
+
+    try:
+        result = generate_schedule(
+            job.department_id, job.start_date.isoformat(), job.end_date.isoformat(),
+            on_progress=on_progress, should_stop=should_stop
+        )
+        if result.get('success'):
+            new_assignments = save_generated_assignments(
+                job.department_id, job.start_date, job.end_date, result.get('assignments', []), job.created_by
+            )
+            result = {
+                'success': True,
+                'infeasible_days': result.get('infeasible_days', {}),
+                'assignments': AssignmentSerializer(new_assignments, many=True).data,
+                'warm_started': result.get('warm_started', False),
+                'changed_cells': result.get('changed_cells', 0),
+                'cached': result.get('cached', False),
+            }
+        job.status = 'succeeded'
+        job.result = result
+    except Exception:
+        job.status = 'failed'
+        job.error_message = traceback.format_exc()
+    job.finished_at = timezone.now()
+    job.progress = progress
+    job.save(update_fields=['status', 'result', 'error_message', 'progress', 'finished_at'])
+    close_old_connections()
+
+
+def get_export_executor():
+    global _export_executor
+    if _export_executor is None:
+        _export_executor = ThreadPoolExecutor(max_workers=settings.EXPORT_JOB_WORKERS, thread_name_prefix='export')
+    return _export_executor
+
+
+def enqueue_export_job(job):
+    """エクスポートジョブをスレッドプールに投入する。EXPORT_JOB_WORKERS が 0 の場合はその場で実行する"""
+    if settings.EXPORT_JOB_WORKERS <= 0:
+        run_export_job(job.id)
+        return
+    get_export_executor().submit(run_export_job, job.id)
+
+
+def get_workbook_executor():
+    global _workbook_executor
+    if _workbook_executor is None:
+        _workbook_executor = ProcessPoolExecutor(
+            max_workers=settings.EXPORT_WORKBOOK_PROCESSES,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+        )
+    return _workbook_executor
+
+
+def write_workbook_file(path, sheets):
+    """ワーカープロセス内で Excel ファイルを1つ書き出す"""
+    from .excel_export import write_shift_workbook
+    write_shift_workbook(path, sheets)
+
+
+def write_workbook_files(files):
+    """
+    {パス: シートのリスト} の各ファイルをワーカープロセスで並列に書き出す。
+    EXPORT_WORKBOOK_PROCESSES が 0 の場合やファイルが1つの場合は、このプロセスで順に書き出す。
+    """
+    if settings.EXPORT_WORKBOOK_PROCESSES <= 0 or len(files) <= 1:
+        for path, sheets in files.items():
+            write_workbook_file(path, sheets)
+        return
+    futures = [get_workbook_executor().submit(write_workbook_file, str(path), sheets) for path, sheets in files.items()]
+    for future in futures:
+        future.result()
+
+
+def run_export_job(job_id):
+    """Excel ファイルを作成してキャッシュに保存し、ジョブの状態を更新する"""
+    from .export_cache import build_batch_export, build_export, get_cached_export
+    from .models import ExportJob
+
+    claimed = ExportJob.objects.filter(id=job_id, status='queued').update(
+        status='running', started_at=timezone.now()
+    )
+    if not claimed:
+        return
+
+    job = ExportJob.objects.select_related('created_by').get(id=job_id)
+    try:
+        # 同じキーのジョブが先に完了していれば、そのファイルを使う
+        if get_cached_export(job.cache_key, job.layout):
+            job.cached = True
+        elif job.department_id:
+            build_export(job.created_by, job.department_id, job.start_date, job.end_date, job.cache_key)
+        else:
+            build_batch_export(job.created_by, job.department_ids, job.start_date, job.end_date, job.layout, job.cache_key)
+        job.status = 'succeeded'
+    except Exception:
+        job.status = 'failed'
+        job.error_message = traceback.format_exc()
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'cached', 'error_message', 'finished_at'])
+    close_old_connections()
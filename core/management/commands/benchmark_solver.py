@@ -0,0 +1,101 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from core.benchmark import BENCHMARK_MEMBER_COUNTS, BENCHMARK_DAY_COUNTS, case_name, run_benchmark_case
+
+DEFAULT_BASELINE = Path(__file__).resolve().parents[2] / 'benchmark_baseline.json'
+# ベースラインと比べる前に一致を確認する実行条件
+CONDITION_KEYS = ('time_limit', 'workers')
+
+
+class Command(BaseCommand):
+    help = (
+        '乱数シードから作成した部門データで generate_schedule を実行し、'
+        'モデル構築時間・求解時間・目的関数値・人数不足をベースラインと比較します。'
+        'データはテスト用データベース (SQLite の場合はメモリ上) に作成され、終了時に破棄されます。'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, nargs='+', default=list(BENCHMARK_MEMBER_COUNTS), help='従業員数 (複数指定可)')
+        parser.add_argument('--days', type=int, nargs='+', default=list(BENCHMARK_DAY_COUNTS), help='日数 (複数指定可)')
+        parser.add_argument('--seed', type=int, default=0, help='データ生成とソルバーの乱数シード')
+        # ベースラインはこの条件で記録している (条件が異なる結果は比較しない)
+        parser.add_argument('--time-limit', type=float, default=300.0, help='1ケースあたりの探索時間の上限(秒)')
+        parser.add_argument('--workers', type=int, default=1, help='探索ワーカー数')
+        parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE, help='比較するベースラインのJSONファイル')
+        parser.add_argument('--save-baseline', action='store_true', help='今回の結果でベースラインを上書きする')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='時間の悪化をリグレッションとみなす割合 (例: 0.2 = 20%%)')
+        parser.add_argument('--fail-on-regression', action='store_true', help='リグレッションがあれば異常終了する')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = {}
+            for num_members in options['members']:
+                for num_days in options['days']:
+                    name = case_name(num_members, num_days)
+                    self.stdout.write(f'{name} を実行中...')
+                    # ケースごとにデータをロールバックし、他のケースのデータが影響しないようにする
+                    with transaction.atomic():
+                        results[name] = run_benchmark_case(
+                            num_members, num_days, options['seed'], options['time_limit'], options['workers']
+                        )
+                        transaction.set_rollback(True)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        baseline = {}
+        if options['baseline'].exists():
+            baseline = json.loads(options['baseline'].read_text())
+        regressions = self.report(results, baseline, options['tolerance'])
+
+        if options['save_baseline']:
+            baseline.update(results)
+            options['baseline'].write_text(json.dumps(baseline, indent=2, ensure_ascii=False, sort_keys=True) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'ベースラインを保存しました: {options["baseline"]}'))
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f'リグレッションがあります: {", ".join(regressions)}')
+
+    def report(self, results, baseline, tolerance):
+        """結果の表を出力し、ベースラインより悪化したケース名のリストを返す"""
+        self.stdout.write(
+            f'{"ケース":<8} {"状態":<10} {"変数":>8} {"制約":>8} {"構築(秒)":>10} {"求解(秒)":>10} {"目的関数値":>18} {"不足":>6}  ベースライン比'
+        )
+        regressions = []
+        for name, result in results.items():
+            base = baseline.get(name)
+            notes = []
+            if base and any(base.get(key) != result[key] for key in CONDITION_KEYS):
+                # 探索時間やワーカー数が異なる結果は比べられない
+                notes.append('実行条件が異なる (' + ', '.join(f'{key}={base.get(key)}' for key in CONDITION_KEYS) + ')')
+            elif base:
+                for key in ('build_seconds', 'solve_seconds'):
+                    if base.get(key) and result[key] is not None:
+                        ratio = result[key] / base[key] - 1
+                        notes.append(f'{key.split("_")[0]} {ratio:+.0%}')
+                        if ratio > tolerance:
+                            regressions.append(f'{name} {key}')
+                if base.get('objective') is not None and result['objective'] is not None:
+                    notes.append(f'objective {result["objective"] - base["objective"]:+.0f}')
+                    if result['objective'] < base['objective']:
+                        regressions.append(f'{name} objective')
+                if base.get('shortfall') is not None and result['shortfall'] is not None:
+                    notes.append(f'shortfall {result["shortfall"] - base["shortfall"]:+d}')
+                    if result['shortfall'] > base['shortfall']:
+                        regressions.append(f'{name} shortfall')
+            else:
+                notes.append('ベースラインなし')
+
+            objective = '-' if result['objective'] is None else f'{result["objective"]:.0f}'
+            shortfall = '-' if result['shortfall'] is None else result['shortfall']
+            self.stdout.write(
+                f'{name:<8} {result["status"]:<10} {result["num_variables"] or 0:>8} {result["num_constraints"] or 0:>8} '
+                f'{result["build_seconds"]:>10.2f} {result["solve_seconds"] or 0:>10.2f} {objective:>18} {shortfall:>6}  {", ".join(notes)}'
+            )
+        return regressions
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_solverjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='solversettings',
+            name='linearization_level',
+            field=models.IntegerField(default=1, help_text='0〜2。大きいほど緩和が強くなります', verbose_name='線形化レベル'),
+        ),
+        migrations.AddField(
+            model_name='solversettings',
+            name='max_time_in_seconds',
+            field=models.FloatField(default=150.0, verbose_name='探索時間の上限(秒)'),
+        ),
+        migrations.AddField(
+            model_name='solversettings',
+            name='no_improvement_timeout',
+            field=models.FloatField(default=0.0, help_text='解が改善しないままこの秒数が経過したら終了。0の場合は無効', verbose_name='改善停止時の打ち切り時間(秒)'),
+        ),
+        migrations.AddField(
+            model_name='solversettings',
+            name='num_search_workers',
+            field=models.IntegerField(default=0, help_text='0の場合はCPUコア数に合わせて自動設定', verbose_name='探索ワーカー数'),
+        ),
+        migrations.AddField(
+            model_name='solversettings',
+            name='random_seed',
+            field=models.IntegerField(default=0, help_text='同じ値なら同じ条件で同じ探索を行います', verbose_name='乱数シード'),
+        ),
+        migrations.AddField(
+            model_name='solversettings',
+            name='relative_gap_limit',
+            field=models.FloatField(default=0.0, help_text='例: 0.01 の場合、最適値との差が1%以内になった時点で終了', verbose_name='許容する相対ギャップ'),
+        ),
+    ]
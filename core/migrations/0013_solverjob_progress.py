@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_solversettings_engine_parameters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='solverjob',
+            name='progress',
+            field=models.JSONField(blank=True, default=list, help_text='改善解ごとの目的関数値・上界・経過時間', verbose_name='進捗'),
+        ),
+        migrations.AddField(
+            model_name='solverjob',
+            name='stop_requested',
+            field=models.BooleanField(default=False, verbose_name='打ち切り要求'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_solverjob_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SolveResultCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=64, unique=True, verbose_name='入力ハッシュ')),
+                ('start_date', models.DateField(verbose_name='開始日')),
+                ('end_date', models.DateField(verbose_name='終了日')),
+                ('result', models.JSONField(verbose_name='生成結果')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='登録日時')),
+                ('last_used_at', models.DateTimeField(auto_now_add=True, verbose_name='最終利用日時')),
+                ('department', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.department', verbose_name='部門')),
+            ],
+            options={
+                'verbose_name': 'シフト生成結果キャッシュ',
+                'verbose_name_plural': '18. シフト生成結果キャッシュ',
+            },
+        ),
+    ]
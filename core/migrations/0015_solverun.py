@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_solveresultcache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SolveRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField(verbose_name='開始日')),
+                ('end_date', models.DateField(verbose_name='終了日')),
+                ('status', models.CharField(help_text='CP-SAT の終了状態。キャッシュから返した場合は CACHED、例外の場合は ERROR', max_length=20, verbose_name='結果')),
+                ('is_repair', models.BooleanField(default=False, verbose_name='修復モード')),
+                ('num_variables', models.IntegerField(blank=True, null=True, verbose_name='変数の数')),
+                ('num_constraints', models.IntegerField(blank=True, null=True, verbose_name='制約の数')),
+                ('objective_value', models.FloatField(blank=True, null=True, verbose_name='目的関数値')),
+                ('best_bound', models.FloatField(blank=True, null=True, verbose_name='上界')),
+                ('gap', models.FloatField(blank=True, null=True, verbose_name='相対ギャップ')),
+                ('total_seconds', models.FloatField(verbose_name='所要時間(秒)')),
+                ('total_queries', models.IntegerField(verbose_name='クエリ数')),
+                ('phases', models.JSONField(default=dict, help_text='フェーズ名ごとの経過時間(秒)とクエリ数', verbose_name='フェーズ別の計測')),
+                ('solver_stats', models.JSONField(blank=True, default=dict, help_text='前処理後の変数の数・競合数・分岐数など', verbose_name='ソルバー統計')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='実行日時')),
+                ('department', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.department', verbose_name='部門')),
+            ],
+            options={
+                'verbose_name': 'シフト生成の実行記録',
+                'verbose_name_plural': '19. シフト生成の実行記録',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
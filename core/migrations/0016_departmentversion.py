@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_department_versions(apps, schema_editor):
+    Department = apps.get_model('core', 'Department')
+    DepartmentVersion = apps.get_model('core', 'DepartmentVersion')
+    DepartmentVersion.objects.bulk_create(
+        [DepartmentVersion(department_id=department_id) for department_id in Department.objects.values_list('id', flat=True)]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_solverun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DepartmentVersion',
+            fields=[
+                ('department', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='version', serialize=False, to='core.department', verbose_name='部門')),
+                ('version', models.PositiveBigIntegerField(default=1, help_text='部門のデータが変更されるたびに増える', verbose_name='版数')),
+            ],
+            options={
+                'verbose_name': '部門データの版数',
+                'verbose_name_plural': '20. 部門データの版数',
+            },
+        ),
+        migrations.RunPython(create_department_versions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_departmentversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(help_text='変更後の部門データの版数', verbose_name='版数')),
+                ('kind', models.CharField(choices=[('assignments', 'シフト'), ('fixed_assignments', '固定シフト'), ('other_assignments', 'その他の業務'), ('paid_leaves', '有給休暇'), ('designated_holidays', '指定休日'), ('leave_requests', '希望休')], max_length=20, verbose_name='種類')),
+                ('action', models.CharField(choices=[('insert', '追加'), ('delete', '削除')], max_length=10, verbose_name='操作')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='対象ID')),
+                ('member_id', models.PositiveBigIntegerField(verbose_name='従業員ID')),
+                ('date', models.DateField(verbose_name='日付')),
+                ('department', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedule_changes', to='core.department', verbose_name='部門')),
+            ],
+            options={
+                'verbose_name': 'シフト表の変更履歴',
+                'verbose_name_plural': '21. シフト表の変更履歴',
+                'indexes': [models.Index(fields=['department', 'version'], name='core_schedu_departm_c13dd1_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_schedulechange'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField(verbose_name='開始日')),
+                ('end_date', models.DateField(verbose_name='終了日')),
+                ('version', models.PositiveBigIntegerField(help_text='登録時の部門データの版数', verbose_name='版数')),
+                ('cache_key', models.CharField(help_text='出力ファイルのキャッシュのキー (部門・期間・版数・作成者から計算)', max_length=64, verbose_name='キャッシュキー')),
+                ('status', models.CharField(choices=[('queued', '待機中'), ('running', '実行中'), ('succeeded', '完了'), ('failed', '失敗')], default='queued', max_length=20, verbose_name='状態')),
+                ('cached', models.BooleanField(default=False, help_text='作成済みのファイルをそのまま使った場合に True', verbose_name='キャッシュ使用')),
+                ('error_message', models.TextField(blank=True, default='', verbose_name='エラー内容')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='登録日時')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='開始日時')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='終了日時')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='作成者')),
+                ('department', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.department', verbose_name='部門')),
+            ],
+            options={
+                'verbose_name': 'Excelエクスポートジョブ',
+                'verbose_name_plural': '22. Excelエクスポートジョブ',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
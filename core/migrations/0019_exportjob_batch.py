@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='department_ids',
+            field=models.JSONField(blank=True, default=list, help_text='一括エクスポートの対象の部門', verbose_name='部門IDのリスト'),
+        ),
+        migrations.AddField(
+            model_name='exportjob',
+            name='layout',
+            field=models.CharField(choices=[('single', '1部門'), ('workbook', '1つのブック (部門・月ごとのシート)'), ('zip', '部門ごとのブックの zip')], default='single', max_length=20, verbose_name='出力形式'),
+        ),
+        migrations.AlterField(
+            model_name='exportjob',
+            name='department',
+            field=models.ForeignKey(blank=True, help_text='1部門のエクスポートの場合の部門', null=True, on_delete=django.db.models.deletion.CASCADE, to='core.department', verbose_name='部門'),
+        ),
+        migrations.AlterField(
+            model_name='exportjob',
+            name='version',
+            field=models.PositiveBigIntegerField(blank=True, help_text='登録時の部門データの版数 (1部門のエクスポートの場合)', null=True, verbose_name='版数'),
+        ),
+    ]
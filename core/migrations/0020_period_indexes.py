@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_exportjob_batch'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(fields=['member', 'shift_date'], name='core_assign_member__6f5610_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(fields=['created_by', 'shift_date'], name='core_assign_created_fe3cea_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='designatedholiday',
+            index=models.Index(fields=['created_by', 'date'], name='core_design_created_890c17_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fixedassignment',
+            index=models.Index(fields=['created_by', 'shift_date'], name='core_fixeda_created_ae4586_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaverequest',
+            index=models.Index(fields=['member', 'leave_date'], name='core_leaver_member__41241f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaverequest',
+            index=models.Index(fields=['created_by', 'leave_date'], name='core_leaver_created_8426d5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='otherassignment',
+            index=models.Index(fields=['created_by', 'shift_date'], name='core_othera_created_d785f4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paidleave',
+            index=models.Index(fields=['created_by', 'date'], name='core_paidle_created_c84b3f_idx'),
+        ),
+    ]
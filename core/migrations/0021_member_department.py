@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+# 従業員の部門を複製する日ごとのデータのモデル
+MEMBER_DEPARTMENT_MODELS = (
+    'Assignment', 'DesignatedHoliday', 'FixedAssignment', 'LeaveRequest', 'OtherAssignment', 'PaidLeave'
+)
+
+
+def copy_member_departments(apps, schema_editor):
+    """既存の行に従業員の部門を設定する (モデルごとに1回の UPDATE)"""
+    Member = apps.get_model('core', 'Member')
+    member_department = Subquery(Member.objects.filter(id=OuterRef('member_id')).values('department_id')[:1])
+    for model_name in MEMBER_DEPARTMENT_MODELS:
+        apps.get_model('core', model_name).objects.update(department_id=member_department)
+
+
+class Migration(migrations.Migration):
+    """
+    日ごとのデータに部門の列を追加して既存の行を埋める。
+    NOT NULL にするのは、埋めた後の 0022 で行う (PostgreSQL では同じトランザクション内で更新した表を ALTER できないため)。
+    """
+
+    dependencies = [
+        ('core', '0020_period_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignment',
+            name='department',
+            field=models.ForeignKey(db_index=False, editable=False, help_text='従業員の所属部門 (保存時に自動で設定)', null=True, on_delete=django.db.models.deletion.CASCADE, to='core.department', verbose_name='部門'),
+        ),
+        migrations.AddField(
+            model_name='designatedholiday',
+            name='department',
+            field=models.ForeignKey(db_index=False, editable=False, help_text='従業員の所属部門 (保存時に自動で設定)', null=True, on_delete=django.db.models.deletion.CASCADE, to='core.department', verbose_name='部門'),
+        ),
+        migrations.AddField(
+            model_name='fixedassignment',
+            name='department',
+            field=models.ForeignKey(db_index=False, editable=False, help_text='従業員の所属部門 (保存時に自動で設定)', null=True, on_delete=django.db.models.deletion.CASCADE, to='core.department', verbose_name='部門'),
+        ),
+        migrations.AddField(
+            model_name='leaverequest',
+            name='department',
+            field=models.ForeignKey(db_index=False, editable=False, help_text='従業員の所属部門 (保存時に自動で設定)', null=True, on_delete=django.db.models.deletion.CASCADE, to='core.department', verbose_name='部門'),
+        ),
+        migrations.AddField(
+            model_name='otherassignment',
+            name='department',
+            field=models.ForeignKey(db_index=False, editable=False, help_text='従業員の所属部門 (保存時に自動で設定)', null=True, on_delete=django.db.models.deletion.CASCADE, to='core.department', verbose_name='部門'),
+        ),
+        migrations.AddField(
+            model_name='paidleave',
+            name='department',
+            field=models.ForeignKey(db_index=False, editable=False, help_text='従業員の所属部門 (保存時に自動で設定)', null=True, on_delete=django.db.models.deletion.CASCADE, to='core.department', verbose_name='部門'),
+        ),
+        migrations.RunPython(copy_member_departments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_member_department'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='assignment',
+            name='department',
+            field=models.ForeignKey(db_index=False, editable=False, help_text='従業員の所属部門 (保存時に自動で設定)', on_delete=django.db.models.deletion.CASCADE, to='core.department', verbose_name='部門'),
+        ),
+        migrations.AlterField(
+            model_name='designatedholiday',
+            name='department',
+            field=models.ForeignKey(db_index=False, editable=False, help_text='従業員の所属部門 (保存時に自動で設定)', on_delete=django.db.models.deletion.CASCADE, to='core.department', verbose_name='部門'),
+        ),
+        migrations.AlterField(
+            model_name='fixedassignment',
+            name='department',
+            field=models.ForeignKey(db_index=False, editable=False, help_text='従業員の所属部門 (保存時に自動で設定)', on_delete=django.db.models.deletion.CASCADE, to='core.department', verbose_name='部門'),
+        ),
+        migrations.AlterField(
+            model_name='leaverequest',
+            name='department',
+            field=models.ForeignKey(db_index=False, editable=False, help_text='従業員の所属部門 (保存時に自動で設定)', on_delete=django.db.models.deletion.CASCADE, to='core.department', verbose_name='部門'),
+        ),
+        migrations.AlterField(
+            model_name='otherassignment',
+            name='department',
+            field=models.ForeignKey(db_index=False, editable=False, help_text='従業員の所属部門 (保存時に自動で設定)', on_delete=django.db.models.deletion.CASCADE, to='core.department', verbose_name='部門'),
+        ),
+        migrations.AlterField(
+            model_name='paidleave',
+            name='department',
+            field=models.ForeignKey(db_index=False, editable=False, help_text='従業員の所属部門 (保存時に自動で設定)', on_delete=django.db.models.deletion.CASCADE, to='core.department', verbose_name='部門'),
+        ),
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(fields=['department', 'shift_date'], name='core_assign_departm_d735ea_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='designatedholiday',
+            index=models.Index(fields=['department', 'date'], name='core_design_departm_8a1ba6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fixedassignment',
+            index=models.Index(fields=['department', 'shift_date'], name='core_fixeda_departm_d4c24d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaverequest',
+            index=models.Index(fields=['department', 'leave_date'], name='core_leaver_departm_955f26_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='otherassignment',
+            index=models.Index(fields=['department', 'shift_date'], name='core_othera_departm_4ad9f7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paidleave',
+            index=models.Index(fields=['department', 'date'], name='core_paidle_departm_a7d15e_idx'),
+        ),
+    ]
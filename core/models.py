@@ -85,6 +85,22 @@ class Member(models.Model):
     def __str__(self):
         return f"{self.department.name} - {self.name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 保存時に部門が変わったかどうかを判定するため、読み込んだ時点の部門を覚えておく
+        instance._loaded_department_id = dict(zip(field_names, values)).get('department_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # 部門を移った場合は、日ごとのデータに複製している部門も移す
+        loaded_department_id = getattr(self, '_loaded_department_id', None)
+        if loaded_department_id is not None and loaded_department_id != self.department_id:
+            for model in MemberDepartmentModel.__subclasses__():
+                model.objects.filter(member_id=self.pk).update(department_id=self.department_id)
+        self._loaded_department_id = self.department_id
+
 class ShiftPattern(models.Model):
     department = models.ForeignKey(Department, on_delete=models.CASCADE, verbose_name="部門")
     pattern_name = models.CharField("パターン名", max_length=100)
@@ -167,7 +183,58 @@ class MemberAvailability(models.Model):
         if self.is_sunday: days.append('日')
         return f"{self.member.name} - ({','.join(days)}) {self.start_time.strftime('%H:%M')} - {self.end_time.strftime('%H:%M')}"
 
-class LeaveRequest(models.Model):
+class MemberDepartmentQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        """bulk_create は save() を呼ばないため、部門が未設定の行は従業員の部門をまとめて取得して設定する"""
+        objs = list(objs)
+        member_ids = set()
+        for obj in objs:
+            if obj.department_id is None:
+                if type(obj).member.is_cached(obj):
+                    obj.department_id = obj.member.department_id
+                else:
+                    member_ids.add(obj.member_id)
+        if member_ids:
+            departments = dict(Member.objects.filter(id__in=member_ids).values_list('id', 'department_id'))
+            for obj in objs:
+                if obj.department_id is None:
+                    obj.department_id = departments.get(obj.member_id)
+        return super().bulk_create(objs, *args, **kwargs)
+
+
+class MemberDepartmentModel(models.Model):
+    """
+    従業員の部門を department に複製して持つ日ごとのデータ。
+    部門・期間での絞り込みを Member と結合せずに (部門, 日付) のインデックスで行うために使う。
+    department は save() と bulk_create() で従業員の部門から設定し、従業員が部門を移ったときは Member.save() で移す。
+    """
+    department = models.ForeignKey(
+        Department, on_delete=models.CASCADE, editable=False, db_index=False, verbose_name="部門",
+        help_text="従業員の所属部門 (保存時に自動で設定)"
+    )
+
+    objects = MemberDepartmentQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 更新を変更履歴に記録するとき、変更前のセル (部門・従業員・日付) の削除として残すため、読み込んだ時点の値を覚えておく
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        if type(self).member.is_cached(self):
+            self.department_id = self.member.department_id
+        else:
+            self.department_id = Member.objects.filter(id=self.member_id).values_list('department_id', flat=True).first()
+        super().save(*args, **kwargs)
+        self._loaded_values = {field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields}
+
+
+class LeaveRequest(MemberDepartmentModel):
     STATUS_CHOICES = [('approved', '承認'), ('pending', '申請中')]
     member = models.ForeignKey(Member, on_delete=models.CASCADE, verbose_name="従業員")
     leave_date = models.DateField("希望休の日付")
@@ -177,6 +244,11 @@ class LeaveRequest(models.Model):
     class Meta:
         verbose_name = "希望休"
         verbose_name_plural = "11. 希望休"
+        indexes = [
+            models.Index(fields=['department', 'leave_date']),
+            models.Index(fields=['member', 'leave_date']),
+            models.Index(fields=['created_by', 'leave_date']),
+        ]
 
     def __str__(self):
         return f"{self.member.name} - {self.leave_date}"
@@ -206,7 +278,7 @@ class GroupMember(models.Model):
     def __str__(self):
         return f"{self.group.group_name} - {self.member.name}"
 
-class Assignment(models.Model):
+class Assignment(MemberDepartmentModel):
     member = models.ForeignKey(Member, on_delete=models.CASCADE, verbose_name="従業員")
     shift_pattern = models.ForeignKey(ShiftPattern, on_delete=models.CASCADE, verbose_name="シフトパターン")
     shift_date = models.DateField("勤務日")
@@ -215,11 +287,16 @@ class Assignment(models.Model):
     class Meta:
         verbose_name = "確定シフト"
         verbose_name_plural = "16. 確定シフト"
+        indexes = [
+            models.Index(fields=['department', 'shift_date']),
+            models.Index(fields=['member', 'shift_date']),
+            models.Index(fields=['created_by', 'shift_date']),
+        ]
 
     def __str__(self):
         return f"{self.shift_date} {self.member.name} ({self.shift_pattern.pattern_name})"
 
-class OtherAssignment(models.Model):
+class OtherAssignment(MemberDepartmentModel):
     member = models.ForeignKey(Member, on_delete=models.CASCADE, verbose_name="従業員")
     shift_date = models.DateField("勤務日")
     activity_name = models.CharField("業務内容", max_length=100)
@@ -229,6 +306,10 @@ class OtherAssignment(models.Model):
         verbose_name = "その他の割り当て"
         verbose_name_plural = "14. その他の割り当て"
         unique_together = ('member', 'shift_date')
+        indexes = [
+            models.Index(fields=['department', 'shift_date']),
+            models.Index(fields=['created_by', 'shift_date']),
+        ]
 
     def __str__(self):
         return f"{self.shift_date} {self.member.name}: {self.activity_name}"
@@ -237,7 +318,7 @@ class OtherAssignment(models.Model):
 
 
 
-class FixedAssignment(models.Model):
+class FixedAssignment(MemberDepartmentModel):
     member = models.ForeignKey(Member, on_delete=models.CASCADE, verbose_name="従業員")
     shift_pattern = models.ForeignKey(ShiftPattern, on_delete=models.CASCADE, verbose_name="シフトパターン")
     shift_date = models.DateField("勤務日")
@@ -247,12 +328,16 @@ class FixedAssignment(models.Model):
         verbose_name = "固定シフト"
         verbose_name_plural = "13. 固定シフト"
         unique_together = ('member', 'shift_date')
+        indexes = [
+            models.Index(fields=['department', 'shift_date']),
+            models.Index(fields=['created_by', 'shift_date']),
+        ]
 
     def __str__(self):
         return f"{self.shift_date} {self.member.name} ({self.shift_pattern.pattern_name})"
 
 
-class DesignatedHoliday(models.Model):
+class DesignatedHoliday(MemberDepartmentModel):
     member = models.ForeignKey(Member, on_delete=models.CASCADE, verbose_name="従業員")
     date = models.DateField("日付")
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="作成者")
@@ -261,12 +346,16 @@ class DesignatedHoliday(models.Model):
         verbose_name = "指定休日"
         verbose_name_plural = "15. 指定休日"
         unique_together = ('member', 'date')
+        indexes = [
+            models.Index(fields=['department', 'date']),
+            models.Index(fields=['created_by', 'date']),
+        ]
 
     def __str__(self):
         return f"{self.member.name} - {self.date}"
 
 
-class PaidLeave(models.Model):
+class PaidLeave(MemberDepartmentModel):
     member = models.ForeignKey('Member', on_delete=models.CASCADE, verbose_name="従業員")
     date = models.DateField("日付")
     hours = models.IntegerField("時間数", default=8, help_text="有給としてカウントされる時間数")
@@ -276,6 +365,10 @@ class PaidLeave(models.Model):
         verbose_name = "有給"
         verbose_name_plural = "12. 有給"
         unique_together = ('member', 'date')
+        indexes = [
+            models.Index(fields=['department', 'date']),
+            models.Index(fields=['created_by', 'date']),
+        ]
 
     def __str__(self):
         return f"{self.member.name} - {self.date} (有給)"
@@ -337,6 +430,14 @@ class SolverSettings(models.Model):
     shift_preference_bonus = models.IntegerField("シフト希望ボーナス", default=100)
     unavailable_day_penalty = models.IntegerField("勤務不可曜日ペナルティ", default=70000)
 
+    # ソルバーエンジンのパラメータ
+    max_time_in_seconds = models.FloatField("探索時間の上限(秒)", default=150.0)
+    num_search_workers = models.IntegerField("探索ワーカー数", default=0, help_text="0の場合はCPUコア数に合わせて自動設定")
+    relative_gap_limit = models.FloatField("許容する相対ギャップ", default=0.0, help_text="例: 0.01 の場合、最適値との差が1%以内になった時点で終了")
+    no_improvement_timeout = models.FloatField("改善停止時の打ち切り時間(秒)", default=0.0, help_text="解が改善しないままこの秒数が経過したら終了。0の場合は無効")
+    random_seed = models.IntegerField("乱数シード", default=0, help_text="同じ値なら同じ条件で同じ探索を行います")
+    linearization_level = models.IntegerField("線形化レベル", default=1, help_text="0〜2。大きいほど緩和が強くなります")
+
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="作成者")
 
     class Meta:
@@ -345,3 +446,156 @@ class SolverSettings(models.Model):
 
     def __str__(self):
         return f"{self.department.name} のソルバー設定"
+
+
+class SolverJob(models.Model):
+    STATUS_CHOICES = [
+        ('queued', '待機中'),
+        ('running', '実行中'),
+        ('succeeded', '完了'),
+        ('failed', '失敗'),
+    ]
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, verbose_name="部門")
+    start_date = models.DateField("開始日")
+    end_date = models.DateField("終了日")
+    status = models.CharField("状態", max_length=20, choices=STATUS_CHOICES, default='queued')
+    result = models.JSONField("生成結果", null=True, blank=True)
+    error_message = models.TextField("エラー内容", blank=True, default='')
+    progress = models.JSONField("進捗", default=list, blank=True, help_text="改善解ごとの目的関数値・上界・経過時間")
+    stop_requested = models.BooleanField("打ち切り要求", default=False)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="作成者")
+    created_at = models.DateTimeField("登録日時", auto_now_add=True)
+    started_at = models.DateTimeField("開始日時", null=True, blank=True)
+    finished_at = models.DateTimeField("終了日時", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "シフト生成ジョブ"
+        verbose_name_plural = "17. シフト生成ジョブ"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.department.name} {self.start_date}〜{self.end_date} ({self.get_status_display()})"
+
+
+class SolveResultCache(models.Model):
+    fingerprint = models.CharField("入力ハッシュ", max_length=64, unique=True)
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, verbose_name="部門")
+    start_date = models.DateField("開始日")
+    end_date = models.DateField("終了日")
+    result = models.JSONField("生成結果")
+    created_at = models.DateTimeField("登録日時", auto_now_add=True)
+    last_used_at = models.DateTimeField("最終利用日時", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "シフト生成結果キャッシュ"
+        verbose_name_plural = "18. シフト生成結果キャッシュ"
+
+    def __str__(self):
+        return f"{self.department.name} {self.start_date}〜{self.end_date} ({self.fingerprint[:12]})"
+
+
+class SolveRun(models.Model):
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, verbose_name="部門")
+    start_date = models.DateField("開始日")
+    end_date = models.DateField("終了日")
+    status = models.CharField("結果", max_length=20, help_text="CP-SAT の終了状態。キャッシュから返した場合は CACHED、例外の場合は ERROR")
+    is_repair = models.BooleanField("修復モード", default=False)
+    num_variables = models.IntegerField("変数の数", null=True, blank=True)
+    num_constraints = models.IntegerField("制約の数", null=True, blank=True)
+    objective_value = models.FloatField("目的関数値", null=True, blank=True)
+    best_bound = models.FloatField("上界", null=True, blank=True)
+    gap = models.FloatField("相対ギャップ", null=True, blank=True)
+    total_seconds = models.FloatField("所要時間(秒)")
+    total_queries = models.IntegerField("クエリ数")
+    phases = models.JSONField("フェーズ別の計測", default=dict, help_text="フェーズ名ごとの経過時間(秒)とクエリ数")
+    solver_stats = models.JSONField("ソルバー統計", default=dict, blank=True, help_text="前処理後の変数の数・競合数・分岐数など")
+    created_at = models.DateTimeField("実行日時", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "シフト生成の実行記録"
+        verbose_name_plural = "19. シフト生成の実行記録"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.department.name} {self.start_date}〜{self.end_date} {self.status} ({self.total_seconds:.1f}秒)"
+
+
+class DepartmentVersion(models.Model):
+    department = models.OneToOneField(Department, on_delete=models.CASCADE, primary_key=True, related_name='version', verbose_name="部門")
+    version = models.PositiveBigIntegerField("版数", default=1, help_text="部門のデータが変更されるたびに増える")
+
+    class Meta:
+        verbose_name = "部門データの版数"
+        verbose_name_plural = "20. 部門データの版数"
+
+    def __str__(self):
+        return f"{self.department.name} v{self.version}"
+
+
+class ScheduleChange(models.Model):
+    """シフト表のセルの追加・削除の履歴。/schedule-data/changes/ の差分同期に使う"""
+    KIND_CHOICES = [
+        ('assignments', 'シフト'),
+        ('fixed_assignments', '固定シフト'),
+        ('other_assignments', 'その他の業務'),
+        ('paid_leaves', '有給休暇'),
+        ('designated_holidays', '指定休日'),
+        ('leave_requests', '希望休'),
+    ]
+    ACTION_CHOICES = [
+        ('insert', '追加'),
+        ('delete', '削除'),
+    ]
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, related_name='schedule_changes', verbose_name="部門")
+    version = models.PositiveBigIntegerField("版数", help_text="変更後の部門データの版数")
+    kind = models.CharField("種類", max_length=20, choices=KIND_CHOICES)
+    action = models.CharField("操作", max_length=10, choices=ACTION_CHOICES)
+    object_id = models.PositiveBigIntegerField("対象ID")
+    # 従業員が削除された後も履歴を残すため、外部キーにはしない
+    member_id = models.PositiveBigIntegerField("従業員ID")
+    date = models.DateField("日付")
+
+    class Meta:
+        verbose_name = "シフト表の変更履歴"
+        verbose_name_plural = "21. シフト表の変更履歴"
+        indexes = [models.Index(fields=['department', 'version'])]
+
+    def __str__(self):
+        return f"{self.department_id} v{self.version} {self.kind} {self.action} {self.object_id}"
+
+
+class ExportJob(models.Model):
+    STATUS_CHOICES = [
+        ('queued', '待機中'),
+        ('running', '実行中'),
+        ('succeeded', '完了'),
+        ('failed', '失敗'),
+    ]
+    LAYOUT_CHOICES = [
+        ('single', '1部門'),
+        ('workbook', '1つのブック (部門・月ごとのシート)'),
+        ('zip', '部門ごとのブックの zip'),
+    ]
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, null=True, blank=True, verbose_name="部門", help_text="1部門のエクスポートの場合の部門")
+    department_ids = models.JSONField("部門IDのリスト", default=list, blank=True, help_text="一括エクスポートの対象の部門")
+    layout = models.CharField("出力形式", max_length=20, choices=LAYOUT_CHOICES, default='single')
+    start_date = models.DateField("開始日")
+    end_date = models.DateField("終了日")
+    version = models.PositiveBigIntegerField("版数", null=True, blank=True, help_text="登録時の部門データの版数 (1部門のエクスポートの場合)")
+    cache_key = models.CharField("キャッシュキー", max_length=64, help_text="出力ファイルのキャッシュのキー (部門・期間・版数・作成者から計算)")
+    status = models.CharField("状態", max_length=20, choices=STATUS_CHOICES, default='queued')
+    cached = models.BooleanField("キャッシュ使用", default=False, help_text="作成済みのファイルをそのまま使った場合に True")
+    error_message = models.TextField("エラー内容", blank=True, default='')
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="作成者")
+    created_at = models.DateTimeField("登録日時", auto_now_add=True)
+    started_at = models.DateTimeField("開始日時", null=True, blank=True)
+    finished_at = models.DateTimeField("終了日時", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Excelエクスポートジョブ"
+        verbose_name_plural = "22. Excelエクスポートジョブ"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        target = self.department.name if self.department_id else f"{len(self.department_ids)}部門"
+        return f"{target} {self.start_date}〜{self.end_date} ({self.get_status_display()})"
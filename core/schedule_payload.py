@@ -0,0 +1,212 @@
+from collections import defaultdict
+
+from .earnings import period_earnings
+from .models import (
+    DepartmentVersion, ScheduleChange, Member, Assignment, LeaveRequest, MemberAvailability, OtherAssignment, FixedAssignment,
+    DesignatedHoliday, PaidLeave
+)
+from .serializers import (
+    MemberSerializer, MemberAvailabilitySerializer, OtherAssignmentSerializer, DesignatedHolidaySerializer,
+    PaidLeaveSerializer
+)
+
+
+# AssignmentSerializer / FixedAssignmentSerializer の fields と同じ順序
+SHIFT_ROW_FIELDS = ('id', 'shift_date', 'member_name', 'shift_pattern_name', 'member_id', 'shift_pattern')
+
+
+def _shift_rows(queryset):
+    """Assignment / FixedAssignment を AssignmentSerializer と同じキー・同じ順序の辞書で返す (1クエリ)"""
+    rows = queryset.values_list(
+        'id', 'shift_date', 'member__name', 'shift_pattern__pattern_name', 'member_id', 'shift_pattern'
+    )
+    return [
+        dict(zip(SHIFT_ROW_FIELDS, (row_id, shift_date.isoformat(), *rest)))
+        for row_id, shift_date, *rest in rows
+    ]
+
+
+def _members(user, department_id):
+    members = (
+        Member.objects.filter(created_by=user)
+        .order_by('sort_order', 'name')
+        .prefetch_related('membershiftpatternpreference_set')
+    )
+    if department_id:
+        members = members.filter(department_id=department_id)
+    return members
+
+
+def _period_querysets(user, department_id, start_date, end_date):
+    """期間内の各データのクエリセットを返す (ログインユーザーが作成したものに限る)"""
+    def period_rows(model, date_field='shift_date'):
+        return model.objects.filter(
+            **{f'{date_field}__range': [start_date, end_date]},
+            department_id=department_id,
+            created_by=user
+        )
+
+    return {
+        'assignments': period_rows(Assignment),
+        'fixed_assignments': period_rows(FixedAssignment),
+        'leave_requests': period_rows(LeaveRequest, 'leave_date').filter(status='approved'),
+        'other_assignments': period_rows(OtherAssignment),
+        'designated_holidays': period_rows(DesignatedHoliday, 'date'),
+        'paid_leaves': period_rows(PaidLeave, 'date'),
+        'availabilities': MemberAvailability.objects.filter(member__department_id=department_id, created_by=user),
+    }
+
+
+def _leave_rows(queryset):
+    return [
+        {'leave_date': str(leave_date), 'member_id': member_id}
+        for leave_date, member_id in queryset.values_list('leave_date', 'member_id')
+    ]
+
+
+# セルになるデータの種類ごとに、クエリセットを /schedule-data/ と同じ形の行に変換する関数
+CELL_ROWS = {
+    'assignments': _shift_rows,
+    'fixed_assignments': _shift_rows,
+    'leave_requests': _leave_rows,
+    'other_assignments': lambda queryset: OtherAssignmentSerializer(queryset, many=True).data,
+    'designated_holidays': lambda queryset: DesignatedHolidaySerializer(queryset, many=True).data,
+    'paid_leaves': lambda queryset: PaidLeaveSerializer(queryset, many=True).data,
+}
+
+
+def department_version(department_id):
+    """部門データの現在の版数 (部門がなければ None)"""
+    return DepartmentVersion.objects.filter(department_id=department_id).values_list('version', flat=True).first()
+
+
+def build_schedule_payload(user, department_id, start_date, end_date):
+    """
+    /schedule-data/ のレスポンスを組み立てる。
+    データ量に関係なく一定数のクエリ (期間指定なしは3、期間指定ありは12) で取得する。
+    version はデータより先に読むため、読んでいる間の変更も /schedule-data/changes/ で受け取れる。
+    """
+    version = department_version(department_id)
+    members_data = MemberSerializer(_members(user, department_id), many=True).data
+
+    if not start_date or not end_date:
+        return {
+            'version': version,
+            'members': members_data,
+            'assignments': [], 'leave_requests': [], 'availabilities': [],
+            'other_assignments': [], 'earnings': {},
+            'fixed_assignments': [], 'designated_holidays': [], 'paid_leaves': [],
+        }
+
+    querysets = _period_querysets(user, department_id, start_date, end_date)
+    return {
+        'version': version,
+        **{kind: to_rows(querysets[kind]) for kind, to_rows in CELL_ROWS.items()},
+        'members': members_data,
+        'availabilities': MemberAvailabilitySerializer(querysets['availabilities'], many=True).data,
+        'earnings': period_earnings(querysets['assignments'], querysets['paid_leaves']),
+    }
+
+
+def build_schedule_changes(user, department_id, since, start_date, end_date):
+    """
+    /schedule-data/changes/ のレスポンスを組み立てる。since が現在の版数より新しい場合は None を返す。
+    版数 since より後に追加されたセルは /schedule-data/ と同じ形の現在の行で、削除されたセルは ID・従業員・日付で返す。
+    クライアントは deleted を取り除いてから inserted を (同じ ID の行を置き換えて) 追加する。
+    セル以外の変更 (従業員やシフトパターンなど) を含む場合や、履歴が残っていない場合は reload を true にする。
+    """
+    version = department_version(department_id)
+    if version is None or since > version:
+        return None
+    payload = {'version': version, 'reload': False, 'inserted': {}, 'deleted': {}}
+    if since == version:
+        return payload
+
+    changes = list(
+        ScheduleChange.objects.filter(department_id=department_id, version__gt=since, version__lte=version)
+        .values_list('version', 'kind', 'action', 'object_id', 'member_id', 'date')
+    )
+    # 履歴のない版数は、セル以外の変更か、古くなって削除された履歴
+    if len({change[0] for change in changes}) != version - since:
+        payload['reload'] = True
+        return payload
+
+    inserted_ids = defaultdict(set)
+    deleted = defaultdict(dict)
+    for _, kind, action, object_id, member_id, day in changes:
+        if not start_date <= day <= end_date:
+            continue
+        if action == 'insert':
+            inserted_ids[kind].add(object_id)
+        else:
+            deleted[kind][object_id] = {'id': object_id, 'member_id': member_id, 'date': day.isoformat()}
+
+    querysets = _period_querysets(user, department_id, start_date, end_date)
+    payload['inserted'] = {kind: CELL_ROWS[kind](querysets[kind].filter(id__in=ids)) for kind, ids in inserted_ids.items()}
+    payload['deleted'] = {kind: list(rows.values()) for kind, rows in deleted.items()}
+    # 給与見込みはシフトと有給休暇から計算するため、どちらかが変わった場合だけ返す
+    if {'assignments', 'paid_leaves'} & (inserted_ids.keys() | deleted.keys()):
+        payload['earnings'] = period_earnings(querysets['assignments'], querysets['paid_leaves'])
+    return payload
+
+
+def build_compact_schedule_payload(user, department_id, start_date, end_date):
+    """
+    /schedule-data/ の列形式 (compact) のレスポンスを組み立てる。
+    従業員とシフトパターンは表 (members / patterns) として1回だけ返し、
+    日ごとのデータは種類ごとに [従業員の添字, 開始日からの日数, (パターンの添字)] の配列と、
+    同じ順序の id などの列で返す。従業員表にない従業員の行は含めない。
+    """
+    version = department_version(department_id)
+    members_data = MemberSerializer(_members(user, department_id), many=True).data
+    member_index = {member['id']: i for i, member in enumerate(members_data)}
+    payload = {
+        'format': 'compact',
+        'version': version,
+        'start_date': start_date.isoformat() if start_date else None,
+        'members': members_data,
+        'patterns': [],
+        'assignments': {'id': [], 'cells': []},
+        'fixed_assignments': {'id': [], 'cells': []},
+        'leave_requests': {'cells': []},
+        'other_assignments': {'id': [], 'cells': [], 'activity_name': []},
+        'designated_holidays': {'id': [], 'cells': []},
+        'paid_leaves': {'id': [], 'cells': [], 'hours': []},
+        'availabilities': [],
+        'earnings': {},
+    }
+    if not start_date or not end_date:
+        return payload
+
+    querysets = _period_querysets(user, department_id, start_date, end_date)
+    pattern_index = {}
+
+    def add_rows(key, rows, *extra_columns):
+        table = payload[key]
+        for row in rows:
+            row_id, member_id, day = row[:3]
+            if member_id not in member_index:
+                continue
+            cell = [member_index[member_id], (day - start_date).days]
+            if key in ('assignments', 'fixed_assignments'):
+                pattern_id, pattern_name = row[3:5]
+                if pattern_id not in pattern_index:
+                    pattern_index[pattern_id] = len(payload['patterns'])
+                    payload['patterns'].append({'id': pattern_id, 'pattern_name': pattern_name})
+                cell.append(pattern_index[pattern_id])
+            table['cells'].append(cell)
+            if 'id' in table:
+                table['id'].append(row_id)
+            for column, value in zip(extra_columns, row[3:]):
+                table[column].append(value)
+
+    shift_columns = ('id', 'member_id', 'shift_date', 'shift_pattern_id', 'shift_pattern__pattern_name')
+    add_rows('assignments', querysets['assignments'].values_list(*shift_columns))
+    add_rows('fixed_assignments', querysets['fixed_assignments'].values_list(*shift_columns))
+    add_rows('leave_requests', querysets['leave_requests'].values_list('id', 'member_id', 'leave_date'))
+    add_rows('other_assignments', querysets['other_assignments'].values_list('id', 'member_id', 'shift_date', 'activity_name'), 'activity_name')
+    add_rows('designated_holidays', querysets['designated_holidays'].values_list('id', 'member_id', 'date'))
+    add_rows('paid_leaves', querysets['paid_leaves'].values_list('id', 'member_id', 'date', 'hours'), 'hours')
+    payload['availabilities'] = MemberAvailabilitySerializer(querysets['availabilities'], many=True).data
+    payload['earnings'] = period_earnings(querysets['assignments'], querysets['paid_leaves'])
+    return payload
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from .models import (
-    Member, Assignment, ShiftPattern, MemberAvailability, OtherAssignment, FixedAssignment, Department, DesignatedHoliday, SolverSettings, PaidLeave
+    Member, Assignment, ShiftPattern, MemberAvailability, OtherAssignment, FixedAssignment, Department, DesignatedHoliday, SolverSettings, PaidLeave, SolverJob, ExportJob
 )
 
 class DepartmentSerializer(serializers.ModelSerializer):
@@ -23,7 +23,7 @@ class MemberSerializer(serializers.ModelSerializer):
         ]
 
     def get_shift_preferences(self, obj):
-        return [pref.shift_pattern.id for pref in obj.membershiftpatternpreference_set.all()]
+        return [pref.shift_pattern_id for pref in obj.membershiftpatternpreference_set.all()]
 
 class AssignmentSerializer(serializers.ModelSerializer):
     member_name = serializers.CharField(source='member.name', read_only=True)
@@ -56,12 +56,14 @@ class ShiftPatternSerializer(serializers.ModelSerializer):
 class OtherAssignmentSerializer(serializers.ModelSerializer):
     class Meta:
         model = OtherAssignment
-        fields = '__all__'
+        # department は従業員の部門の複製のため返さない
+        exclude = ['department']
 
 class DesignatedHolidaySerializer(serializers.ModelSerializer):
     class Meta:
         model = DesignatedHoliday
-        fields = '__all__'
+        # department は従業員の部門の複製のため返さない
+        exclude = ['department']
 
 
 class SolverSettingsSerializer(serializers.ModelSerializer):
@@ -73,4 +75,17 @@ class SolverSettingsSerializer(serializers.ModelSerializer):
 class PaidLeaveSerializer(serializers.ModelSerializer):
     class Meta:
         model = PaidLeave
-        fields = '__all__'
+        # department は従業員の部門の複製のため返さない
+        exclude = ['department']
+
+
+class SolverJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SolverJob
+        fields = ['id', 'department', 'start_date', 'end_date', 'status', 'error_message', 'progress', 'stop_requested', 'created_at', 'started_at', 'finished_at']
+
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ExportJob
+        fields = ['id', 'department', 'department_ids', 'layout', 'start_date', 'end_date', 'version', 'status', 'cached', 'error_message', 'created_at', 'started_at', 'finished_at']
@@ -0,0 +1,86 @@
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import (
+    Department, DepartmentVersion, Member, ShiftPattern, TimeSlotRequirement, SpecificDateRequirement,
+    SpecificTimeSlotRequirement, SolverSettings, MemberAvailability, MemberShiftPatternPreference, GroupMember
+)
+from .versioning import (
+    CELL_MODELS, bump_department_version, member_department_id, record_cell_change, set_department_deleting
+)
+
+# department を直接持つモデル
+DEPARTMENT_MODELS = (Member, ShiftPattern, TimeSlotRequirement, SpecificDateRequirement, SpecificTimeSlotRequirement, SolverSettings)
+# member 経由で部門が決まるモデル
+MEMBER_MODELS = (MemberAvailability, MemberShiftPatternPreference, GroupMember)
+
+
+@receiver(post_save, sender=Department)
+def department_saved(sender, instance, created, **kwargs):
+    if created:
+        DepartmentVersion.objects.get_or_create(department=instance)
+    else:
+        bump_department_version(instance.id)
+
+
+@receiver(pre_delete, sender=Department)
+def department_deleting(sender, instance, **kwargs):
+    set_department_deleting(instance.id, True)
+
+
+@receiver(post_delete, sender=Department)
+def department_deleted(sender, instance, **kwargs):
+    set_department_deleting(instance.id, False)
+
+
+def department_row_changed(sender, instance, **kwargs):
+    bump_department_version(instance.department_id)
+    # 従業員が部門を移った場合は、移動元の部門のデータ (従業員一覧・日ごとのデータ) も変わる
+    loaded_department_id = getattr(instance, '_loaded_department_id', None)
+    if loaded_department_id is not None and loaded_department_id != instance.department_id:
+        bump_department_version(loaded_department_id)
+
+
+def member_row_changed(sender, instance, **kwargs):
+    bump_department_version(member_department_id(instance.member_id))
+
+
+def cell_saved(sender, instance, created, **kwargs):
+    kind, date_field = CELL_MODELS[sender]
+    date = getattr(instance, date_field)
+    # 更新は、変更前のセルの削除と変更後のセルの追加として記録する (従業員や日付が変わった場合に元のセルを消させるため)
+    if not created:
+        loaded = getattr(instance, '_loaded_values', {})
+        record_cell_change(
+            loaded.get('department_id', instance.department_id), kind, 'delete', instance.pk,
+            loaded.get('member_id', instance.member_id), loaded.get(date_field, date)
+        )
+    record_cell_change(instance.department_id, kind, 'insert', instance.pk, instance.member_id, date)
+
+
+def cell_deleted(sender, instance, **kwargs):
+    kind, date_field = CELL_MODELS[sender]
+    record_cell_change(instance.department_id, kind, 'delete', instance.pk, instance.member_id, getattr(instance, date_field))
+
+
+for model in DEPARTMENT_MODELS:
+    post_save.connect(department_row_changed, sender=model, dispatch_uid=f'version_{model.__name__}_save')
+    post_delete.connect(department_row_changed, sender=model, dispatch_uid=f'version_{model.__name__}_delete')
+for model in MEMBER_MODELS:
+    post_save.connect(member_row_changed, sender=model, dispatch_uid=f'version_{model.__name__}_save')
+    post_delete.connect(member_row_changed, sender=model, dispatch_uid=f'version_{model.__name__}_delete')
+for model in CELL_MODELS:
+    post_save.connect(cell_saved, sender=model, dispatch_uid=f'version_{model.__name__}_save')
+    post_delete.connect(cell_deleted, sender=model, dispatch_uid=f'version_{model.__name__}_delete')
+
+
+@receiver(m2m_changed, sender=Member.allowed_day_groups.through)
+def member_day_groups_changed(sender, instance, action, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, Member):
+        bump_department_version(instance.department_id)
+    elif pk_set:
+        # 曜日グループ側から従業員を追加・削除した場合
+        for department_id in set(Member.objects.filter(id__in=pk_set).values_list('department_id', flat=True)):
+            bump_department_version(department_id)
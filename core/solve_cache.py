@@ -0,0 +1,102 @@
+import hashlib
+import json
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import (
+    Member, ShiftPattern, LeaveRequest, TimeSlotRequirement, RelationshipGroup, GroupMember,
+    OtherAssignment, FixedAssignment, SpecificDateRequirement, SpecificTimeSlotRequirement,
+    MemberShiftPatternPreference, DesignatedHoliday, DayGroup, PaidLeave, SolveResultCache
+)
+
+# ソルバーのモデル (制約や目的関数) を変更したときは値を上げ、古いキャッシュを使わないようにする
+SOLVER_CACHE_VERSION = 2
+
+
+def _rows(queryset):
+    return list(queryset.order_by('pk').values())
+
+
+def input_fingerprint(department_id, start_date, end_date, solver_settings):
+    """
+    generate_schedule が読み込む入力データ全体のハッシュ (SHA-256) を返す。
+    いずれかの行が追加・変更・削除されるとハッシュが変わる。
+    """
+    member_ids = list(Member.objects.filter(department_id=department_id).values_list('id', flat=True))
+    period = [start_date, end_date]
+    day_group_ids = set(
+        TimeSlotRequirement.objects.filter(department_id=department_id).values_list('day_group_id', flat=True)
+    ) | set(
+        Member.allowed_day_groups.through.objects.filter(member_id__in=member_ids).values_list('daygroup_id', flat=True)
+    )
+    group_members = GroupMember.objects.filter(member_id__in=member_ids)
+
+    inputs = {
+        'version': SOLVER_CACHE_VERSION,
+        'department_id': department_id,
+        'period': [start_date, end_date],
+        'settings': {
+            field.attname: getattr(solver_settings, field.attname)
+            for field in solver_settings._meta.concrete_fields
+        },
+        'members': _rows(Member.objects.filter(id__in=member_ids)),
+        'allowed_day_groups': _rows(Member.allowed_day_groups.through.objects.filter(member_id__in=member_ids)),
+        'day_groups': _rows(DayGroup.objects.filter(id__in=day_group_ids)),
+        'patterns': _rows(ShiftPattern.objects.filter(department_id=department_id)),
+        'preferences': _rows(MemberShiftPatternPreference.objects.filter(member_id__in=member_ids)),
+        'timeslot_requirements': _rows(TimeSlotRequirement.objects.filter(department_id=department_id)),
+        'specific_date_requirements': _rows(SpecificDateRequirement.objects.filter(department_id=department_id, date__range=period)),
+        'specific_timeslot_requirements': _rows(SpecificTimeSlotRequirement.objects.filter(department_id=department_id, date__range=period)),
+        'leave_requests': _rows(LeaveRequest.objects.filter(member_id__in=member_ids, status='approved', leave_date__range=period)),
+        'paid_leaves': _rows(PaidLeave.objects.filter(member_id__in=member_ids, date__range=period)),
+        'designated_holidays': _rows(DesignatedHoliday.objects.filter(member_id__in=member_ids, date__range=period)),
+        'fixed_assignments': _rows(FixedAssignment.objects.filter(member_id__in=member_ids, shift_date__range=period)),
+        'other_assignments': _rows(OtherAssignment.objects.filter(member_id__in=member_ids, shift_date__range=period)),
+        'group_members': _rows(group_members),
+        'relationship_groups': _rows(RelationshipGroup.objects.filter(id__in=group_members.values('group_id'))),
+    }
+    payload = json.dumps(inputs, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def get_cached_result(fingerprint):
+    """有効期間内のキャッシュがあれば生成結果を返し、最終利用日時を更新する。なければ None"""
+    expires_before = timezone.now() - timedelta(seconds=settings.SOLVER_CACHE_TTL_SECONDS)
+    entry = SolveResultCache.objects.filter(fingerprint=fingerprint, created_at__gte=expires_before).first()
+    if entry is None:
+        return None
+    SolveResultCache.objects.filter(id=entry.id).update(last_used_at=timezone.now())
+
+    result = entry.result
+    for assign in result['assignments']:
+        assign['shift_date'] = date.fromisoformat(assign['shift_date'])
+    return result
+
+
+def store_result(fingerprint, department_id, start_date, end_date, result):
+    """生成結果を保存し、期限切れのキャッシュと最大件数を超えた古いキャッシュ (最終利用日時順) を削除する"""
+    cached_result = {
+        'infeasible_days': result['infeasible_days'],
+        'assignments': [
+            {**assign, 'shift_date': assign['shift_date'].isoformat()} for assign in result['assignments']
+        ],
+    }
+    SolveResultCache.objects.update_or_create(
+        fingerprint=fingerprint,
+        defaults={
+            'department_id': department_id,
+            'start_date': start_date,
+            'end_date': end_date,
+            'result': cached_result,
+            'created_at': timezone.now(),
+            'last_used_at': timezone.now(),
+        },
+    )
+
+    expires_before = timezone.now() - timedelta(seconds=settings.SOLVER_CACHE_TTL_SECONDS)
+    SolveResultCache.objects.filter(created_at__lt=expires_before).delete()
+    evicted_ids = SolveResultCache.objects.order_by('-last_used_at').values_list('id', flat=True)[settings.SOLVER_CACHE_MAX_ENTRIES:]
+    if evicted_ids:
+        SolveResultCache.objects.filter(id__in=list(evicted_ids)).delete()
@@ -1,16 +1,247 @@
 from ortools.sat.python import cp_model
 from .models import (
-    Member, ShiftPattern, LeaveRequest, TimeSlotRequirement, Assignment, DayGroup, 
+    Member, ShiftPattern, LeaveRequest, TimeSlotRequirement, Assignment,
     RelationshipGroup, OtherAssignment, FixedAssignment, SpecificDateRequirement, 
     SpecificTimeSlotRequirement, MemberShiftPatternPreference, DesignatedHoliday,
-    SolverSettings, PaidLeave # Added SolverSettings, PaidLeave
+    SolverSettings, PaidLeave, SolverJob # Added SolverSettings, PaidLeave
 )
 from .serializers import AssignmentSerializer
+from .coverage import SlotCoverage, SLOT_MINUTES
+from .solve_cache import input_fingerprint, get_cached_result, store_result
+from .instrumentation import SolveRunRecorder
+from .earnings import pattern_minutes, shift_earnings
+from .versioning import department_writes, record_bulk_created
 from datetime import date, timedelta, datetime, time
 from collections import defaultdict
 import itertools
+from functools import lru_cache
+from bisect import bisect_right
+from time import monotonic
+import threading
+from django.db import connection, transaction
+
+MIN_REST_MINUTES = 8 * 60
+# 修復モードの探索時間の上限 (秒)
+REPAIR_TIME_LIMIT_SECONDS = 10.0
+# 修復モードで再最適化する、変更日の前後の日数
+REPAIR_RADIUS_DAYS = 3
+# 前後の日数の上限 (これより広い範囲は通常のシフト生成で再計算する)
+MAX_REPAIR_RADIUS_DAYS = 14
+
+@lru_cache(maxsize=128)
+def rest_conflict_table(pattern_times):
+    """
+    勤務間インターバル (MIN_REST_MINUTES) を確保できないシフトパターンの組み合わせを返す。
+    pattern_times は (pattern_id, start_time, end_time) のタプルで、
+    戻り値は {前日のpattern_id: (翌日に勤務できないpattern_idのタプル)}。
+    結果はパターンの組み合わせごとにキャッシュされる。
+    """
+    conflicts = {}
+    for p1_id, p1_start, p1_end in pattern_times:
+        end_minutes = p1_end.hour * 60 + p1_end.minute
+        if p1_end < p1_start:
+            end_minutes += 24 * 60
+        min_next_start = end_minutes + MIN_REST_MINUTES
+        conflicting = tuple(
+            p2_id for p2_id, p2_start, p2_end in pattern_times
+            if 24 * 60 + p2_start.hour * 60 + p2_start.minute < min_next_start
+        )
+        if conflicting:
+            conflicts[p1_id] = conflicting
+    return conflicts
+
+WEEKDAY_FIELDS = ['is_monday', 'is_tuesday', 'is_wednesday', 'is_thursday', 'is_friday', 'is_saturday', 'is_sunday']
+
+class RequirementIndex:
+    """
+    時間帯別必要人数のルールを1回だけ読み込み、日付と時刻から二分探索で引けるようにする。
+    曜日ごとの TimeSlotRequirement と、日付ごとの SpecificTimeSlotRequirement を区間リストとして保持する。
+    特定日の設定がある日は、曜日のルールを使わない。
+    """
+    def __init__(self, department_id, specific_timeslot_reqs, specific_dates, time_interval=30):
+        self.time_interval = time_interval
+        self.specific_dates = set(specific_dates)
+
+        requirements = list(TimeSlotRequirement.objects.filter(department_id=department_id).select_related('day_group').order_by('id'))
+        self.weekday_segments = {}
+        for weekday, field in enumerate(WEEKDAY_FIELDS):
+            self.weekday_segments[weekday] = self._build_segments(
+                [req for req in requirements if getattr(req.day_group, field)]
+            )
+
+        reqs_by_date = defaultdict(list)
+        for req in specific_timeslot_reqs:
+            reqs_by_date[req.date].append(req)
+        self.date_segments = {d: self._build_segments(reqs) for d, reqs in reqs_by_date.items()}
+
+    def _build_segments(self, requirements):
+        """
+        各時間帯に最初に該当したルールを割り当て、連続する同じルールの時間帯を1つの区間にまとめる。
+        戻り値は (開始分のリスト, 終了分のリスト, ルールのリスト)。
+        """
+        starts, ends, rules = [], [], []
+        for t in range(0, 24 * 60, self.time_interval):
+            slot_start = time(t // 60, t % 60)
+            rule = next((req for req in requirements if req.start_time <= slot_start < req.end_time), None)
+            if rule is None:
+                continue
+            if rules and rules[-1] is rule and ends[-1] == t:
+                ends[-1] = t + self.time_interval
+            else:
+                starts.append(t)
+                ends.append(t + self.time_interval)
+                rules.append(rule)
+        return starts, ends, rules
+
+    def _segments_for(self, d):
+        if d in self.specific_dates:
+            return self.date_segments.get(d, ([], [], []))
+        return self.weekday_segments[d.weekday()]
+
+    def rule_for(self, d, minutes):
+        """日付 d の 0時からの経過分 minutes に適用されるルールを返す (なければ None)"""
+        starts, ends, rules = self._segments_for(d)
+        i = bisect_right(starts, minutes) - 1
+        if i >= 0 and minutes < ends[i]:
+            return rules[i]
+        return None
+
+    def slot_rules(self, d):
+        """日付 d のルールがある時間帯について (経過分, ルール) を順に返す"""
+        starts, ends, rules = self._segments_for(d)
+        for start, end, rule in zip(starts, ends, rules):
+            for t in range(start, end, self.time_interval):
+                yield t, rule
+
+def configure_solver(solver, settings, time_limit):
+    """SolverSettings のエンジンパラメータを CP-SAT に反映する"""
+    solver.parameters.max_time_in_seconds = time_limit
+    solver.parameters.num_workers = settings.num_search_workers
+    solver.parameters.relative_gap_limit = settings.relative_gap_limit
+    solver.parameters.random_seed = settings.random_seed
+    solver.parameters.linearization_level = settings.linearization_level
+
+class SolveMonitor(cp_model.CpSolverSolutionCallback):
+    """
+    改善解が見つかるたびに目的関数値・上界・経過時間を記録する。
+    別スレッドで定期的に以下を行う。
+    - 新しい記録を on_progress に渡す
+    - 解が見つかったあと、should_stop が True を返すか no_improvement_timeout 秒改善がなければ探索を打ち切る
+    """
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, solver, no_improvement_timeout=0, on_progress=None, should_stop=None):
+        super().__init__()
+        self.solver = solver
+        self.no_improvement_timeout = no_improvement_timeout
+        self.on_progress = on_progress
+        self.should_stop = should_stop
+        self.events = []
+        self.last_improvement = None
+        self._reported = 0
+        self._stop_sent = False
+        # 監視スレッドの接続で発行したクエリ数 (SolveRunRecorder は呼び出し元のスレッドの接続しか数えないため)
+        self.query_count = 0
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+        self._watcher = threading.Thread(target=self._watch, daemon=True)
+        self._watcher.start()
+
+    def on_solution_callback(self):
+        # CP-SAT は目的関数が改善した解だけを通知する
+        event = {
+            'objective': self.ObjectiveValue(),
+            'bound': self.BestObjectiveBound(),
+            'wall_time': round(self.WallTime(), 3),
+        }
+        with self._lock:
+            self.events.append(event)
+        self.last_improvement = monotonic()
+
+    def _flush(self):
+        with self._lock:
+            new_events = self.events[self._reported:]
+            self._reported = len(self.events)
+        if new_events and self.on_progress:
+            self.on_progress(new_events)
+
+    def _should_stop(self):
+        if self.last_improvement is None:
+            return False
+        if self.no_improvement_timeout > 0 and monotonic() - self.last_improvement > self.no_improvement_timeout:
+            return True
+        return bool(self.should_stop and self.should_stop())
+
+    def _count_query(self, execute, sql, params, many, context):
+        self.query_count += 1
+        return execute(sql, params, many, context)
+
+    def _watch(self):
+        try:
+            with connection.execute_wrapper(self._count_query):
+                while not self._finished.wait(self.POLL_INTERVAL):
+                    self._flush()
+                    if not self._stop_sent and self._should_stop():
+                        self.solver.StopSearch()
+                        self._stop_sent = True
+                self._flush()
+        finally:
+            # コールバックがDBを使った場合に備え、このスレッドの接続を閉じる
+            connection.close()
+
+    def stop(self):
+        self._finished.set()
+        self._watcher.join()
+
+def load_previous_solution(department_id, start_date, end_date):
+    """
+    期間内の既存の Assignment を (member_id, date, pattern_id) のセットで返す。
+    Assignment がない場合は、同じ部門・期間で最後に成功したシフト生成ジョブの結果を使う。
+    """
+    previous_cells = set(
+        Assignment.objects.filter(shift_date__range=[start_date, end_date], department_id=department_id)
+        .values_list('member_id', 'shift_date', 'shift_pattern_id')
+    )
+    if previous_cells:
+        return previous_cells
+
+    last_job = SolverJob.objects.filter(
+        department_id=department_id, start_date=start_date, end_date=end_date, status='succeeded'
+    ).order_by('-finished_at').first()
+    if last_job and last_job.result:
+        for assign in last_job.result.get('assignments', []):
+            previous_cells.add((assign['member_id'], date.fromisoformat(assign['shift_date']), assign['shift_pattern']))
+    return previous_cells
+
+def _solution_diff(assignments, previous_cells):
+    """前回の解 (previous_cells) から新しい解への差分を返す"""
+    new_cells = {(a['member_id'], a['shift_date'], a['shift_pattern_id']) for a in assignments}
+    added_cells = sorted(new_cells - previous_cells, key=lambda c: (c[1], c[0]))
+    removed_cells = sorted(previous_cells - new_cells, key=lambda c: (c[1], c[0]))
+    return {
+        'warm_started': bool(previous_cells),
+        'changed_cells': len(added_cells) + len(removed_cells),
+        'diff': {
+            'added': [{'member_id': m_id, 'shift_date': d, 'shift_pattern_id': p_id} for m_id, d, p_id in added_cells],
+            'removed': [{'member_id': m_id, 'shift_date': d, 'shift_pattern_id': p_id} for m_id, d, p_id in removed_cells],
+        },
+    }
+
+def generate_schedule(department_id, start_date_str, end_date_str, warm_start=True, repair_window=None, on_progress=None, should_stop=None):
+    """
+    repair_window に (開始日, 終了日) を指定すると修復モードになり、
+    その期間外のシフトは既存の割り当てに固定したうえで期間内だけを再最適化する。
+    on_progress には改善解の記録 (目的関数値・上界・経過時間) のリストが渡され、
+    should_stop が True を返すとその時点の最良解で探索を終了する。
+    入力データが前回と同じ場合はキャッシュした最適解を返す (戻り値の cached が True)。
+    """
+    with SolveRunRecorder(department_id, start_date_str, end_date_str, is_repair=bool(repair_window)) as recorder:
+        return _generate_schedule(
+            recorder, department_id, start_date_str, end_date_str,
+            warm_start=warm_start, repair_window=repair_window, on_progress=on_progress, should_stop=should_stop
+        )
 
-def generate_schedule(department_id, start_date_str, end_date_str):
+def _generate_schedule(recorder, department_id, start_date_str, end_date_str, warm_start, repair_window, on_progress, should_stop):
     # --- 1. データ準備 ---
     start_date = date.fromisoformat(start_date_str)
     end_date = date.fromisoformat(end_date_str)
@@ -37,57 +268,82 @@ def generate_schedule(department_id, start_date_str, end_date_str):
                 s.is_default = False
                 s.save()
         settings = default_settings.first()
+
+    # 入力データが前回と同じであれば、キャッシュした解をそのまま返す (修復モードは既存の割り当てに依存するため対象外)
+    fingerprint = None
+    if not repair_window:
+        fingerprint = input_fingerprint(department_id, start_date, end_date, settings)
+        cached_result = get_cached_result(fingerprint)
+        if cached_result is not None:
+            recorder.record_cached()
+            previous_cells = load_previous_solution(department_id, start_date, end_date)
+            return {
+                'success': True,
+                'infeasible_days': cached_result['infeasible_days'],
+                'assignments': cached_result['assignments'],
+                'cached': True,
+                **_solution_diff(cached_result['assignments'], previous_cells),
+            }
+
     days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
 
     all_members = Member.objects.filter(department_id=department_id).prefetch_related('shift_preferences', 'allowed_day_groups')
     all_patterns = ShiftPattern.objects.filter(department_id=department_id)
-    fixed_assignments = FixedAssignment.objects.filter(shift_date__range=[start_date, end_date], member__department_id=department_id).select_related('shift_pattern', 'member')
-    other_assignments = OtherAssignment.objects.filter(shift_date__range=[start_date, end_date], member__department_id=department_id).select_related('member')
-    designated_holidays = DesignatedHoliday.objects.filter(date__range=[start_date, end_date], member__department_id=department_id)
+    fixed_assignments = FixedAssignment.objects.filter(shift_date__range=[start_date, end_date], department_id=department_id).select_related('shift_pattern', 'member')
+    other_assignments = OtherAssignment.objects.filter(shift_date__range=[start_date, end_date], department_id=department_id).select_related('member')
+    designated_holidays = DesignatedHoliday.objects.filter(date__range=[start_date, end_date], department_id=department_id)
     specific_date_reqs = SpecificDateRequirement.objects.filter(date__range=[start_date, end_date], department_id=department_id)
     specific_timeslot_reqs = SpecificTimeSlotRequirement.objects.filter(date__range=[start_date, end_date], department_id=department_id)
     prefs = MemberShiftPatternPreference.objects.filter(member__department_id=department_id)
     priority_map = {(p.member_id, p.shift_pattern.id): p.priority for p in prefs}
-    time_interval = 30
+    time_interval = SLOT_MINUTES
 
     # 特定日の設定がある日付をセットとして保持
     dates_with_specific_reqs = {req.date for req in specific_date_reqs} | {req.date for req in specific_timeslot_reqs}
+    requirement_index = RequirementIndex(department_id, specific_timeslot_reqs, dates_with_specific_reqs, time_interval)
 
     # 固定シフト・その他シフトがある従業員と日付のセットを事前に計算
-    fixed_slot_coverage = defaultdict(int)
+    coverage = SlotCoverage(all_patterns, start_date, end_date, time_interval)
+    fixed_slot_counts = coverage.counts((fa.shift_date, fa.shift_pattern_id) for fa in fixed_assignments)
     pre_assigned_days = set()
     for fa in fixed_assignments:
-        pre_assigned_days.add((fa.member.id, fa.shift_date))
-        p_start, p_end = fa.shift_pattern.start_time, fa.shift_pattern.end_time
-        current_time = datetime.combine(fa.shift_date, p_start)
-        end_time_dt = datetime.combine(fa.shift_date, p_end)
-        if p_end < p_start:
-            end_time_dt += timedelta(days=1)
-        num_intervals = int(((end_time_dt - current_time).total_seconds() / 60) / time_interval)
-        for i in range(num_intervals):
-            slot_start_dt = current_time + timedelta(minutes=i * time_interval)
-            if start_date <= slot_start_dt.date() <= end_date:
-                fixed_slot_coverage[(slot_start_dt.date(), slot_start_dt.time())] += 1
+        pre_assigned_days.add((fa.member_id, fa.shift_date))
     for oa in other_assignments:
         pre_assigned_days.add((oa.member.id, oa.shift_date))
 
-    shift_work_minutes = {}
-    for p in all_patterns:
-        total_duration = (datetime.combine(date.today(), p.end_time) - datetime.combine(date.today(), p.start_time)).total_seconds() / 60
-        if p.end_time < p.start_time:
-            total_duration += 24 * 60
-        work_minutes = total_duration - p.break_minutes
-        shift_work_minutes[p.id] = int(work_minutes)
+    shift_work_minutes = {p.id: sum(pattern_minutes(p.start_time, p.end_time, p.break_minutes)) for p in all_patterns}
 
     day_difficulty = defaultdict(int)
     leave_requests_map = defaultdict(set)
-    for req in LeaveRequest.objects.filter(status='approved', leave_date__range=[start_date, end_date], member__department_id=department_id):
+    for req in LeaveRequest.objects.filter(status='approved', leave_date__range=[start_date, end_date], department_id=department_id):
         day_difficulty[req.leave_date] += 1
-        leave_requests_map[req.member.id].add(req.leave_date)
+        leave_requests_map[req.member_id].add(req.leave_date)
+
+    paid_leaves = PaidLeave.objects.filter(date__range=[start_date, end_date], department_id=department_id)
+
+    # 勤務できない (変数が必ず0になる) 従業員と日付の組み合わせ
+    # 希望休・指定休日・有給・その他の割り当てがある日は変数自体を作成しない
+    blocked_days = set()
+    for member_id, leave_dates in leave_requests_map.items():
+        for d in leave_dates:
+            blocked_days.add((member_id, d))
+    for dh in designated_holidays:
+        blocked_days.add((dh.member_id, dh.date))
+    for pl in paid_leaves:
+        blocked_days.add((pl.member_id, pl.date))
+    for oa in other_assignments:
+        blocked_days.add((oa.member_id, oa.shift_date))
+
+    fixed_pattern_map = {(fa.member_id, fa.shift_date): fa.shift_pattern_id for fa in fixed_assignments}
+    allowed_patterns_map = {m.id: {p.id for p in m.shift_preferences.all()} for m in all_members}
 
     # --- 2. モデルと変数の定義 ---
+    recorder.phase('variables')
     model = cp_model.CpModel()
+    # 変数は (member_id, date, pattern_id) をキーとする疎な辞書で保持する
+    # 存在しないキーは常に0 (割り当て不可) を意味する
     shifts = {}
+    member_day_shifts = defaultdict(list)
     shortfall_vars = {}
     actual_workers_in_slot_vars = {}
     work_day_surplus_vars = {}
@@ -98,11 +354,23 @@ def generate_schedule(department_id, start_date_str, end_date_str):
     consecutive_violation_vars = {}
 
     for m in all_members:
+        allowed_pattern_ids = allowed_patterns_map[m.id]
         for d in days:
+            if (m.id, d) in blocked_days:
+                continue
+            fixed_pattern_id = fixed_pattern_map.get((m.id, d))
             for p in all_patterns:
-                shifts[(m.id, d, p.id)] = model.NewBoolVar(f'shift_m{m.id}_d{d}_p{p.id}')
+                if allowed_pattern_ids and p.id not in allowed_pattern_ids:
+                    continue
+                # 固定シフトがある日は、そのパターン以外は1日1シフトの制約で必ず0になる
+                if fixed_pattern_id is not None and p.id != fixed_pattern_id:
+                    continue
+                var = model.NewBoolVar(f'shift_m{m.id}_d{d}_p{p.id}')
+                shifts[(m.id, d, p.id)] = var
+                member_day_shifts[(m.id, d)].append((p, var))
 
     # --- 3. 目的関数とペナルティの準備 ---
+    recorder.phase('constraints')
     total_priority_score = []
     total_penalty_terms = []
     HEADCOUNT_PENALTY_COST = settings.headcount_penalty_cost
@@ -134,28 +402,28 @@ def generate_schedule(department_id, start_date_str, end_date_str):
         
         for d in days:
             if d in leave_requests_map.get(m.id, set()): continue
-            
-            is_unavailable_day_violation = model.NewBoolVar(f'unavailable_day_violation_m{m.id}_d{d}')
-            unavailable_day_violation_vars[(m.id, d)] = is_unavailable_day_violation
-            if allowed_groups.exists() and d.weekday() not in allowed_weekdays:
-                model.Add(sum(shifts.get((m.id, d, p.id), 0) for p in all_patterns) == 0).OnlyEnforceIf(is_unavailable_day_violation.Not())
-                total_penalty_terms.append(is_unavailable_day_violation * UNAVAILABLE_DAY_PENALTY)
-            else:
-                # If no violation, ensure the violation variable is false
-                model.Add(is_unavailable_day_violation == 0)
 
             for p in all_patterns:
                 if allowed_patterns and p.id not in allowed_patterns: continue
                 num_possible_shifts += 1
-        
+
+            day_shifts = [var for p, var in member_day_shifts.get((m.id, d), [])]
+            if not day_shifts: continue
+
+            if allowed_groups.exists() and d.weekday() not in allowed_weekdays:
+                is_unavailable_day_violation = model.NewBoolVar(f'unavailable_day_violation_m{m.id}_d{d}')
+                unavailable_day_violation_vars[(m.id, d)] = is_unavailable_day_violation
+                model.Add(sum(day_shifts) == 0).OnlyEnforceIf(is_unavailable_day_violation.Not())
+                total_penalty_terms.append(is_unavailable_day_violation * UNAVAILABLE_DAY_PENALTY)
+
         priority_reward = (10000 // (num_possible_shifts + 1)) * (100 - m.priority_score)
         for d in days:
-            for p in all_patterns:
+            for p, var in member_day_shifts.get((m.id, d), []):
                 score_term = priority_reward + day_difficulty.get(d, 0) * DIFFICULTY_BONUS_WEIGHT
                 pattern_priority = priority_map.get((m.id, p.id), 100)
                 priority_bonus = (100 - pattern_priority) * SHIFT_PREFERENCE_BONUS
                 score_term += priority_bonus
-                total_priority_score.append(shifts[(m.id, d, p.id)] * score_term)
+                total_priority_score.append(var * score_term)
 
     # ペアリングのボーナス項
     pairing_groups = RelationshipGroup.objects.filter(rule_type='pairing').prefetch_related('groupmember_set__member')
@@ -164,19 +432,24 @@ def generate_schedule(department_id, start_date_str, end_date_str):
         for m1, m2 in itertools.combinations(members_in_group, 2):
             for d in days:
                 for p in all_patterns:
+                    shift1 = shifts.get((m1.id, d, p.id))
+                    shift2 = shifts.get((m2.id, d, p.id))
+                    if shift1 is None or shift2 is None: continue
                     is_paired = model.NewBoolVar(f'paired_m{m1.id}_m{m2.id}_d{d}_p{p.id}')
-                    model.AddBoolAnd([shifts[(m1.id, d, p.id)], shifts[(m2.id, d, p.id)]]).OnlyEnforceIf(is_paired)
-                    model.AddImplication(is_paired, shifts[(m1.id, d, p.id)])
-                    model.AddImplication(is_paired, shifts[(m2.id, d, p.id)])
+                    model.AddBoolAnd([shift1, shift2]).OnlyEnforceIf(is_paired)
+                    model.AddImplication(is_paired, shift1)
+                    model.AddImplication(is_paired, shift2)
                     total_priority_score.append(is_paired * PAIRING_BONUS)
 
     work_days_per_member = []
     for m in all_members:
         work_days = []
         for d in days:
+            day_shifts = [var for p, var in member_day_shifts.get((m.id, d), [])]
+            if not day_shifts: continue
             is_working_day = model.NewBoolVar(f'is_working_for_fairness_m{m.id}_d{d}')
-            model.Add(sum(shifts.get((m.id, d, p.id), 0) for p in all_patterns) >= 1).OnlyEnforceIf(is_working_day)
-            model.Add(sum(shifts.get((m.id, d, p.id), 0) for p in all_patterns) == 0).OnlyEnforceIf(is_working_day.Not())
+            model.Add(sum(day_shifts) >= 1).OnlyEnforceIf(is_working_day)
+            model.Add(sum(day_shifts) == 0).OnlyEnforceIf(is_working_day.Not())
             work_days.append(is_working_day)
         work_days_per_member.append(sum(work_days))
     
@@ -192,51 +465,37 @@ def generate_schedule(department_id, start_date_str, end_date_str):
 
     # --- 4. 制約の追加 ---
     # 固定シフト・その他シフトの制約
+    # その他の割り当て・希望休・指定休日・有給の日は変数を作成していないため、ここでの制約は不要
     for fa in fixed_assignments:
-        model.Add(shifts[(fa.member.id, fa.shift_date, fa.shift_pattern.id)] == 1)
-    for oa in other_assignments:
-        for p in all_patterns:
-            if (oa.member.id, oa.shift_date, p.id) in shifts:
-                model.Add(shifts[(oa.member.id, oa.shift_date, p.id)] == 0)
+        fixed_shift = shifts.get((fa.member_id, fa.shift_date, fa.shift_pattern_id))
+        if fixed_shift is None:
+            # 固定シフトが休日や担当不可のシフトと重なっている場合は解なし
+            model.AddBoolOr([])
+        else:
+            model.Add(fixed_shift == 1)
 
     # 特定日・シフトパターンごとの必要人数制約
     for req in specific_date_reqs:
-        workers_in_pattern = sum(shifts[(m.id, req.date, req.shift_pattern.id)] for m in all_members)
+        workers_in_pattern = sum(shifts.get((m.id, req.date, req.shift_pattern_id), 0) for m in all_members)
         model.Add(workers_in_pattern >= req.min_headcount)
         if req.max_headcount is not None:
             model.Add(workers_in_pattern <= req.max_headcount)
 
-    # 担当可能でないシフトには割り当てない制約
-    for m in all_members:
-        assigned_pattern_ids = {p.id for p in m.shift_preferences.all()}
-        if assigned_pattern_ids:
-            for p in all_patterns:
-                if p.id not in assigned_pattern_ids:
-                    for d in days:
-                        model.Add(shifts[(m.id, d, p.id)] == 0)
-
     # 各シフトパターンの最高人数制約
     for d in days:
         for p in all_patterns:
             if p.max_headcount is not None:
-                workers_in_pattern_on_day = sum(shifts[(m.id, d, p.id)] for m in all_members)
+                workers_in_pattern_on_day = sum(shifts.get((m.id, d, p.id), 0) for m in all_members)
                 model.Add(workers_in_pattern_on_day <= p.max_headcount)
 
-    slot_coverage = defaultdict(list)
-    for m in all_members:
-        for d in days:
-            if (m.id, d) in pre_assigned_days:
-                continue
-            for p in all_patterns:
-                p_start, p_end = p.start_time, p.end_time
-                current_time = datetime.combine(d, p_start)
-                end_time_dt = datetime.combine(d, p_end)
-                if p_end < p_start: end_time_dt += timedelta(days=1)
-                num_intervals = int(((end_time_dt - current_time).total_seconds() / 60) / time_interval)
-                for i in range(num_intervals):
-                    slot_start_dt = current_time + timedelta(minutes=i * time_interval)
-                    if start_date <= slot_start_dt.date() <= end_date:
-                        slot_coverage[(slot_start_dt.date(), slot_start_dt.time())].append((shifts[(m.id, d, p.id)], m.id))
+    # 時間帯 (日付, 0時からの経過分) ごとに、その時間帯を担当しうる変数と従業員IDをまとめる
+    slot_coverage = coverage.group(
+        (d, p.id, (var, m.id))
+        for m in all_members
+        for d in days
+        if (m.id, d) not in pre_assigned_days
+        for p, var in member_day_shifts.get((m.id, d), [])
+    )
 
     incompatible_groups = RelationshipGroup.objects.filter(rule_type='incompatible').prefetch_related('groupmember_set')
     for group in incompatible_groups:
@@ -251,95 +510,55 @@ def generate_schedule(department_id, start_date_str, end_date_str):
 
     # 必要人数の制約 (曜日グループ or 特定日)
     for d in days:
-        if d in dates_with_specific_reqs:
-            day_specific_reqs = [req for req in specific_timeslot_reqs if req.date == d]
-            if day_specific_reqs:
-                for t in range(0, 24 * 60, time_interval):
-                    current_slot_start = time(t // 60, t % 60)
-                    rule_for_slot = next((req for req in day_specific_reqs if req.start_time <= current_slot_start and current_slot_start < req.end_time), None)
-                    if rule_for_slot:
-                        variable_workers_in_slot = [s for s, m_id in slot_coverage.get((d, current_slot_start), [])]
-                        fixed_workers_in_slot = fixed_slot_coverage.get((d, current_slot_start), 0)
-                        total_workers_expr = sum(variable_workers_in_slot) + fixed_workers_in_slot
-                        actual_workers_in_slot = model.NewIntVar(0, len(all_members), f'actual_workers_d{d}_t{t}')
-                        actual_workers_in_slot_vars[(d, t)] = actual_workers_in_slot
-                        model.Add(actual_workers_in_slot == total_workers_expr)
-                        shortfall = model.NewIntVar(0, rule_for_slot.min_headcount, f'headcount_shortfall_d{d}_t{t}')
-                        shortfall_vars[(d, t)] = shortfall
-                        model.Add(total_workers_expr + shortfall >= rule_for_slot.min_headcount)
-                        total_penalty_terms.append(shortfall * HEADCOUNT_PENALTY_COST)
-                        if rule_for_slot.max_headcount is not None:
-                            model.Add(actual_workers_in_slot <= rule_for_slot.max_headcount)
-                        else:
-                            raise ValueError(f"max_headcount is None for rule {rule_for_slot.id} at {d} {current_slot_start}")
-        else:
-            day_name_field = f"is_{d.strftime('%A').lower()}"
-            applicable_groups = DayGroup.objects.filter(**{day_name_field: True})
-            if not applicable_groups.exists(): continue
-            requirements = TimeSlotRequirement.objects.filter(day_group__in=applicable_groups, department_id=department_id)
-            for t in range(0, 24 * 60, time_interval):
-                current_slot_start = time(t // 60, t % 60)
-                rule_for_slot = next((req for req in requirements if req.start_time <= current_slot_start and current_slot_start < req.end_time), None)
-                if rule_for_slot:
-                    variable_workers_in_slot = [s for s, m_id in slot_coverage.get((d, current_slot_start), [])]
-                    fixed_workers_in_slot = fixed_slot_coverage.get((d, current_slot_start), 0)
-                    total_workers_expr = sum(variable_workers_in_slot) + fixed_workers_in_slot
-                    actual_workers_in_slot = model.NewIntVar(0, len(all_members), f'actual_workers_d{d}_t{t}')
-                    actual_workers_in_slot_vars[(d, t)] = actual_workers_in_slot
-                    model.Add(actual_workers_in_slot == total_workers_expr)
-                    shortfall = model.NewIntVar(0, rule_for_slot.min_headcount, f'headcount_shortfall_d{d}_t{t}')
-                    shortfall_vars[(d, t)] = shortfall
-                    model.Add(total_workers_expr + shortfall >= rule_for_slot.min_headcount)
-                    total_penalty_terms.append(shortfall * HEADCOUNT_PENALTY_COST)
-                    if rule_for_slot.max_headcount is not None:
-                        model.Add(actual_workers_in_slot <= rule_for_slot.max_headcount)
-                    else:
-                        raise ValueError(f"max_headcount is None for rule {rule_for_slot.id} at {d} {current_slot_start}")
-    
-    for req in LeaveRequest.objects.filter(status='approved', leave_date__range=[start_date, end_date], member__department_id=department_id):
-        for p in all_patterns:
-            if (req.member.id, req.leave_date, p.id) in shifts:
-                model.Add(shifts[(req.member.id, req.leave_date, p.id)] == 0)
-
-    for dh in designated_holidays:
-        for p in all_patterns:
-            if (dh.member.id, dh.date, p.id) in shifts:
-                model.Add(shifts[(dh.member.id, dh.date, p.id)] == 0)
-
-    # Constraint for PaidLeave: No shifts on paid leave days
-    paid_leaves = PaidLeave.objects.filter(date__range=[start_date, end_date], member__department_id=department_id)
-    for pl in paid_leaves:
-        for p in all_patterns:
-            if (pl.member.id, pl.date, p.id) in shifts:
-                model.Add(shifts[(pl.member.id, pl.date, p.id)] == 0)
+        for t, rule_for_slot in requirement_index.slot_rules(d):
+            current_slot_start = time(t // 60, t % 60)
+            variable_workers_in_slot = [s for s, m_id in slot_coverage.get((d, t), [])]
+            fixed_workers_in_slot = int(fixed_slot_counts[(d - start_date).days, t // time_interval])
+            total_workers_expr = sum(variable_workers_in_slot) + fixed_workers_in_slot
+            actual_workers_in_slot = model.NewIntVar(0, len(all_members), f'actual_workers_d{d}_t{t}')
+            actual_workers_in_slot_vars[(d, t)] = actual_workers_in_slot
+            model.Add(actual_workers_in_slot == total_workers_expr)
+            shortfall = model.NewIntVar(0, rule_for_slot.min_headcount, f'headcount_shortfall_d{d}_t{t}')
+            shortfall_vars[(d, t)] = shortfall
+            model.Add(total_workers_expr + shortfall >= rule_for_slot.min_headcount)
+            total_penalty_terms.append(shortfall * HEADCOUNT_PENALTY_COST)
+            if rule_for_slot.max_headcount is not None:
+                model.Add(actual_workers_in_slot <= rule_for_slot.max_headcount)
+            else:
+                raise ValueError(f"max_headcount is None for rule {rule_for_slot.id} at {d} {current_slot_start}")
     
-    MIN_REST_MINUTES = 8 * 60
+    # 勤務間インターバル: 同じ日の組み合わせは1日1シフトの制約で既に禁止されているため、翌日分のみ追加する
+    rest_conflicts = rest_conflict_table(tuple((p.id, p.start_time, p.end_time) for p in all_patterns))
     for m in all_members:
-        for d_idx, d in enumerate(days):
-            for p1 in all_patterns:
-                end_time1 = datetime.combine(d, p1.end_time)
-                if p1.end_time < p1.start_time:
-                    end_time1 += timedelta(days=1)
-                min_next_start_time = end_time1 + timedelta(minutes=MIN_REST_MINUTES)
-                for next_d_idx in range(d_idx, min(d_idx + 2, len(days))):
-                    next_d = days[next_d_idx]
-                    for p2 in all_patterns:
-                        if d == next_d and p1.id == p2.id: continue
-                        start_time2 = datetime.combine(next_d, p2.start_time)
-                        if start_time2 < min_next_start_time:
-                            model.AddImplication(shifts[(m.id, d, p1.id)], shifts[(m.id, next_d, p2.id)].Not())
+        for d_idx, d in enumerate(days[:-1]):
+            next_d = days[d_idx + 1]
+            for p1, var1 in member_day_shifts.get((m.id, d), []):
+                conflicting_shifts = [
+                    shifts[(m.id, next_d, p2_id)]
+                    for p2_id in rest_conflicts.get(p1.id, ())
+                    if (m.id, next_d, p2_id) in shifts
+                ]
+                if conflicting_shifts:
+                    model.AddAtMostOne([var1] + conflicting_shifts)
     
     for m in all_members:
         for d in days:
-            model.Add(sum(shifts[(m.id, d, p.id)] for p in all_patterns) <= 1)
-            daily_minutes = sum(shifts[(m.id, d, p.id)] * shift_work_minutes[p.id] for p in all_patterns)
+            day_shifts = member_day_shifts.get((m.id, d), [])
+            if not day_shifts: continue
+            model.AddAtMostOne(var for p, var in day_shifts)
+            daily_minutes = sum(var * shift_work_minutes[p.id] for p, var in day_shifts)
             model.Add(daily_minutes <= m.max_hours_per_day * 60)
             
         work_days_in_period = []
         for d in days:
+            day_shifts = [var for p, var in member_day_shifts.get((m.id, d), [])]
+            if not day_shifts:
+                # 変数のない日は常に休み
+                work_days_in_period.append(0)
+                continue
             is_working_day = model.NewBoolVar(f'is_working_m{m.id}_d{d}')
-            model.Add(sum(shifts[(m.id, d, p.id)] for p in all_patterns) >= 1).OnlyEnforceIf(is_working_day)
-            model.Add(sum(shifts[(m.id, d, p.id)] for p in all_patterns) == 0).OnlyEnforceIf(is_working_day.Not())
+            model.Add(sum(day_shifts) >= 1).OnlyEnforceIf(is_working_day)
+            model.Add(sum(day_shifts) == 0).OnlyEnforceIf(is_working_day.Not())
             work_days_in_period.append(is_working_day)
         
         num_days_in_period = len(days)
@@ -371,7 +590,8 @@ def generate_schedule(department_id, start_date_str, end_date_str):
         # Salary-based penalties
         if m.employee_type == 'hourly' and m.hourly_wage is not None:
             total_earnings = model.NewIntVar(0, 10000000, f'total_earnings_m{m.id}') # Max earnings for a month
-            model.Add(total_earnings == sum(shifts[(m.id, d, p.id)] * ((shift_work_minutes[p.id] * m.hourly_wage) // 60) for d in days for p in all_patterns))
+            # 給与は画面の給与見込みと同じ計算 (深夜割増を含む) で、1勤務あたりの円に丸めて使う
+            model.Add(total_earnings == sum(var * round(shift_earnings(p.start_time, p.end_time, p.break_minutes, m.hourly_wage)) for d in days for p, var in member_day_shifts.get((m.id, d), [])))
 
             if m.min_monthly_salary is not None:
                 salary_shortfall = model.NewIntVar(0, m.min_monthly_salary, f'salary_shortfall_m{m.id}')
@@ -388,20 +608,38 @@ def generate_schedule(department_id, start_date_str, end_date_str):
     # --- 5. 目的関数の設定 ---
     model.Maximize(sum(total_priority_score) - sum(total_penalty_terms))
 
+    # 既存のシフト (または前回の生成結果) を初期解のヒントとして与える
+    previous_cells = load_previous_solution(department_id, start_date, end_date) if warm_start or repair_window else set()
+    if previous_cells:
+        for key, var in shifts.items():
+            model.AddHint(var, 1 if key in previous_cells else 0)
+
+    # 修復モード: 指定期間外のシフトは既存の割り当てに固定する
+    if repair_window:
+        window_start, window_end = repair_window
+        for key, var in shifts.items():
+            if not (window_start <= key[1] <= window_end):
+                model.Add(var == (1 if key in previous_cells else 0))
+
     # --- 6. ソルバーの実行 & 結果の保存 ---
+    recorder.record_model(model)
+    recorder.phase('solve')
     solver = cp_model.CpSolver()
-    solver.parameters.max_time_in_seconds = 150.0
-    status = solver.Solve(model)
+    time_limit = settings.max_time_in_seconds
+    if repair_window:
+        time_limit = min(time_limit, REPAIR_TIME_LIMIT_SECONDS)
+    configure_solver(solver, settings, time_limit)
+    if settings.no_improvement_timeout > 0 or on_progress or should_stop:
+        monitor = SolveMonitor(solver, settings.no_improvement_timeout, on_progress, should_stop)
+        status = solver.Solve(model, monitor)
+        monitor.stop()
+        recorder.record_monitor(monitor)
+    else:
+        status = solver.Solve(model)
+    recorder.record_solve(solver, status)
+    recorder.phase('diagnostics')
     if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
-        Assignment.objects.filter(shift_date__range=[start_date, end_date], member__department_id=department_id).delete()
-        new_assignments = []
-        for m in all_members:
-            for d in days:
-                for p in all_patterns:
-                    if (m.id, d, p.id) in shifts and solver.Value(shifts[(m.id, d, p.id)]) == 1:
-                        new_assignments.append(Assignment(member_id=m.id, shift_pattern_id=p.id, shift_date=d))
-        Assignment.objects.bulk_create(new_assignments)
-        
+        # 結果の保存は save_generated_assignments で行う
         infeasible_days_info = defaultdict(list)
 
         # 1. Headcount Shortfall/Surplus
@@ -412,16 +650,7 @@ def generate_schedule(department_id, start_date_str, end_date_str):
         # Check for hard constraint violation of max_headcount (should not happen if model is correct)
         for (d, t), var in actual_workers_in_slot_vars.items():
             # Find the rule for this slot to get max_headcount
-            rule_for_slot = None
-            if d in dates_with_specific_reqs:
-                day_specific_reqs = [req for req in specific_timeslot_reqs if req.date == d]
-                rule_for_slot = next((req for req in day_specific_reqs if req.start_time <= time(t // 60, t % 60) and time(t // 60, t % 60) < req.end_time), None)
-            else:
-                day_name_field = f"is_{d.strftime('%A').lower()}"
-                applicable_groups = DayGroup.objects.filter(**{day_name_field: True})
-                if applicable_groups.exists():
-                    requirements = TimeSlotRequirement.objects.filter(day_group__in=applicable_groups, department_id=department_id)
-                    rule_for_slot = next((req for req in requirements if req.start_time <= time(t // 60, t % 60) and time(t // 60, t % 60) < req.end_time), None)
+            rule_for_slot = requirement_index.rule_for(d, t)
 
             if rule_for_slot and rule_for_slot.max_headcount is not None:
                 if solver.Value(var) > rule_for_slot.max_headcount:
@@ -466,16 +695,66 @@ def generate_schedule(department_id, start_date_str, end_date_str):
         # ... (previous code for infeasible_days_info)
 
         assignments_to_create = []
-        for m in all_members:
-            for d in days:
-                for p in all_patterns:
-                    if (m.id, d, p.id) in shifts and solver.Value(shifts[(m.id, d, p.id)]) == 1:
-                        assignments_to_create.append({
-                            'member_id': m.id,
-                            'shift_pattern_id': p.id,
-                            'shift_date': d
-                        })
-
-        return {'success': True, 'infeasible_days': dict(infeasible_days_info), 'assignments': assignments_to_create}
+        for (member_id, d, pattern_id), var in shifts.items():
+            if solver.Value(var) == 1:
+                assignments_to_create.append({
+                    'member_id': member_id,
+                    'shift_pattern_id': pattern_id,
+                    'shift_date': d
+                })
+
+        result = {
+            'success': True,
+            'infeasible_days': dict(infeasible_days_info),
+            'assignments': assignments_to_create,
+        }
+        # 最適解は同じ入力なら再計算しても変わらないため、キャッシュに保存する
+        if fingerprint and status == cp_model.OPTIMAL:
+            store_result(fingerprint, department_id, start_date, end_date, result)
+        result.update(_solution_diff(assignments_to_create, previous_cells))
+        return result
     
-    return {'success': False, 'infeasible_days': {'general': ['指定された期間でシフトを生成できませんでした。制約が厳しすぎるか、人員が不足している可能性があります。']}, 'assignments': []}
\ No newline at end of file
+    return {'success': False, 'infeasible_days': {'general': ['指定された期間でシフトを生成できませんでした。制約が厳しすぎるか、人員が不足している可能性があります。']}, 'assignments': []}
+
+def save_generated_assignments(department_id, start_date, end_date, assignments_data, user):
+    """
+    ソルバーの結果を期間内の Assignment に反映し、反映後の Assignment のリストを返す。
+    既存の行と突き合わせて、解から外れた行の削除と新しく増えた行の追加だけを1つのトランザクションで行う。
+    変わらなかった行はそのまま残す。
+    """
+    target_cells = {(a['member_id'], a['shift_date'], a['shift_pattern_id']) for a in assignments_data}
+    period_assignments = Assignment.objects.filter(
+        shift_date__range=[start_date, end_date],
+        department_id=department_id
+    )
+
+    # 行ごとのシグナルでは版数を上げず、書き込み後に1回だけ上げる
+    with transaction.atomic(), department_writes():
+        kept_cells = set()
+        stale_ids = []
+        existing_rows = period_assignments.select_for_update(of=('self',)).values_list(
+            'id', 'member_id', 'shift_date', 'shift_pattern_id'
+        )
+        for assignment_id, member_id, shift_date, pattern_id in existing_rows:
+            cell = (member_id, shift_date, pattern_id)
+            # 解から外れた行と、同じセルの重複行は削除する
+            if cell in target_cells and cell not in kept_cells:
+                kept_cells.add(cell)
+            else:
+                stale_ids.append(assignment_id)
+
+        if stale_ids:
+            Assignment.objects.filter(id__in=stale_ids).delete()
+
+        new_assignments = [
+            Assignment(
+                member_id=member_id, department_id=department_id, shift_pattern_id=pattern_id, shift_date=shift_date,
+                created_by=user
+            )
+            for member_id, shift_date, pattern_id in target_cells - kept_cells
+        ]
+        if new_assignments:
+            Assignment.objects.bulk_create(new_assignments)
+            record_bulk_created(new_assignments)
+
+    return list(period_assignments.select_related('member', 'shift_pattern').order_by('shift_date', 'member_id'))
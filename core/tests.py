@@ -1,3 +1,1356 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import time as pytime
+import zipfile
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from importlib.util import find_spec
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from openpyxl import load_workbook
+from ortools.sat.python import cp_model
+from rest_framework.test import APIClient
+
+from .benchmark import build_benchmark_department, run_benchmark_case
+from .coverage import SlotCoverage
+from .management.commands.benchmark_solver import Command as BenchmarkCommand
+from .excel_export import batch_sheet_title, department_workbook_filename, write_shift_workbook
+from .export_cache import build_export, evict_export_cache, get_cached_export
+from .grid_export import iter_shift_grid
+from .earnings import pattern_minutes, period_earnings
+from .instrumentation import SolveRunRecorder
+from .serializers import AssignmentSerializer, FixedAssignmentSerializer
+from .solve_cache import input_fingerprint
+from .jobs import run_solver_job
+from .models import (
+    Department, DepartmentVersion, Member, ShiftPattern, MemberShiftPatternPreference, Assignment, FixedAssignment, LeaveRequest,
+    PaidLeave, OtherAssignment, DesignatedHoliday, SolverSettings, SolverJob, SolveRun, SpecificTimeSlotRequirement,
+    TimeSlotRequirement, ScheduleChange, ExportJob
+)
+from .solver import (
+    MAX_REPAIR_RADIUS_DAYS, MIN_REST_MINUTES, RequirementIndex, SolveMonitor, configure_solver, generate_schedule,
+    load_previous_solution, rest_conflict_table, save_generated_assignments
+)
+
+
+def create_solver_department(user, num_members=6, num_days=7):
+    """シフト生成を短時間で実行できる小さな部門を作成し、(部門, 開始日, 終了日) を返す"""
+    department, start_date, end_date = build_benchmark_department(num_members, num_days)
+    Department.objects.filter(id=department.id).update(created_by=user)
+    Member.objects.filter(department=department).update(created_by=user)
+    SolverSettings.objects.filter(department=department).update(max_time_in_seconds=10, num_search_workers=1)
+    department.refresh_from_db()
+    return department, start_date, end_date
+
+
+def expand_compact_schedule(payload):
+    """列形式 (compact) のレスポンスを通常形式の行に展開する (フロントエンドの utils/compactSchedule.js と同じ処理)"""
+    members, patterns = payload['members'], payload['patterns']
+    start_date = date.fromisoformat(payload['start_date'])
+
+    def cells_of(table, to_row):
+        return [
+            to_row(members[cell[0]], (start_date + timedelta(days=cell[1])).isoformat(), cell, i)
+            for i, cell in enumerate(table['cells'])
+        ]
+
+    def shift_row(table):
+        return lambda member, day, cell, i: {
+            'id': table['id'][i], 'shift_date': day, 'member_id': member['id'], 'member_name': member['name'],
+            'shift_pattern': patterns[cell[2]]['id'], 'shift_pattern_name': patterns[cell[2]]['pattern_name'],
+        }
+
+    return {
+        'members': members,
+        'availabilities': payload['availabilities'],
+        'earnings': payload['earnings'],
+        'assignments': cells_of(payload['assignments'], shift_row(payload['assignments'])),
+        'fixed_assignments': cells_of(payload['fixed_assignments'], shift_row(payload['fixed_assignments'])),
+        'leave_requests': cells_of(payload['leave_requests'], lambda member, day, cell, i: {
+            'leave_date': day, 'member_id': member['id'],
+        }),
+        'other_assignments': cells_of(payload['other_assignments'], lambda member, day, cell, i: {
+            'id': payload['other_assignments']['id'][i], 'member': member['id'], 'shift_date': day,
+            'activity_name': payload['other_assignments']['activity_name'][i],
+        }),
+        'designated_holidays': cells_of(payload['designated_holidays'], lambda member, day, cell, i: {
+            'id': payload['designated_holidays']['id'][i], 'member': member['id'], 'date': day,
+        }),
+        'paid_leaves': cells_of(payload['paid_leaves'], lambda member, day, cell, i: {
+            'id': payload['paid_leaves']['id'][i], 'member': member['id'], 'date': day,
+            'hours': payload['paid_leaves']['hours'][i],
+        }),
+    }
+
+
+class ScheduleDataQueryCountTests(TestCase):
+    """/schedule-data/ のクエリ数が従業員数・日数に依存しないことを確認する"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='manager', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_department(self, name, num_members, num_days):
+        department = Department.objects.create(name=name, created_by=self.user)
+        day_shift = ShiftPattern.objects.create(
+            department=department, pattern_name='日勤', start_time=time(9, 0), end_time=time(18, 0), created_by=self.user
+        )
+        night_shift = ShiftPattern.objects.create(
+            department=department, pattern_name='夜勤', start_time=time(22, 0), end_time=time(7, 0), created_by=self.user
+        )
+        start_date = date(2025, 8, 1)
+        for i in range(num_members):
+            member = Member.objects.create(
+                department=department, name=f'{name}-{i}', hourly_wage=1200, created_by=self.user
+            )
+            MemberShiftPatternPreference.objects.create(member=member, shift_pattern=day_shift, priority=1)
+            MemberShiftPatternPreference.objects.create(member=member, shift_pattern=night_shift, priority=2)
+            for offset in range(num_days):
+                d = start_date + timedelta(days=offset)
+                if offset % 7 == 5:
+                    LeaveRequest.objects.create(member=member, leave_date=d, status='approved', created_by=self.user)
+                elif offset % 7 == 6:
+                    PaidLeave.objects.create(member=member, date=d, created_by=self.user)
+                elif offset % 7 == 4:
+                    OtherAssignment.objects.create(member=member, shift_date=d, activity_name='研修', created_by=self.user)
+                elif offset % 7 == 3:
+                    DesignatedHoliday.objects.create(member=member, date=d, created_by=self.user)
+                elif offset % 7 == 0:
+                    FixedAssignment.objects.create(member=member, shift_pattern=day_shift, shift_date=d, created_by=self.user)
+                else:
+                    pattern = night_shift if i % 2 else day_shift
+                    Assignment.objects.create(member=member, shift_pattern=pattern, shift_date=d, created_by=self.user)
+        return department, start_date, start_date + timedelta(days=num_days - 1)
+
+    def count_queries(self, department, start_date, end_date):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/v1/schedule-data/', {
+                'department_id': department.id,
+                'start_date': start_date.isoformat(),
+                'end_date': end_date.isoformat(),
+            })
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response.json()
+
+    def test_query_count_does_not_grow_with_members_and_days(self):
+        small_queries, small = self.count_queries(*self.create_department('small', 2, 7))
+        large_queries, large = self.count_queries(*self.create_department('large', 20, 31))
+
+        self.assertEqual(len(large['members']), 20)
+        self.assertGreater(len(large['assignments']), len(small['assignments']))
+        self.assertEqual(set(large['earnings']), {str(m['id']) for m in large['members']})
+        self.assertEqual(small_queries, large_queries)
+        # レスポンスの組み立て (版数を含めて12) と ETag 用の版数の取得 (1)
+        self.assertLessEqual(large_queries, 13)
+
+    def test_shift_rows_match_serializers(self):
+        department, start_date, end_date = self.create_department('serializer', 2, 7)
+        schedule = self.count_queries(department, start_date, end_date)[1]
+
+        for key, model, serializer_class in (
+            ('assignments', Assignment, AssignmentSerializer),
+            ('fixed_assignments', FixedAssignment, FixedAssignmentSerializer),
+        ):
+            expected = serializer_class(model.objects.filter(department=department), many=True).data
+            rows = sorted(schedule[key], key=lambda row: row['id'])
+            # キーの順序も含めて同じ JSON になる
+            expected = sorted(expected, key=lambda row: row['id'])
+            self.assertEqual([list(row.items()) for row in rows], [list(row.items()) for row in expected])
+
+    def get_schedule(self, department, start_date, end_date, **extra):
+        response = self.client.get('/api/v1/schedule-data/', {
+            'department_id': department.id, 'start_date': start_date.isoformat(), 'end_date': end_date.isoformat(),
+        }, **extra)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_compact_format_is_selected_by_query_or_accept_header(self):
+        department, start_date, end_date = self.create_department('compact', 2, 7)
+        self.assertNotIn('format', self.get_schedule(department, start_date, end_date).json())
+
+        response = self.client.get('/api/v1/schedule-data/', {
+            'department_id': department.id, 'start_date': start_date.isoformat(), 'end_date': end_date.isoformat(),
+            'format': 'compact',
+        })
+        self.assertEqual(response.json()['format'], 'compact')
+        response = self.get_schedule(department, start_date, end_date, HTTP_ACCEPT='application/vnd.shift.compact+json')
+        self.assertTrue(response['Content-Type'].startswith('application/vnd.shift.compact+json'))
+        self.assertEqual(response.json()['format'], 'compact')
+
+    def test_compact_format_expands_to_default_rows(self):
+        department, start_date, end_date = self.create_department('compact', 3, 14)
+        default = self.get_schedule(department, start_date, end_date).json()
+        compact = self.get_schedule(department, start_date, end_date, HTTP_ACCEPT='application/vnd.shift.compact+json').json()
+        expanded = expand_compact_schedule(compact)
+
+        self.assertEqual(expanded['members'], default['members'])
+        self.assertEqual(expanded['availabilities'], default['availabilities'])
+        self.assertEqual(expanded['earnings'], default['earnings'])
+        for kind in ('assignments', 'fixed_assignments', 'leave_requests', 'other_assignments', 'designated_holidays', 'paid_leaves'):
+            self.assertTrue(default[kind], kind)
+            rows = sorted(expanded[kind], key=lambda row: sorted(row.items()))
+            # 列形式は画面で使う列だけを持つため、通常形式の行のうち同じ列を比べる
+            expected = sorted(({key: row[key] for key in rows[0]} for row in default[kind]), key=lambda row: sorted(row.items()))
+            self.assertEqual(rows, expected, kind)
+
+
+@skipUnless(connection.vendor == 'sqlite', '実行計画の形式は SQLite のもの')
+class PeriodIndexQueryPlanTests(TestCase):
+    """部門・期間 (・作成者) での絞り込みが、Member と結合せずに日付の範囲まで複合インデックスで検索することを確認する"""
+
+    PERIOD_MODELS = (
+        (Assignment, 'shift_date'),
+        (FixedAssignment, 'shift_date'),
+        (OtherAssignment, 'shift_date'),
+        (PaidLeave, 'date'),
+        (DesignatedHoliday, 'date'),
+        (LeaveRequest, 'leave_date'),
+    )
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='manager', password='password')
+        self.department = Department.objects.create(name='front', created_by=self.user)
+
+    def assert_period_index_used(self, model, date_field, **filters):
+        queryset = model.objects.filter(
+            department_id=self.department.id, **{f'{date_field}__range': [date(2025, 8, 1), date(2025, 8, 31)]},
+            **filters
+        )
+        plan = queryset.explain()
+        self.assertNotIn('core_member', plan, f'{model.__name__}: {plan}')
+        pattern = (
+            rf'SEARCH {model._meta.db_table} USING (COVERING )?INDEX \S+ '
+            rf'\(\w+=\? AND {date_field}>\? AND {date_field}<\?\)'
+        )
+        self.assertRegex(plan, pattern, f'{model.__name__}: {plan}')
+
+    def test_department_period_queries_use_composite_indexes(self):
+        for model, date_field in self.PERIOD_MODELS:
+            with self.subTest(model=model.__name__):
+                self.assert_period_index_used(model, date_field)
+
+    def test_department_user_period_queries_use_composite_indexes(self):
+        for model, date_field in self.PERIOD_MODELS:
+            with self.subTest(model=model.__name__):
+                self.assert_period_index_used(model, date_field, created_by=self.user)
+
+
+class SolverJobRunTests(TransactionTestCase):
+    """
+    ワーカーなしでシフト生成ジョブを登録すると、その場で実行されて結果が保存されることを確認する。
+    探索中は監視スレッドが進捗をDBに書き込むため、テストのトランザクションの外で実行する。
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='manager', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @override_settings(SOLVER_JOB_WORKERS=0)
+    def test_job_runs_inline_without_workers(self):
+        department, start_date, end_date = create_solver_department(self.user)
+        response = self.client.post('/api/v1/solver-jobs/', {
+            'department_id': department.id,
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+        }, format='json')
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'succeeded')
+        job = SolverJob.objects.get(id=response.json()['id'])
+        self.assertTrue(job.result['success'])
+        self.assertEqual(len(job.result['assignments']), Assignment.objects.filter(department=department).count())
+        self.assertGreater(len(job.result['assignments']), 0)
+        # 監視スレッドが進捗の保存・打ち切り要求の確認で発行したクエリは別に記録する
+        run = SolveRun.objects.get(department=department)
+        self.assertEqual(run.status, 'OPTIMAL')
+        self.assertGreater(run.phases['solve']['monitor_queries'], 0)
+        self.assertEqual(run.phases['solve']['queries'], 0)
+
+
+class SolverJobTests(TestCase):
+    """シフト生成ジョブの打ち切り・放置されたジョブの扱いを確認する"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='manager', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_generate_shifts_enqueues_a_job(self):
+        department, start_date, end_date = create_solver_department(self.user)
+        with mock.patch('core.views.enqueue_solver_job') as enqueue, mock.patch('core.solver.generate_schedule') as solve:
+            response = self.client.post('/api/v1/generate-shifts/', {
+                'department_id': department.id, 'start_date': start_date.isoformat(), 'end_date': end_date.isoformat(),
+            }, format='json')
+
+        self.assertEqual(response.status_code, 202)
+        job = SolverJob.objects.get(id=response.json()['id'])
+        self.assertEqual(job.status, 'queued')
+        enqueue.assert_called_once_with(job)
+        solve.assert_not_called()
+
+    def test_stop_request_is_passed_to_solver(self):
+        department, start_date, end_date = create_solver_department(self.user)
+        job = SolverJob.objects.create(
+            department=department, start_date=start_date, end_date=end_date, stop_requested=True, created_by=self.user
+        )
+        seen = []
+
+        def fake_generate_schedule(*args, should_stop, **kwargs):
+            seen.append(should_stop())
+            return {'success': False, 'message': 'stopped'}
+
+        with mock.patch('core.solver.generate_schedule', side_effect=fake_generate_schedule):
+            run_solver_job(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual(seen, [True])
+        self.assertEqual(job.status, 'succeeded')
+
+    def test_monitor_stops_search_when_requested(self):
+        solver = mock.Mock()
+        with mock.patch.object(SolveMonitor, 'POLL_INTERVAL', 0.01):
+            monitor = SolveMonitor(solver, should_stop=lambda: True)
+            # 解が見つかるまでは打ち切らない
+            monitor._finished.wait(0.05)
+            solver.StopSearch.assert_not_called()
+            monitor.last_improvement = 0
+            for _ in range(100):
+                if solver.StopSearch.called:
+                    break
+                monitor._finished.wait(0.01)
+            monitor.stop()
+        solver.StopSearch.assert_called_once()
+
+    def test_stop_view_requires_running_job(self):
+        department, start_date, end_date = create_solver_department(self.user)
+        job = SolverJob.objects.create(
+            department=department, start_date=start_date, end_date=end_date, status='running',
+            started_at=timezone.now(), created_by=self.user
+        )
+        response = self.client.post(f'/api/v1/solver-jobs/{job.id}/stop/')
+        self.assertEqual(response.status_code, 202)
+        job.refresh_from_db()
+        self.assertTrue(job.stop_requested)
+
+        SolverJob.objects.filter(id=job.id).update(status='succeeded')
+        response = self.client.post(f'/api/v1/solver-jobs/{job.id}/stop/')
+        self.assertEqual(response.status_code, 409)
+
+    def test_detail_long_polls_for_new_progress(self):
+        department, start_date, end_date = create_solver_department(self.user)
+        job = SolverJob.objects.create(
+            department=department, start_date=start_date, end_date=end_date, status='running',
+            started_at=timezone.now(), progress=[{'objective': 1, 'bound': 9, 'wall_time': 0.5}], created_by=self.user
+        )
+        event = {'objective': 2, 'bound': 9, 'wall_time': 1.0}
+
+        def worker_reports_progress(seconds):
+            SolverJob.objects.filter(id=job.id).update(progress=[*job.progress, event])
+
+        with mock.patch('core.views.sleep', side_effect=worker_reports_progress) as sleep:
+            # 受け取っていない進捗があればすぐに返す
+            response = self.client.get(f'/api/v1/solver-jobs/{job.id}/', {'since': 0, 'wait': 5})
+            self.assertEqual(len(response.json()['progress']), 1)
+            sleep.assert_not_called()
+            # なければ新しい進捗が届くまで待つ
+            response = self.client.get(f'/api/v1/solver-jobs/{job.id}/', {'since': 1, 'wait': 5})
+            self.assertEqual(response.json()['progress'][-1], event)
+            self.assertEqual(sleep.call_count, 1)
+
+    def test_detail_long_poll_times_out(self):
+        department, start_date, end_date = create_solver_department(self.user)
+        job = SolverJob.objects.create(department=department, start_date=start_date, end_date=end_date, created_by=self.user)
+        with mock.patch('core.views.sleep') as sleep:
+            response = self.client.get(f'/api/v1/solver-jobs/{job.id}/', {'since': 0, 'wait': 0})
+        self.assertEqual(response.json()['status'], 'queued')
+        sleep.assert_not_called()
+
+    @override_settings(SOLVER_JOB_TIMEOUT_SECONDS=60)
+    def test_stale_jobs_are_marked_failed(self):
+        department, start_date, end_date = create_solver_department(self.user)
+        old = timezone.now() - timedelta(minutes=5)
+        stale = SolverJob.objects.create(department=department, start_date=start_date, end_date=end_date, created_by=self.user)
+        SolverJob.objects.filter(id=stale.id).update(created_at=old)
+        running = SolverJob.objects.create(
+            department=department, start_date=start_date, end_date=end_date, status='running', started_at=old,
+            created_by=self.user
+        )
+        fresh = SolverJob.objects.create(department=department, start_date=start_date, end_date=end_date, created_by=self.user)
+
+        for job in (stale, running):
+            response = self.client.get(f'/api/v1/solver-jobs/{job.id}/')
+            self.assertEqual(response.json()['status'], 'failed')
+            self.assertTrue(response.json()['error_message'])
+        self.assertEqual(self.client.get(f'/api/v1/solver-jobs/{fresh.id}/').json()['status'], 'queued')
+
+
+class SolverTests(TestCase):
+    """generate_schedule が作るモデルと生成結果を、小さな部門で確認する"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='manager', password='password')
+        cls.department, cls.start_date, cls.end_date = create_solver_department(cls.user)
+        cls.members = list(Member.objects.filter(department=cls.department).order_by('id'))
+
+    def generate(self, **kwargs):
+        result = generate_schedule(self.department.id, self.start_date.isoformat(), self.end_date.isoformat(), **kwargs)
+        self.assertTrue(result['success'])
+        return result
+
+    def test_no_shift_on_blocked_days_or_disallowed_patterns(self):
+        member = self.members[0]
+        days = [self.start_date + timedelta(days=i) for i in range(3)]
+        LeaveRequest.objects.filter(member=member, leave_date__in=days).delete()
+        FixedAssignment.objects.filter(member=member, shift_date__in=days).delete()
+        PaidLeave.objects.create(member=member, date=days[0], created_by=self.user)
+        DesignatedHoliday.objects.create(member=member, date=days[1], created_by=self.user)
+        OtherAssignment.objects.create(member=member, shift_date=days[2], activity_name='研修', created_by=self.user)
+
+        result = self.generate()
+
+        allowed = defaultdict(set)
+        for member_id, pattern_id in MemberShiftPatternPreference.objects.values_list('member_id', 'shift_pattern_id'):
+            allowed[member_id].add(pattern_id)
+        blocked = {(member.id, d) for d in days} | set(
+            LeaveRequest.objects.filter(department=self.department, status='approved').values_list('member_id', 'leave_date')
+        )
+        cells = [(a['member_id'], a['shift_date']) for a in result['assignments']]
+        self.assertEqual(len(cells), len(set(cells)))
+        for assign in result['assignments']:
+            self.assertIn(assign['shift_pattern_id'], allowed[assign['member_id']])
+            self.assertNotIn((assign['member_id'], assign['shift_date']), blocked)
+        fixed_cells = set(FixedAssignment.objects.filter(department=self.department).values_list('member_id', 'shift_date', 'shift_pattern_id'))
+        self.assertTrue(fixed_cells)
+        self.assertLessEqual(
+            fixed_cells, {(a['member_id'], a['shift_date'], a['shift_pattern_id']) for a in result['assignments']}
+        )
+
+    def test_rest_conflict_table(self):
+        patterns = {p.pattern_name: p.id for p in ShiftPattern.objects.filter(department=self.department)}
+        conflicts = rest_conflict_table(tuple(
+            (p.id, p.start_time, p.end_time) for p in ShiftPattern.objects.filter(department=self.department).order_by('id')
+        ))
+        # 夜勤 (22:00-7:00) の翌日は 15:00 より前に始まるシフトに入れない。他のパターンの後は8時間以上空く
+        self.assertEqual(
+            {p1: set(p2s) for p1, p2s in conflicts.items()},
+            {patterns['夜勤']: {patterns['早番'], patterns['日勤'], patterns['遅番']}},
+        )
+
+    def test_generated_shifts_keep_minimum_rest(self):
+        result = self.generate()
+        patterns = {p.id: p for p in ShiftPattern.objects.filter(department=self.department)}
+        cells = {(a['member_id'], a['shift_date']): patterns[a['shift_pattern_id']] for a in result['assignments']}
+        checked = 0
+        for (member_id, d), p1 in cells.items():
+            p2 = cells.get((member_id, d + timedelta(days=1)))
+            if p2 is None:
+                continue
+            end = datetime.combine(d + timedelta(days=1) if p1.end_time < p1.start_time else d, p1.end_time)
+            start = datetime.combine(d + timedelta(days=1), p2.start_time)
+            self.assertGreaterEqual(start - end, timedelta(minutes=MIN_REST_MINUTES))
+            checked += 1
+        self.assertGreater(checked, 0)
+
+    def test_requirement_index_lookup(self):
+        monday, tuesday, saturday = self.start_date, self.start_date + timedelta(days=1), self.start_date + timedelta(days=5)
+        specific = SpecificTimeSlotRequirement.objects.create(
+            department=self.department, date=tuesday, start_time=time(10, 0), end_time=time(12, 0),
+            min_headcount=3, max_headcount=4
+        )
+        # 曜日のルールは1回のクエリでまとめて読み込む
+        with self.assertNumQueries(1):
+            index = RequirementIndex(self.department.id, [specific], {tuesday})
+
+        self.assertEqual(index.rule_for(monday, 10 * 60).min_headcount, 2)
+        self.assertEqual(index.rule_for(monday, 23 * 60 + 30).start_time, time(22, 0))
+        self.assertEqual(index.rule_for(saturday, 10 * 60).min_headcount, 1)
+        # 特定日の設定がある日は、曜日のルールを使わない
+        self.assertEqual(index.rule_for(tuesday, 10 * 60 + 30), specific)
+        self.assertIsNone(index.rule_for(tuesday, 8 * 60))
+        self.assertEqual([t for t, _ in index.slot_rules(tuesday)], [600, 630, 660, 690])
+
+    def test_previous_solution_falls_back_to_last_job(self):
+        member = self.members[0]
+        pattern = MemberShiftPatternPreference.objects.filter(member=member).first().shift_pattern
+        SolverJob.objects.create(
+            department=self.department, start_date=self.start_date, end_date=self.end_date, status='succeeded',
+            finished_at=timezone.now(), created_by=self.user,
+            result={'assignments': [{'member_id': member.id, 'shift_date': self.start_date.isoformat(), 'shift_pattern': pattern.id}]},
+        )
+        self.assertEqual(
+            load_previous_solution(self.department.id, self.start_date, self.end_date),
+            {(member.id, self.start_date, pattern.id)},
+        )
+
+        # Assignment がある場合はそちらを使う
+        other_day = self.start_date + timedelta(days=1)
+        Assignment.objects.create(member=member, shift_pattern=pattern, shift_date=other_day, created_by=self.user)
+        self.assertEqual(
+            load_previous_solution(self.department.id, self.start_date, self.end_date),
+            {(member.id, other_day, pattern.id)},
+        )
+
+    def test_warm_start_reports_diff_from_existing_assignments(self):
+        cold = self.generate(warm_start=False)
+        self.assertFalse(cold['warm_started'])
+
+        # 既存の割り当てを1セルだけ外し、前回の解として使われることを確認する
+        previous = cold['assignments'][1:]
+        Assignment.objects.bulk_create(
+            Assignment(member_id=a['member_id'], shift_pattern_id=a['shift_pattern_id'], shift_date=a['shift_date'])
+            for a in previous
+        )
+        with mock.patch('core.solver.get_cached_result', return_value=None):
+            warm = self.generate()
+
+        self.assertTrue(warm['warm_started'])
+        previous_cells = {(a['member_id'], a['shift_date'], a['shift_pattern_id']) for a in previous}
+        new_cells = {(a['member_id'], a['shift_date'], a['shift_pattern_id']) for a in warm['assignments']}
+        added = {(a['member_id'], a['shift_date'], a['shift_pattern_id']) for a in warm['diff']['added']}
+        removed = {(a['member_id'], a['shift_date'], a['shift_pattern_id']) for a in warm['diff']['removed']}
+        self.assertEqual(added, new_cells - previous_cells)
+        self.assertEqual(removed, previous_cells - new_cells)
+        self.assertEqual(warm['changed_cells'], len(added) + len(removed))
+
+    def test_repair_keeps_cells_outside_window(self):
+        cold = self.generate(warm_start=False)
+        save_generated_assignments(self.department.id, self.start_date, self.end_date, cold['assignments'], self.user)
+        changed_day = self.start_date + timedelta(days=3)
+        worked = next(a for a in cold['assignments'] if a['shift_date'] == changed_day)
+        PaidLeave.objects.create(member_id=worked['member_id'], date=changed_day, created_by=self.user)
+
+        window = (changed_day - timedelta(days=1), changed_day + timedelta(days=1))
+        result = self.generate(repair_window=window)
+
+        def outside(assignments):
+            return {
+                (a['member_id'], a['shift_date'], a['shift_pattern_id'])
+                for a in assignments if not window[0] <= a['shift_date'] <= window[1]
+            }
+        self.assertEqual(outside(result['assignments']), outside(cold['assignments']))
+        self.assertNotIn(
+            (worked['member_id'], changed_day), {(a['member_id'], a['shift_date']) for a in result['assignments']}
+        )
+
+    def test_configure_solver_applies_engine_settings(self):
+        settings = SolverSettings(
+            num_search_workers=4, relative_gap_limit=0.01, random_seed=7, linearization_level=2
+        )
+        solver = cp_model.CpSolver()
+        configure_solver(solver, settings, 12.5)
+
+        self.assertEqual(solver.parameters.max_time_in_seconds, 12.5)
+        self.assertEqual(solver.parameters.num_workers, 4)
+        self.assertAlmostEqual(solver.parameters.relative_gap_limit, 0.01)
+        self.assertEqual(solver.parameters.random_seed, 7)
+        self.assertEqual(solver.parameters.linearization_level, 2)
+
+    def test_solve_uses_department_time_limit(self):
+        SolverSettings.objects.filter(department=self.department).update(max_time_in_seconds=3, num_search_workers=2)
+        with mock.patch('core.solver.configure_solver', wraps=configure_solver) as configure:
+            self.generate()
+        solver_settings, time_limit = configure.call_args.args[1:]
+        self.assertEqual(time_limit, 3)
+        self.assertEqual(solver_settings.num_search_workers, 2)
+
+    def test_save_generated_assignments_writes_only_the_diff(self):
+        member_a, member_b = self.members[:2]
+        pattern_a = MemberShiftPatternPreference.objects.filter(member=member_a).first().shift_pattern
+        pattern_b = MemberShiftPatternPreference.objects.filter(member=member_b).first().shift_pattern
+        day0, day1 = self.start_date, self.start_date + timedelta(days=1)
+        kept = Assignment.objects.create(member=member_a, shift_pattern=pattern_a, shift_date=day0)
+        duplicate = Assignment.objects.create(member=member_a, shift_pattern=pattern_a, shift_date=day0)
+        removed = Assignment.objects.create(member=member_b, shift_pattern=pattern_b, shift_date=day0)
+        outside = Assignment.objects.create(member=member_b, shift_pattern=pattern_b, shift_date=self.end_date + timedelta(days=1))
+
+        saved = save_generated_assignments(self.department.id, self.start_date, self.end_date, [
+            {'member_id': member_a.id, 'shift_pattern_id': pattern_a.id, 'shift_date': day0},
+            {'member_id': member_b.id, 'shift_pattern_id': pattern_b.id, 'shift_date': day1},
+        ], self.user)
+
+        self.assertEqual(
+            [(a.member_id, a.shift_date, a.shift_pattern_id) for a in saved],
+            [(member_a.id, day0, pattern_a.id), (member_b.id, day1, pattern_b.id)],
+        )
+        # 変わらなかった行はそのまま残し、解から外れた行と重複行だけを削除する
+        self.assertEqual(saved[0].id, kept.id)
+        self.assertFalse(Assignment.objects.filter(id__in=[duplicate.id, removed.id]).exists())
+        self.assertTrue(Assignment.objects.filter(id=outside.id).exists())
+        self.assertEqual(saved[1].department_id, self.department.id)
+
+    def test_optimal_result_is_cached_until_inputs_change(self):
+        first = self.generate()
+        self.assertFalse(first.get('cached'))
+        second = self.generate()
+        self.assertTrue(second['cached'])
+        self.assertEqual(
+            sorted((a['member_id'], a['shift_date'], a['shift_pattern_id']) for a in second['assignments']),
+            sorted((a['member_id'], a['shift_date'], a['shift_pattern_id']) for a in first['assignments']),
+        )
+
+        solver_settings = SolverSettings.objects.get(department=self.department, is_default=True)
+        fingerprint = input_fingerprint(self.department.id, self.start_date, self.end_date, solver_settings)
+        LeaveRequest.objects.create(
+            member=self.members[0], leave_date=self.end_date, status='pending', created_by=self.user
+        )
+        # 承認されていない希望休はソルバーが読まないため、キャッシュのキーも変わらない
+        self.assertEqual(input_fingerprint(self.department.id, self.start_date, self.end_date, solver_settings), fingerprint)
+        PaidLeave.objects.create(member=self.members[0], date=self.end_date, created_by=self.user)
+        self.assertNotEqual(input_fingerprint(self.department.id, self.start_date, self.end_date, solver_settings), fingerprint)
+        self.assertFalse(self.generate().get('cached'))
+
+    def test_solve_run_is_recorded_per_phase(self):
+        self.generate()
+        run = SolveRun.objects.get(department=self.department)
+        self.assertEqual(set(run.phases), {'load', 'variables', 'constraints', 'solve', 'diagnostics'})
+        self.assertEqual(run.total_queries, sum(phase['queries'] for phase in run.phases.values()))
+        self.assertGreater(run.num_variables, 0)
+        self.assertIn('num_conflicts', run.solver_stats)
+
+    def test_recorder_failure_does_not_lose_result(self):
+        with mock.patch.object(SolveRun.objects, 'create', side_effect=RuntimeError('disk full')):
+            with self.assertLogs('core.instrumentation', 'ERROR'):
+                with SolveRunRecorder(self.department.id, self.start_date.isoformat(), self.end_date.isoformat()) as recorder:
+                    recorder.record_cached()
+
+
+
+class EarningsTests(TestCase):
+    """給与見込みを、深夜割増を含めて手計算した値と比べる"""
+
+    def test_period_earnings(self):
+        user = get_user_model().objects.create_user(username='manager', password='password')
+        department = Department.objects.create(name='earnings', created_by=user)
+        day_shift = ShiftPattern.objects.create(
+            department=department, pattern_name='日勤', start_time=time(9, 0), end_time=time(18, 0), break_minutes=60
+        )
+        night_shift = ShiftPattern.objects.create(
+            department=department, pattern_name='夜勤', start_time=time(22, 0), end_time=time(7, 0), break_minutes=60
+        )
+        hourly = Member.objects.create(department=department, name='時給', employee_type='hourly', hourly_wage=1200)
+        salaried = Member.objects.create(department=department, name='月給', employee_type='salaried', monthly_salary=300000)
+        day = date(2025, 9, 1)
+        for offset, pattern in enumerate((day_shift, day_shift, night_shift)):
+            Assignment.objects.create(member=hourly, shift_pattern=pattern, shift_date=day + timedelta(days=offset))
+            Assignment.objects.create(member=salaried, shift_pattern=pattern, shift_date=day + timedelta(days=offset))
+        PaidLeave.objects.create(member=hourly, date=day + timedelta(days=3), hours=8)
+
+        # 夜勤は拘束9時間のうち 22:00-5:00 の7時間が深夜割増、休憩1時間は通常の勤務時間から引く
+        self.assertEqual(pattern_minutes(time(22, 0), time(7, 0), 60), (60, 420))
+        earnings = period_earnings(
+            Assignment.objects.filter(department=department), PaidLeave.objects.filter(department=department)
+        )
+        # 日勤 8時間×2 + 夜勤 (1時間 + 7時間×1.25) + 有給 8時間
+        self.assertEqual(earnings, {hourly.id: 1200 * 16 + 1200 + 10500 + 1200 * 8})
+
+
+class SlotCoverageTests(SimpleTestCase):
+    """シフトパターン × 時間帯の被覆行列による人数の集計を、手計算した値と比べる"""
+
+    def setUp(self):
+        self.early = ShiftPattern(id=1, pattern_name='早番', start_time=time(7, 0), end_time=time(16, 0))
+        self.night = ShiftPattern(id=2, pattern_name='夜勤', start_time=time(22, 0), end_time=time(7, 0))
+        # グリッドからずれた開始時刻は直前の時間帯に丸める (9:15-10:00 は 9:00 の1枠)
+        self.short = ShiftPattern(id=3, pattern_name='短時間', start_time=time(9, 15), end_time=time(10, 0))
+        self.day0 = date(2025, 9, 1)
+        self.day1 = date(2025, 9, 2)
+        self.coverage = SlotCoverage([self.early, self.night, self.short], self.day0, self.day1)
+
+    def test_counts(self):
+        counts = self.coverage.counts([
+            (self.day0, 1), (self.day0, 1), (self.day0, 2), (self.day1, 2), (self.day1, 3),
+        ])
+
+        expected = [[0] * 48 for _ in range(2)]
+        for day, first, last, headcount in (
+            (0, 14, 32, 2),  # 早番 2人: 7:00-16:00
+            (0, 44, 48, 1),  # 1日目の夜勤: 22:00-24:00
+            (1, 0, 14, 1),   # 1日目の夜勤の翌日分: 0:00-7:00
+            (1, 44, 48, 1),  # 2日目の夜勤 (翌日分は期間外)
+            (1, 18, 19, 1),  # 短時間
+        ):
+            for slot in range(first, last):
+                expected[day][slot] += headcount
+        self.assertEqual(counts.shape, (2, 48))
+        self.assertEqual(counts.tolist(), expected)
+
+    def test_group(self):
+        grouped = self.coverage.group([(self.day0, 2, 'a'), (self.day1, 1, 'b')])
+        self.assertEqual(grouped[(self.day1, 7 * 60)], ['b'])
+        self.assertEqual(grouped[(self.day1, 0)], ['a'])
+        self.assertEqual(grouped[(self.day0, 22 * 60)], ['a'])
+        self.assertEqual(len(grouped), 4 + 14 + 18)
+
+
+class RepairShiftViewTests(TestCase):
+    """/repair-shifts/ の入力の検証と、再最適化する期間の計算を確認する"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='manager', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.department = Department.objects.create(name='repair', created_by=self.user)
+
+    def post(self, **data):
+        return self.client.post('/api/v1/repair-shifts/', {
+            'department_id': self.department.id, 'start_date': '2025-08-01', 'end_date': '2025-10-31',
+            'shift_date': '2025-09-15', **data,
+        }, format='json')
+
+    def test_rejects_negative_radius_and_date_outside_period(self):
+        self.assertEqual(self.post(radius_days=-1).status_code, 400)
+        self.assertEqual(self.post(radius_days='x').status_code, 400)
+        self.assertEqual(self.post(shift_date='2025-11-01').status_code, 400)
+
+    def test_caps_large_radius(self):
+        with mock.patch('core.views.generate_schedule', return_value={'success': False}) as generate:
+            self.assertEqual(self.post(radius_days=1000).status_code, 200)
+        self.assertEqual(generate.call_args.kwargs['repair_window'], (
+            date(2025, 9, 15) - timedelta(days=MAX_REPAIR_RADIUS_DAYS),
+            date(2025, 9, 15) + timedelta(days=MAX_REPAIR_RADIUS_DAYS),
+        ))
+
+
+class ConditionalGetTests(TestCase):
+    """部門の版数から作る ETag と If-None-Match による 304 を確認する"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='manager', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.department = Department.objects.create(name='A', created_by=self.user)
+        self.other_department = Department.objects.create(name='B', created_by=self.user)
+        self.pattern = ShiftPattern.objects.create(
+            department=self.department, pattern_name='日勤', start_time=time(9, 0), end_time=time(18, 0), created_by=self.user
+        )
+        self.member = Member.objects.create(department=self.department, name='従業員', hourly_wage=1200, created_by=self.user)
+        self.params = {'department_id': self.department.id, 'start_date': '2025-09-01', 'end_date': '2025-09-30'}
+
+    def get(self, url, params, etag=None):
+        return self.client.get(url, params, **({'HTTP_IF_NONE_MATCH': etag} if etag else {}))
+
+    def test_not_modified_until_department_changes(self):
+        response = self.get('/api/v1/schedule-data/', self.params)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.get('/api/v1/schedule-data/', self.params, etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        # 304 の場合はレスポンスを組み立てない (版数の取得だけ)
+        self.assertEqual(len(context.captured_queries), 1)
+
+        # 他の部門の変更では変わらない
+        Member.objects.create(department=self.other_department, name='他部門', created_by=self.user)
+        self.assertEqual(self.get('/api/v1/schedule-data/', self.params, etag).status_code, 304)
+
+        Assignment.objects.create(member=self.member, shift_pattern=self.pattern, shift_date=date(2025, 9, 1), created_by=self.user)
+        response = self.get('/api/v1/schedule-data/', self.params, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()['assignments']), 1)
+
+    def test_etag_depends_on_format(self):
+        etag = self.get('/api/v1/schedule-data/', self.params)['ETag']
+        response = self.get('/api/v1/schedule-data/', {**self.params, 'format': 'compact'}, etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_member_move_changes_both_departments(self):
+        old_etag = self.get('/api/v1/schedule-data/', self.params)['ETag']
+        new_params = {**self.params, 'department_id': self.other_department.id}
+        new_etag = self.get('/api/v1/schedule-data/', new_params)['ETag']
+        members_etag = self.get('/api/v1/members/', {'department_id': self.department.id})['ETag']
+        versions = dict(DepartmentVersion.objects.values_list('department_id', 'version'))
+
+        member = Member.objects.get(id=self.member.id)
+        member.department = self.other_department
+        member.save()
+
+        new_versions = dict(DepartmentVersion.objects.values_list('department_id', 'version'))
+        self.assertGreater(new_versions[self.department.id], versions[self.department.id])
+        self.assertGreater(new_versions[self.other_department.id], versions[self.other_department.id])
+        self.assertEqual(self.get('/api/v1/schedule-data/', self.params, old_etag).status_code, 200)
+        self.assertEqual(self.get('/api/v1/schedule-data/', new_params, new_etag).status_code, 200)
+        response = self.get('/api/v1/members/', {'department_id': self.department.id}, members_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+
+
+class ScheduleChangesTests(TestCase):
+    """セルの変更履歴と /schedule-data/changes/ による差分同期を確認する"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='manager', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.department = Department.objects.create(name='A', created_by=self.user)
+        self.other_department = Department.objects.create(name='B', created_by=self.user)
+        self.pattern = ShiftPattern.objects.create(
+            department=self.department, pattern_name='日勤', start_time=time(9, 0), end_time=time(18, 0), created_by=self.user
+        )
+        self.member = Member.objects.create(department=self.department, name='従業員1', hourly_wage=1200, created_by=self.user)
+        self.member2 = Member.objects.create(department=self.department, name='従業員2', hourly_wage=1200, created_by=self.user)
+        self.outsider = Member.objects.create(department=self.other_department, name='他部門', created_by=self.user)
+
+    def version(self, department=None):
+        return DepartmentVersion.objects.get(department=department or self.department).version
+
+    def changes(self, since, department=None):
+        response = self.client.get('/api/v1/schedule-data/changes/', {
+            'department_id': (department or self.department).id, 'since': since,
+            'start_date': '2025-09-01', 'end_date': '2025-09-30',
+        })
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_insert_and_delete(self):
+        since = self.version()
+        assignment = Assignment.objects.create(
+            member=self.member, shift_pattern=self.pattern, shift_date=date(2025, 9, 1), created_by=self.user
+        )
+        changes = self.changes(since)
+        self.assertFalse(changes['reload'])
+        self.assertEqual(changes['version'], since + 1)
+        self.assertEqual([row['id'] for row in changes['inserted']['assignments']], [assignment.id])
+        self.assertEqual(changes['earnings'], {str(self.member.id): 9600})
+
+        since = changes['version']
+        assignment_id = assignment.id
+        assignment.delete()
+        changes = self.changes(since)
+        self.assertEqual(changes['deleted'], {
+            'assignments': [{'id': assignment_id, 'member_id': self.member.id, 'date': '2025-09-01'}],
+        })
+        self.assertEqual(self.changes(changes['version'])['inserted'], {})
+
+    def test_update_deletes_the_previous_cell(self):
+        assignment = Assignment.objects.create(
+            member=self.member, shift_pattern=self.pattern, shift_date=date(2025, 9, 1), created_by=self.user
+        )
+        since = self.version()
+        assignment = Assignment.objects.get(id=assignment.id)
+        assignment.member = self.member2
+        assignment.shift_date = date(2025, 9, 2)
+        assignment.save()
+
+        changes = self.changes(since)
+        self.assertEqual(changes['deleted']['assignments'], [
+            {'id': assignment.id, 'member_id': self.member.id, 'date': '2025-09-01'},
+        ])
+        inserted = changes['inserted']['assignments']
+        self.assertEqual([(row['member_id'], row['shift_date']) for row in inserted], [(self.member2.id, '2025-09-02')])
+
+        # 別の部門の従業員に移した場合は、元の部門に削除、移動先の部門に追加を記録する
+        since, other_since = self.version(), self.version(self.other_department)
+        assignment.member = self.outsider
+        assignment.save()
+        self.assertEqual(self.changes(since)['deleted']['assignments'][0]['member_id'], self.member2.id)
+        self.assertEqual(
+            [row['id'] for row in self.changes(other_since, self.other_department)['inserted']['assignments']],
+            [assignment.id],
+        )
+
+    def test_each_write_gets_its_own_version(self):
+        since = self.version()
+        for day in range(1, 4):
+            Assignment.objects.create(
+                member=self.member, shift_pattern=self.pattern, shift_date=date(2025, 9, day), created_by=self.user
+            )
+        self.assertEqual(self.version(), since + 3)
+        self.assertEqual(
+            list(ScheduleChange.objects.filter(department=self.department, version__gt=since).values_list('version', flat=True)),
+            [since + 1, since + 2, since + 3],
+        )
+
+    def test_non_cell_change_requires_reload(self):
+        since = self.version()
+        self.pattern.pattern_name = '日勤A'
+        self.pattern.save()
+        changes = self.changes(since)
+        self.assertTrue(changes['reload'])
+
+        response = self.client.get('/api/v1/schedule-data/changes/', {
+            'department_id': self.department.id, 'since': changes['version'] + 1,
+            'start_date': '2025-09-01', 'end_date': '2025-09-30',
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+class CellBatchTests(TestCase):
+    """/cells/batch/ によるセル操作の一括適用を確認する"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='manager', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.department = Department.objects.create(name='A', created_by=self.user)
+        self.day_shift = ShiftPattern.objects.create(
+            department=self.department, pattern_name='日勤', start_time=time(9, 0), end_time=time(18, 0), created_by=self.user
+        )
+        self.late_shift = ShiftPattern.objects.create(
+            department=self.department, pattern_name='遅番', start_time=time(13, 0), end_time=time(22, 0), created_by=self.user
+        )
+        self.members = [
+            Member.objects.create(department=self.department, name=f'従業員{i}', hourly_wage=1200, created_by=self.user)
+            for i in range(3)
+        ]
+
+    def post(self, *operations):
+        return self.client.post('/api/v1/cells/batch/', {'operations': list(operations)}, format='json')
+
+    def test_operations_are_applied_together(self):
+        day = date(2025, 9, 1)
+        Assignment.objects.create(member=self.members[0], shift_pattern=self.day_shift, shift_date=day, created_by=self.user)
+        FixedAssignment.objects.create(member=self.members[1], shift_pattern=self.day_shift, shift_date=day, created_by=self.user)
+
+        response = self.post(
+            {'type': 'fixed', 'member_id': self.members[0].id, 'date': '2025-09-01', 'pattern_id': self.late_shift.id},
+            {'type': 'fixed', 'member_id': self.members[1].id, 'date': '2025-09-01', 'pattern_id': self.late_shift.id},
+            {'type': 'other', 'member_id': self.members[2].id, 'date': '2025-09-01', 'activity_name': '研修'},
+            {'type': 'designated_holiday', 'member_id': self.members[2].id, 'date': '2025-09-02'},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], {'fixed_assignments': 1, 'other_assignments': 1, 'designated_holidays': 1})
+        self.assertEqual(response.json()['deleted'], {'assignments': 1})
+        self.assertEqual(
+            set(FixedAssignment.objects.values_list('member_id', 'shift_pattern_id')),
+            {(self.members[0].id, self.late_shift.id), (self.members[1].id, self.late_shift.id)},
+        )
+        self.assertFalse(Assignment.objects.exists())
+
+    def test_paid_leave_clears_duplicate_rows(self):
+        day = date(2025, 9, 1)
+        member = self.members[0]
+        # Assignment と LeaveRequest は (従業員, 日付) が一意でないため、同じセルに複数の行がありうる
+        for pattern in (self.day_shift, self.day_shift, self.late_shift):
+            Assignment.objects.create(member=member, shift_pattern=pattern, shift_date=day, created_by=self.user)
+        for status in ('approved', 'pending'):
+            LeaveRequest.objects.create(member=member, leave_date=day, status=status, created_by=self.user)
+        kept = Assignment.objects.create(member=member, shift_pattern=self.day_shift, shift_date=day + timedelta(days=1))
+
+        response = self.post({'type': 'paid_leave', 'member_id': member.id, 'date': '2025-09-01'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['deleted'], {'assignments': 3, 'leave_requests': 2})
+        self.assertEqual(list(Assignment.objects.values_list('id', flat=True)), [kept.id])
+        self.assertFalse(LeaveRequest.objects.exists())
+        self.assertEqual(list(PaidLeave.objects.values_list('member_id', 'date')), [(member.id, day)])
+
+    def test_query_count_does_not_grow_with_cells(self):
+        def count_queries(days):
+            operations = [
+                {'type': 'assignment', 'member_id': member.id, 'date': (date(2025, 9, 1) + timedelta(days=d)).isoformat(),
+                 'pattern_id': self.day_shift.id}
+                for member in self.members for d in days
+            ]
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(self.post(*operations).status_code, 200)
+            return len(context.captured_queries)
+
+        self.assertEqual(count_queries(range(0, 2)), count_queries(range(10, 30)))
+
+    def test_rejects_other_users_members_and_patterns(self):
+        other_user = get_user_model().objects.create_user(username='other', password='password')
+        other_department = Department.objects.create(name='B', created_by=other_user)
+        outsider = Member.objects.create(department=other_department, name='他ユーザー', created_by=other_user)
+        other_pattern = ShiftPattern.objects.create(
+            department=other_department, pattern_name='日勤', start_time=time(9, 0), end_time=time(18, 0)
+        )
+
+        response = self.post({'type': 'paid_leave', 'member_id': outsider.id, 'date': '2025-09-01'})
+        self.assertEqual(response.status_code, 403)
+        response = self.post({'type': 'assignment', 'member_id': self.members[0].id, 'date': '2025-09-01', 'pattern_id': other_pattern.id})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.post().status_code, 400)
+        self.assertEqual(self.post({'type': 'unknown', 'member_id': self.members[0].id, 'date': '2025-09-01'}).status_code, 400)
+        self.assertFalse(PaidLeave.objects.exists())
+        self.assertFalse(Assignment.objects.exists())
+
+
+class ShiftWorkbookTests(SimpleTestCase):
+    """書き込み専用モードで作成したシフト表のブックの内容と書式を確認する"""
+
+    def test_labels_widths_and_weekend_styles(self):
+        # 2025-09-05 は金曜日、09-06 は土曜日、09-07 は日曜日
+        dates = [date(2025, 9, 5), date(2025, 9, 6), date(2025, 9, 7)]
+        rows = [('山田', ['日勤', '/', '午前研修と午後会議']), ('長い名前の従業員', ['有', '❌', '/'])]
+        file = BytesIO()
+        write_shift_workbook(file, [('2025年09月 シフト表', dates, rows)])
+
+        wb = load_workbook(BytesIO(file.getvalue()))
+        self.assertEqual(wb.sheetnames, ['2025年09月 シフト表'])
+        ws = wb.active
+        self.assertEqual(
+            [[cell.value for cell in row] for row in ws.iter_rows()],
+            [['従業員名', '05日(Fri)', '06日(Sat)', '07日(Sun)'], ['山田', '日勤', '/', '午前研修と午後会議'], ['長い名前の従業員', '有', '❌', '/']],
+        )
+        self.assertAlmostEqual(ws.column_dimensions['A'].width, len('長い名前の従業員') + 5)
+        self.assertAlmostEqual(ws.column_dimensions['B'].width, len('05日(Fri)') * 1.2 + 2)
+        self.assertAlmostEqual(ws.column_dimensions['D'].width, len('午前研修と午後会議') * 1.2 + 2)
+
+        for row in ws.iter_rows():
+            self.assertEqual([cell.border.left.style for cell in row], ['thin'] * 4)
+            self.assertEqual(row[0].font.bold, row[0].row == 1)
+            self.assertIsNone(row[1].fill.fill_type)
+            self.assertEqual(row[2].fill.start_color.rgb, '00ADD8E6')
+            self.assertEqual(row[3].fill.start_color.rgb, '00FFC0CB')
+
+
+class ExportCacheTests(TestCase):
+    """Excel ファイルのキャッシュの利用・作り直しと、容量・有効期間による削除を確認する"""
+
+    def setUp(self):
+        self.cache_dir = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.enterContext(override_settings(EXPORT_CACHE_DIR=self.cache_dir))
+        self.user = get_user_model().objects.create_user(username='manager', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.department = Department.objects.create(name='A', created_by=self.user)
+        self.pattern = ShiftPattern.objects.create(
+            department=self.department, pattern_name='日勤', start_time=time(9, 0), end_time=time(18, 0), created_by=self.user
+        )
+        self.member = Member.objects.create(department=self.department, name='山田', created_by=self.user)
+
+    def export(self):
+        return self.client.get('/api/v1/shifts/export/', {
+            'department_id': self.department.id, 'start_date': '2025-09-01', 'end_date': '2025-09-30',
+        })
+
+    def test_cache_is_used_until_department_version_changes(self):
+        with mock.patch('core.views.build_export', wraps=build_export) as build:
+            self.assertEqual(self.export().status_code, 200)
+            self.assertEqual(self.export().status_code, 200)
+            self.assertEqual(build.call_count, 1)
+
+            Assignment.objects.create(
+                member=self.member, shift_pattern=self.pattern, shift_date=date(2025, 9, 1), created_by=self.user
+            )
+            response = self.export()
+            self.assertEqual(build.call_count, 2)
+
+        ws = load_workbook(BytesIO(b''.join(response.streaming_content))).active
+        self.assertEqual([cell.value for cell in ws[2]][:3], ['山田', '日勤', '/'])
+        self.assertEqual(len(list(self.cache_dir.glob('*.xlsx'))), 2)
+
+    def write_cache_file(self, name, size, age):
+        path = self.cache_dir / name
+        path.write_bytes(b'x' * size)
+        mtime = pytime.time() - age
+        os.utime(path, (mtime, mtime))
+        return path
+
+    @override_settings(EXPORT_CACHE_MAX_BYTES=250)
+    def test_least_recently_used_files_are_evicted_over_size_limit(self):
+        oldest = self.write_cache_file('a.xlsx', 100, age=30)
+        older = self.write_cache_file('b.xlsx', 100, age=20)
+        newest = self.write_cache_file('c.zip', 100, age=10)
+        # 使ったファイルは更新日時が新しくなり、削除の対象から外れる
+        self.assertEqual(get_cached_export('a'), oldest)
+
+        evict_export_cache()
+
+        self.assertTrue(oldest.exists())
+        self.assertFalse(older.exists())
+        self.assertTrue(newest.exists())
+
+    @override_settings(EXPORT_CACHE_TTL_SECONDS=600)
+    def test_expired_files_are_evicted(self):
+        expired = self.write_cache_file('a.xlsx', 10, age=700)
+        # 書き込み途中で残った一時ファイルも有効期間を過ぎれば削除する
+        leftover = self.write_cache_file('b.tmp', 10, age=700)
+        fresh = self.write_cache_file('c.xlsx', 10, age=60)
+
+        evict_export_cache()
+
+        self.assertFalse(expired.exists())
+        self.assertFalse(leftover.exists())
+        self.assertTrue(fresh.exists())
+        self.assertIsNone(get_cached_export('a'))
+
+
+class ExportJobTests(TestCase):
+    """エクスポートジョブの状態の確認とダウンロードを確認する"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='manager', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.department = Department.objects.create(name='A', created_by=self.user)
+
+    @override_settings(EXPORT_JOB_TIMEOUT_SECONDS=60)
+    def test_stale_jobs_are_marked_failed(self):
+        old = timezone.now() - timedelta(minutes=5)
+        stale, running, fresh = [
+            ExportJob.objects.create(
+                department=self.department, start_date=date(2025, 9, 1), end_date=date(2025, 9, 30), cache_key=str(i),
+                created_by=self.user
+            )
+            for i in range(3)
+        ]
+        ExportJob.objects.filter(id=stale.id).update(created_at=old)
+        ExportJob.objects.filter(id=running.id).update(status='running', started_at=old)
+
+        self.assertEqual(self.client.get(f'/api/v1/export-jobs/{stale.id}/').json()['status'], 'failed')
+        self.assertEqual(self.client.get(f'/api/v1/export-jobs/{running.id}/download/').status_code, 500)
+        self.assertEqual(self.client.get(f'/api/v1/export-jobs/{fresh.id}/download/').status_code, 202)
+
+
+@override_settings(EXPORT_JOB_WORKERS=0, EXPORT_WORKBOOK_PROCESSES=0)
+class BatchExportTests(TestCase):
+    """複数部門・複数月の一括エクスポートの出力形式を確認する"""
+
+    def setUp(self):
+        self.enterContext(override_settings(EXPORT_CACHE_DIR=Path(self.enterContext(tempfile.TemporaryDirectory()))))
+        self.user = get_user_model().objects.create_user(username='manager', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.long_name = '営業/本社第一課' + 'あ' * 30
+        self.departments = [
+            Department.objects.create(name=name, created_by=self.user) for name in ('A', self.long_name)
+        ]
+        pattern = ShiftPattern.objects.create(
+            department=self.departments[0], pattern_name='日勤', start_time=time(9, 0), end_time=time(18, 0), created_by=self.user
+        )
+        member = Member.objects.create(department=self.departments[0], name='山田', created_by=self.user)
+        Assignment.objects.create(member=member, shift_pattern=pattern, shift_date=date(2025, 10, 1), created_by=self.user)
+
+    def download(self, layout):
+        response = self.client.post('/api/v1/export-jobs/batch/', {
+            'start_date': '2025-09-15', 'end_date': '2025-10-05', 'layout': layout,
+        }, format='json')
+        self.assertEqual(response.json()['status'], 'succeeded')
+        response = self.client.get(f"/api/v1/export-jobs/{response.json()['id']}/download/")
+        self.assertEqual(response.status_code, 200)
+        return BytesIO(b''.join(response.streaming_content))
+
+    def test_sheet_title_is_sanitized_and_truncated(self):
+        title = batch_sheet_title(self.long_name, date(2025, 9, 1))
+        self.assertEqual(len(title), 31)
+        self.assertTrue(title.startswith('営業_本社第一課あ'))
+        self.assertTrue(title.endswith(' 2025年09月'))
+        self.assertEqual(batch_sheet_title('A', date(2025, 10, 1)), 'A 2025年10月')
+
+    def test_workbook_layout_has_a_sheet_per_department_and_month(self):
+        wb = load_workbook(self.download('workbook'))
+
+        self.assertEqual(wb.sheetnames, [
+            'A 2025年09月', 'A 2025年10月',
+            batch_sheet_title(self.long_name, date(2025, 9, 1)), batch_sheet_title(self.long_name, date(2025, 10, 1)),
+        ])
+        september, october = wb['A 2025年09月'], wb['A 2025年10月']
+        self.assertEqual(september.max_column, 1 + 16)
+        self.assertEqual(september['B1'].value, '15日(Mon)')
+        self.assertEqual([cell.value for cell in october[2]], ['山田', '日勤', '/', '/', '/', '/'])
+
+    def test_zip_layout_has_a_workbook_per_department(self):
+        with zipfile.ZipFile(self.download('zip')) as archive:
+            names = archive.namelist()
+            self.assertEqual(names, [
+                department_workbook_filename(department.id, department.name, date(2025, 9, 15), date(2025, 10, 5))
+                for department in self.departments
+            ])
+            wb = load_workbook(BytesIO(archive.read(names[0])))
+
+        self.assertEqual(wb.sheetnames, ['A 2025年09月', 'A 2025年10月'])
+        self.assertEqual(wb['A 2025年10月']['B2'].value, '日勤')
+
+
+class GridExportTests(TestCase):
+    """書式のない従業員×日付の表 (csv・jsonl) の出力と、各日の表示の決め方を確認する"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='manager', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.department = Department.objects.create(name='A', created_by=self.user)
+        self.pattern = ShiftPattern.objects.create(
+            department=self.department, pattern_name='日勤', start_time=time(9, 0), end_time=time(18, 0), created_by=self.user
+        )
+        self.first = Member.objects.create(
+            department=self.department, name='山田', hourly_wage=1000, sort_order=1, created_by=self.user
+        )
+        # 同じ部門にある他のユーザーの従業員。並び順では2人の間に来る
+        other_user = get_user_model().objects.create_user(username='other', password='password')
+        self.outsider = Member.objects.create(department=self.department, name='他ユーザー', sort_order=2, created_by=other_user)
+        self.second = Member.objects.create(department=self.department, name='鈴木', sort_order=3, created_by=self.user)
+
+        days = [date(2025, 9, 1) + timedelta(days=i) for i in range(7)]
+        for day in (days[0], days[1], days[5]):
+            Assignment.objects.create(member=self.first, shift_pattern=self.pattern, shift_date=day, created_by=self.user)
+        for day in (days[1], days[2]):
+            OtherAssignment.objects.create(member=self.first, shift_date=day, activity_name='研修', created_by=self.user)
+        for day in (days[2], days[3]):
+            PaidLeave.objects.create(member=self.first, date=day, created_by=self.user)
+        for day in (days[3], days[4]):
+            DesignatedHoliday.objects.create(member=self.first, date=day, created_by=self.user)
+        LeaveRequest.objects.create(member=self.first, leave_date=days[4], status='approved', created_by=self.user)
+        LeaveRequest.objects.create(member=self.first, leave_date=days[5], status='pending', created_by=self.user)
+        for member in (self.outsider, self.second):
+            Assignment.objects.create(member=member, shift_pattern=self.pattern, shift_date=days[6], created_by=self.user)
+
+    def export(self, export_format):
+        response = self.client.get('/api/v1/shifts/export/', {
+            'department_id': self.department.id, 'start_date': '2025-09-01', 'end_date': '2025-09-07', 'format': export_format,
+        })
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_labels_follow_precedence_and_skip_members_not_listed(self):
+        rows = list(iter_shift_grid(self.user, self.department.id, date(2025, 9, 1), date(2025, 9, 7)))
+
+        # 日勤 3日分 (8時間×1000円) と有給 2日分 (8時間×1000円)
+        self.assertEqual(rows[0], [self.first.id, '山田', 40000, '日勤', '研修', '有', '/', '❌', '日勤', '/'])
+        self.assertEqual(rows[1], [self.second.id, '鈴木', None, '/', '/', '/', '/', '/', '/', '日勤'])
+        self.assertEqual(len(rows), 2)
+
+    def test_csv(self):
+        response, content = self.export('csv')
+
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('shift_schedule_202509.csv', response['Content-Disposition'])
+        lines = content.splitlines()
+        self.assertEqual(lines[0], 'member_id,member_name,earnings,' + ','.join(f'2025-09-0{d}' for d in range(1, 8)))
+        self.assertEqual(lines[1:], [
+            f'{self.first.id},山田,40000,日勤,研修,有,/,❌,日勤,/',
+            f'{self.second.id},鈴木,,/,/,/,/,/,/,日勤',
+        ])
+
+    def test_jsonl(self):
+        response, content = self.export('jsonl')
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['member_name'] for row in rows], ['山田', '鈴木'])
+        self.assertEqual(rows[0]['earnings'], 40000)
+        self.assertEqual(rows[0]['2025-09-05'], '❌')
+        self.assertIsNone(rows[1]['earnings'])
+        self.assertEqual(rows[1]['2025-09-07'], '日勤')
+
+    @skipUnless(find_spec('pyarrow'), 'pyarrow がインストールされていない')
+    def test_parquet(self):
+        import pyarrow.parquet as pq
+
+        response = self.client.get('/api/v1/shifts/export/', {
+            'department_id': self.department.id, 'start_date': '2025-09-01', 'end_date': '2025-09-07', 'format': 'parquet',
+        })
+
+        self.assertEqual(response.status_code, 200)
+        table = pq.read_table(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(table.column('member_name').to_pylist(), ['山田', '鈴木'])
+        self.assertEqual(table.column('earnings').to_pylist(), [40000, None])
+        self.assertEqual(table.column('2025-09-05').to_pylist(), ['❌', '/'])
+
+
+class BenchmarkReportTests(SimpleTestCase):
+    """benchmark_solver コマンドのベースラインとの比較を確認する"""
+
+    def result(self, **values):
+        return {
+            'time_limit': 300.0, 'workers': 1, 'status': 'OPTIMAL', 'num_variables': 100, 'num_constraints': 200, 'build_seconds': 1.0,
+            'solve_seconds': 10.0, 'objective': -1000.0, 'gap': 0.0, 'shortfall': 5, **values,
+        }
+
+    def report(self, results, baseline, tolerance=0.2):
+        stdout = StringIO()
+        regressions = BenchmarkCommand(stdout=stdout).report(results, baseline, tolerance)
+        return regressions, stdout.getvalue()
+
+    def test_unchanged_results_are_not_regressions(self):
+        regressions, output = self.report({'10x7': self.result(solve_seconds=11.0)}, {'10x7': self.result()})
+        self.assertEqual(regressions, [])
+        self.assertIn('solve +10%', output)
+
+    def test_slower_solve_beyond_tolerance_is_flagged(self):
+        regressions, _ = self.report(
+            {'10x7': self.result(build_seconds=1.3, solve_seconds=12.5)}, {'10x7': self.result()}
+        )
+        self.assertEqual(regressions, ['10x7 build_seconds', '10x7 solve_seconds'])
+
+    def test_worse_objective_and_shortfall_are_flagged(self):
+        regressions, output = self.report({'10x7': self.result(objective=-1500.0, shortfall=7)}, {'10x7': self.result()})
+        self.assertEqual(regressions, ['10x7 objective', '10x7 shortfall'])
+        self.assertIn('objective -500', output)
+        self.assertIn('shortfall +2', output)
+
+    def test_missing_values_are_not_compared(self):
+        baseline = {'10x7': self.result(status='UNKNOWN', objective=None, gap=None, shortfall=None)}
+        regressions, _ = self.report({'10x7': self.result()}, baseline)
+        self.assertEqual(regressions, [])
+
+        # 今回の結果が解なしの場合も比較しない
+        unsolved = self.result(status='UNKNOWN', solve_seconds=None, objective=None, gap=None, shortfall=None)
+        regressions, output = self.report({'10x7': unsolved}, {'10x7': self.result()})
+        self.assertEqual(regressions, [])
+        self.assertIn('UNKNOWN', output)
+
+    def test_results_under_other_conditions_are_not_compared(self):
+        regressions, output = self.report(
+            {'10x7': self.result(time_limit=30.0, workers=8, solve_seconds=30.0, objective=-2000.0)}, {'10x7': self.result()}
+        )
+        self.assertEqual(regressions, [])
+        self.assertIn('実行条件が異なる (time_limit=300.0, workers=1)', output)
+
+    def test_case_without_baseline(self):
+        regressions, output = self.report({'50x7': self.result()}, {'10x7': self.result()})
+        self.assertEqual(regressions, [])
+        self.assertIn('ベースラインなし', output.splitlines()[1])
+
+
+class BenchmarkCaseTests(TestCase):
+    """run_benchmark_case の人数不足の集計を、生成結果から直接数えた値と比べる"""
+
+    WEEKDAY_FIELDS = ('is_monday', 'is_tuesday', 'is_wednesday', 'is_thursday', 'is_friday', 'is_saturday', 'is_sunday')
+
+    def test_shortfall_matches_hand_count(self):
+        results = []
+
+        def solve(*args, **kwargs):
+            results.append(generate_schedule(*args, **kwargs))
+            return results[-1]
+
+        with mock.patch('core.benchmark.generate_schedule', side_effect=solve):
+            case = run_benchmark_case(10, 7, time_limit=5, workers=1)
+
+        self.assertIn(case['status'], ('OPTIMAL', 'FEASIBLE'))
+        self.assertEqual((case['time_limit'], case['workers']), (5, 1))
+        self.assertTrue(results[0]['success'])
+        department = Department.objects.get(name='ベンチマーク 10x7')
+        patterns = {p.id: p for p in ShiftPattern.objects.filter(department=department)}
+        requirements = list(TimeSlotRequirement.objects.filter(department=department).select_related('day_group'))
+
+        def minutes(t):
+            return t.hour * 60 + t.minute
+
+        def works_at(assignment, d, t):
+            """勤務日 d の t 分 (0時から) に、このシフトで勤務しているか (夜勤は前日の勤務日から続く)"""
+            pattern = patterns[assignment['shift_pattern_id']]
+            start, end = minutes(pattern.start_time), minutes(pattern.end_time)
+            if end < start:
+                end += 24 * 60
+            offset = (d - assignment['shift_date']).days * 24 * 60
+            return start <= t + offset < end
+
+        expected = 0
+        for day_offset in range(7):
+            d = date(2025, 9, 1) + timedelta(days=day_offset)
+            for t in range(0, 24 * 60, 30):
+                for requirement in requirements:
+                    if (getattr(requirement.day_group, self.WEEKDAY_FIELDS[d.weekday()])
+                            and minutes(requirement.start_time) <= t < minutes(requirement.end_time)):
+                        working = sum(works_at(a, d, t) for a in results[0]['assignments'])
+                        expected += max(0, requirement.min_headcount - working)
+
+        self.assertEqual(case['shortfall'], expected)
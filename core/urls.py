@@ -3,7 +3,9 @@ from .views import (
     MemberListView, 
     GenerateShiftView, 
     ScheduleDataView, 
+    ScheduleChangesView,
     ShiftPatternListView,
+    CellBatchView,
     ManualAssignmentView,
     OtherAssignmentView,
     DepartmentListView,
@@ -16,6 +18,15 @@ from .views import (
     BulkAssignmentDeleteView,
     BulkFixedAssignmentDeleteView,
     ShiftExportExcelView,
+    SolverJobCreateView,
+    SolverJobDetailView,
+    SolverJobResultView,
+    RepairShiftView,
+    SolverJobStopView,
+    ExportJobCreateView,
+    ExportJobBatchCreateView,
+    ExportJobDetailView,
+    ExportJobDownloadView,
 )
 
 urlpatterns = [
@@ -24,7 +35,10 @@ urlpatterns = [
     path('members/', MemberListView.as_view(), name='member-list'),
     path('shift-patterns/', ShiftPatternListView.as_view(), name='shift-pattern-list'),
     path('schedule-data/', ScheduleDataView.as_view(), name='schedule-data'),
+    path('schedule-data/changes/', ScheduleChangesView.as_view(), name='schedule-data-changes'),
     path('generate-shifts/', GenerateShiftView.as_view(), name='generate-shifts'),
+    path('repair-shifts/', RepairShiftView.as_view(), name='repair-shifts'),
+    path('cells/batch/', CellBatchView.as_view(), name='cell-batch'),
     path('manual-assignment/', ManualAssignmentView.as_view(), name='manual-assignment'),
     path('other-assignment/', OtherAssignmentView.as_view(), name='other-assignment'),
     path('bulk-fixed-assignments/', BulkFixedAssignmentView.as_view(), name='bulk-fixed-assignments'),
@@ -36,4 +50,12 @@ urlpatterns = [
     path('bulk-delete-assignments/', BulkAssignmentDeleteView.as_view(), name='bulk-delete-assignments'),
     path('bulk-delete-fixed-assignments/', BulkFixedAssignmentDeleteView.as_view(), name='bulk-delete-fixed-assignments'),
     path('shifts/export/', ShiftExportExcelView.as_view(), name='shift-export-excel'),
+    path('solver-jobs/', SolverJobCreateView.as_view(), name='solver-job-create'),
+    path('solver-jobs/<int:pk>/', SolverJobDetailView.as_view(), name='solver-job-detail'),
+    path('solver-jobs/<int:pk>/result/', SolverJobResultView.as_view(), name='solver-job-result'),
+    path('solver-jobs/<int:pk>/stop/', SolverJobStopView.as_view(), name='solver-job-stop'),
+    path('export-jobs/', ExportJobCreateView.as_view(), name='export-job-create'),
+    path('export-jobs/batch/', ExportJobBatchCreateView.as_view(), name='export-job-batch-create'),
+    path('export-jobs/<int:pk>/', ExportJobDetailView.as_view(), name='export-job-detail'),
+    path('export-jobs/<int:pk>/download/', ExportJobDownloadView.as_view(), name='export-job-download'),
 ]
\ No newline at end of file
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import (
+    Department, DepartmentVersion, Member, ScheduleChange, Assignment, FixedAssignment, OtherAssignment, PaidLeave,
+    DesignatedHoliday, LeaveRequest
+)
+
+# シフト表のセルになるモデル: (変更履歴の種類, 日付のフィールド)
+CELL_MODELS = {
+    Assignment: ('assignments', 'shift_date'),
+    FixedAssignment: ('fixed_assignments', 'shift_date'),
+    OtherAssignment: ('other_assignments', 'shift_date'),
+    PaidLeave: ('paid_leaves', 'date'),
+    DesignatedHoliday: ('designated_holidays', 'date'),
+    LeaveRequest: ('leave_requests', 'leave_date'),
+}
+
+_state = threading.local()
+
+
+def _pending():
+    """department_writes() の中で溜めている、部門ごとの未反映の変更"""
+    if not getattr(_state, 'depth', 0):
+        return None
+    return _state.pending
+
+
+def _flush(pending):
+    """
+    部門ごとに版数を1つ上げ、上げた後の版数でセルの変更履歴を保存する。
+    同時に書き込んだ2つのリクエストが同じ版数を使わないよう、版数の行をロックしてから読み、
+    版数と履歴を同じトランザクションで保存する。
+    """
+    deleting = getattr(_state, 'deleting_departments', set())
+    for department_id, changes in pending.items():
+        if department_id is None or department_id in deleting:
+            continue
+        with transaction.atomic():
+            version = (
+                DepartmentVersion.objects.select_for_update().filter(department_id=department_id)
+                .values_list('version', flat=True).first()
+            )
+            if version is None:
+                continue
+            version += 1
+            DepartmentVersion.objects.filter(department_id=department_id).update(version=version)
+            if changes is None:
+                # セル以外の変更を含む版数には履歴を残さない (差分同期のクライアントは全件を再取得する)
+                continue
+            ScheduleChange.objects.bulk_create(
+                ScheduleChange(department_id=department_id, version=version, **change) for change in changes
+            )
+            if version % 100 == 0:
+                ScheduleChange.objects.filter(
+                    department_id=department_id, version__lte=version - settings.SCHEDULE_CHANGE_MAX_VERSIONS
+                ).delete()
+
+
+@contextmanager
+def department_writes(*department_ids):
+    """
+    複数行の書き込みを囲み、部門の版数をブロックの終了時に1回だけ上げる。
+    ブロック内のシグナルによる版数の更新と変更履歴はまとめて反映する。
+    一括更新などシグナルが送られないセル以外の書き込みは、対象の部門を引数で指定する。
+    シグナルが送られないセルの追加・削除は record_cell_change() で記録する。
+    ブロックが例外で終わった場合は何もしない (書き込みと同じトランザクションで使う)。
+    """
+    if not getattr(_state, 'depth', 0):
+        _state.pending = {}
+        _state.member_departments = {}
+    _state.depth = getattr(_state, 'depth', 0) + 1
+    try:
+        for department_id in department_ids:
+            bump_department_version(department_id)
+        yield
+    except BaseException:
+        _state.depth -= 1
+        if not _state.depth:
+            _state.pending = {}
+        raise
+    _state.depth -= 1
+    if not _state.depth:
+        pending, _state.pending = _state.pending, {}
+        _flush(pending)
+
+
+def set_department_deleting(department_id, deleting):
+    """部門の削除中は、連鎖して削除される行があっても版数と変更履歴を更新しない"""
+    if not hasattr(_state, 'deleting_departments'):
+        _state.deleting_departments = set()
+    if deleting:
+        _state.deleting_departments.add(department_id)
+    else:
+        _state.deleting_departments.discard(department_id)
+
+
+def bump_department_version(department_id):
+    """セル以外のデータの変更として部門の版数を上げる"""
+    with department_writes():
+        _pending()[department_id] = None
+
+
+def record_cell_change(department_id, kind, action, object_id, member_id, date):
+    """シフト表のセルの追加・削除を記録し、部門の版数を上げる"""
+    with department_writes():
+        pending = _pending()
+        changes = pending.setdefault(department_id, [])
+        if changes is not None:
+            changes.append({
+                'kind': kind, 'action': action, 'object_id': object_id, 'member_id': member_id, 'date': date
+            })
+
+
+def record_bulk_created(objects):
+    """bulk_create はシグナルを送らないため、作成したセルを各行の部門の変更履歴に直接記録する"""
+    for obj in objects:
+        if obj.pk is None:
+            # 作成した行の ID が返らないデータベースでは、差分同期のクライアントに全件を再取得させる
+            bump_department_version(obj.department_id)
+            continue
+        kind, date_field = CELL_MODELS[type(obj)]
+        record_cell_change(obj.department_id, kind, 'insert', obj.pk, obj.member_id, getattr(obj, date_field))
+
+
+def atomic_department_writes(view_func):
+    """書き込みのビューを1つのトランザクションで実行し、部門の版数と変更履歴を終了時にまとめて反映する"""
+    @wraps(view_func)
+    def wrapper(*args, **kwargs):
+        with transaction.atomic(), department_writes():
+            return view_func(*args, **kwargs)
+    return wrapper
+
+
+def member_department_id(member_id):
+    """従業員の部門IDを返す。department_writes() の中では同じ従業員を2回問い合わせない"""
+    cache = getattr(_state, 'member_departments', None) if getattr(_state, 'depth', 0) else None
+    if cache is not None and member_id in cache:
+        return cache[member_id]
+    department_id = Member.objects.filter(id=member_id).values_list('department_id', flat=True).first()
+    if cache is not None:
+        cache[member_id] = department_id
+    return department_id
+
+
+def department_etag(view_func):
+    """
+    GET のレスポンスに、部門の版数から作った強い ETag を付ける。
+    If-None-Match が一致する場合は、レスポンスを組み立てずに 304 を返す。
+    対象の部門は department_id (クエリパラメータまたはURL) で、指定がなければログインユーザーの全部門。
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        departments = Department.objects.filter(created_by=request.user)
+        department_id = request.query_params.get('department_id') or kwargs.get('department_id')
+        if department_id:
+            departments = departments.filter(id=department_id)
+        versions = list(departments.order_by('id').values_list('id', 'version__version'))
+
+        key = [request.user.pk, request.get_full_path(), request.accepted_renderer.media_type, versions]
+        etag = '"%s"' % hashlib.sha1(json.dumps(key).encode()).hexdigest()
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = view_func(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        response['ETag'] = etag
+        # ブラウザのキャッシュに保存させ、毎回 If-None-Match で再検証させる
+        response['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(response, ['Authorization'])
+        return response
+    return wrapper
@@ -6,12 +6,27 @@ from .forms import SignUpForm
 from rest_framework import generics, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.settings import api_settings
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.decorators import method_decorator
 from datetime import date, datetime, time, timedelta
 from collections import defaultdict
-
-from .models import Member, Assignment, LeaveRequest, MemberAvailability, ShiftPattern, OtherAssignment, TimeSlotRequirement, FixedAssignment, Department, DesignatedHoliday, SolverSettings, PaidLeave
-from .serializers import MemberSerializer, AssignmentSerializer, MemberAvailabilitySerializer, ShiftPatternSerializer, OtherAssignmentSerializer, FixedAssignmentSerializer, DepartmentSerializer, DesignatedHolidaySerializer, SolverSettingsSerializer, PaidLeaveSerializer
-from .solver import generate_schedule
+from time import monotonic, sleep
+import json
+
+from .models import Member, Assignment, LeaveRequest, MemberAvailability, ShiftPattern, OtherAssignment, TimeSlotRequirement, FixedAssignment, Department, DesignatedHoliday, SolverSettings, PaidLeave, SolverJob, ExportJob
+from .serializers import MemberSerializer, MemberAvailabilitySerializer, ShiftPatternSerializer, OtherAssignmentSerializer, FixedAssignmentSerializer, DepartmentSerializer, DesignatedHolidaySerializer, SolverSettingsSerializer, PaidLeaveSerializer, SolverJobSerializer, ExportJobSerializer
+from .solver import generate_schedule, save_generated_assignments, REPAIR_RADIUS_DAYS, MAX_REPAIR_RADIUS_DAYS
+from .jobs import enqueue_solver_job, enqueue_export_job, fail_stale_jobs
+from .excel_export import XLSX_CONTENT_TYPE, ZIP_CONTENT_TYPE, batch_export_filename, export_filename
+from .grid_export import CSV_CONTENT_TYPE, JSONL_CONTENT_TYPE, PARQUET_CONTENT_TYPE, iter_csv, iter_jsonl, iter_shift_grid, write_parquet
+from .export_cache import batch_export_key, build_export, export_key, get_cached_export
+from .cell_edits import CellOperationError, apply_cell_operations
+from .versioning import department_etag, atomic_department_writes, record_cell_change
+from .schedule_payload import build_schedule_payload, build_compact_schedule_payload, build_schedule_changes, department_version
 
 def signup(request):
     if request.method == 'POST':
@@ -45,14 +60,25 @@ class UserFilteredListView(generics.ListAPIView):
         """Associate the object with the logged-in user upon creation."""
         serializer.save(created_by=self.request.user)
 
+@method_decorator(department_etag, name='get')
 class DepartmentListView(UserFilteredListView):
     queryset = Department.objects.all().order_by('name')
     serializer_class = DepartmentSerializer
 
+@method_decorator(department_etag, name='get')
 class MemberListView(UserFilteredListView):
-    queryset = Member.objects.all().order_by('sort_order', 'name')
+    queryset = Member.objects.all().order_by('sort_order', 'name').prefetch_related('membershiftpatternpreference_set')
     serializer_class = MemberSerializer
 
+    def get_queryset(self):
+        """department_id が指定された場合は、その部門の従業員に絞り込む (ETag もその部門の版数で作る)"""
+        queryset = super().get_queryset()
+        department_id = self.request.query_params.get('department_id')
+        if department_id is not None:
+            queryset = queryset.filter(department_id=department_id)
+        return queryset
+
+@method_decorator(department_etag, name='get')
 class ShiftPatternListView(UserFilteredListView):
     serializer_class = ShiftPatternSerializer
     queryset = ShiftPattern.objects.all()
@@ -65,212 +91,214 @@ class ShiftPatternListView(UserFilteredListView):
             queryset = queryset.filter(department_id=department_id)
         return queryset
 
+class CompactScheduleRenderer(JSONRenderer):
+    """スケジュールデータの列形式 (compact) を選ぶためのレンダラー。中身は通常のJSON"""
+    media_type = 'application/vnd.shift.compact+json'
+    format = 'compact'
+
+@method_decorator(department_etag, name='get')
 class ScheduleDataView(APIView):
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, CompactScheduleRenderer]
+
     def get(self, request, *args, **kwargs):
         department_id = self.request.query_params.get('department_id')
         start_date_str = self.request.query_params.get('start_date')
         end_date_str = self.request.query_params.get('end_date')
-        
-        # Filter by the logged-in user
-        user = self.request.user
-        members_queryset = Member.objects.filter(created_by=user)
-        shift_patterns_queryset = ShiftPattern.objects.filter(created_by=user)
 
-        if department_id:
-            members_queryset = members_queryset.filter(department_id=department_id)
-            shift_patterns_queryset = shift_patterns_queryset.filter(department_id=department_id)
+        start_date = date.fromisoformat(start_date_str) if start_date_str else None
+        end_date = date.fromisoformat(end_date_str) if end_date_str else None
+        # ?format=compact または Accept: application/vnd.shift.compact+json で列形式を返す
+        if request.accepted_renderer.format == CompactScheduleRenderer.format:
+            return Response(build_compact_schedule_payload(self.request.user, department_id, start_date, end_date))
+        return Response(build_schedule_payload(self.request.user, department_id, start_date, end_date))
 
-        members = members_queryset.order_by('sort_order', 'name')
-        member_serializer = MemberSerializer(members, many=True)
+class ScheduleChangesView(APIView):
+    """/schedule-data/ の version (または前回の changes の version) 以降に変わったセルだけを返す"""
+    def get(self, request, *args, **kwargs):
+        department_id = request.query_params.get('department_id')
+        try:
+            since = int(request.query_params['since'])
+            start_date = date.fromisoformat(request.query_params['start_date'])
+            end_date = date.fromisoformat(request.query_params['end_date'])
+        except (KeyError, ValueError):
+            return Response({'error': 'since, start_date and end_date are required'}, status=status.HTTP_400_BAD_REQUEST)
+        if not Department.objects.filter(id=department_id, created_by=request.user).exists():
+            return Response(status=status.HTTP_404_NOT_FOUND)
 
-        if not start_date_str or not end_date_str:
-            return Response({
-                'members': member_serializer.data,
-                'assignments': [], 'leave_requests': [], 'availabilities': [],
-                'other_assignments': [], 'earnings': {},
-                'fixed_assignments': [], 'designated_holidays': [], 'paid_leaves': [],
-            })
-
-        start_date = date.fromisoformat(start_date_str)
-        end_date = date.fromisoformat(end_date_str)
-
-        # Filter all data by the logged-in user
-        assignments = Assignment.objects.filter(
-            shift_date__range=[start_date, end_date],
-            member__department_id=department_id,
-            created_by=user
-        ).select_related('member', 'shift_pattern')
-        assignment_serializer = AssignmentSerializer(assignments, many=True)
-
-        fixed_assignments = FixedAssignment.objects.filter(
-            shift_date__range=[start_date, end_date],
-            member__department_id=department_id,
-            created_by=user
-        ).select_related('member', 'shift_pattern')
-        fixed_assignment_serializer = FixedAssignmentSerializer(fixed_assignments, many=True)
-
-        leave_requests = LeaveRequest.objects.filter(
-            status='approved', 
-            leave_date__range=[start_date, end_date],
-            member__department_id=department_id,
-            created_by=user
-        )
-        leave_data = [{'leave_date': str(req.leave_date), 'member_id': req.member.id} for req in leave_requests]
-        
-        availabilities = MemberAvailability.objects.filter(
-            member__department_id=department_id,
-            created_by=user
-        )
-        availability_serializer = MemberAvailabilitySerializer(availabilities, many=True)
+        payload = build_schedule_changes(request.user, department_id, since, start_date, end_date)
+        if payload is None:
+            return Response({'error': 'since is newer than the current version'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(payload)
 
-        other_assignments = OtherAssignment.objects.filter(
-            shift_date__range=[start_date, end_date],
-            member__department_id=department_id,
-            created_by=user
-        )
-        other_serializer = OtherAssignmentSerializer(other_assignments, many=True)
+class RepairShiftView(APIView):
+    """手動変更のあと、変更日の前後だけを再最適化して差分を返す"""
+    def post(self, request, *args, **kwargs):
+        department_id = request.data.get('department_id')
+        start_date_str = request.data.get('start_date')
+        end_date_str = request.data.get('end_date')
+        shift_date_str = request.data.get('shift_date')
+        if not all([department_id, start_date_str, end_date_str, shift_date_str]):
+            return Response({'error': 'department_id, start_date, end_date and shift_date are required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        designated_holidays = DesignatedHoliday.objects.filter(
-            date__range=[start_date, end_date],
-            member__department_id=department_id,
-            created_by=user
-        )
-        designated_holiday_serializer = DesignatedHolidaySerializer(designated_holidays, many=True)
+        try:
+            start_date = date.fromisoformat(start_date_str)
+            end_date = date.fromisoformat(end_date_str)
+            shift_date = date.fromisoformat(shift_date_str)
+            radius = int(request.data.get('radius_days', REPAIR_RADIUS_DAYS))
+        except (TypeError, ValueError):
+            return Response({'error': 'Invalid date or radius_days'}, status=status.HTTP_400_BAD_REQUEST)
+        if radius < 0:
+            return Response({'error': 'radius_days must not be negative'}, status=status.HTTP_400_BAD_REQUEST)
+        if not start_date <= shift_date <= end_date:
+            return Response({'error': 'shift_date must be within start_date and end_date'}, status=status.HTTP_400_BAD_REQUEST)
+        radius = min(radius, MAX_REPAIR_RADIUS_DAYS)
 
-        paid_leaves = PaidLeave.objects.filter(
-            date__range=[start_date, end_date],
-            member__department_id=department_id,
-            created_by=user
-        ).select_related('member')
-        paid_leave_serializer = PaidLeaveSerializer(paid_leaves, many=True)
+        if not Department.objects.filter(id=department_id, created_by=request.user).exists():
+            return Response({'error': 'Invalid department'}, status=status.HTTP_403_FORBIDDEN)
 
-        earnings_map = defaultdict(float)
-        premium_start, premium_end = time(22, 0), time(5, 0)
-        for assign in assignments:
-            if assign.member.employee_type == 'hourly' and assign.member.hourly_wage:
-                p = assign.shift_pattern
-                total_duration = (datetime.combine(date.today(), p.end_time) - datetime.combine(date.today(), p.start_time)).total_seconds() / 60
-                if p.end_time < p.start_time: total_duration += 24 * 60
-                work_minutes = total_duration - p.break_minutes
-                
-                premium_minutes = 0
-                current_time = datetime.combine(date.today(), p.start_time)
-                for _ in range(int(total_duration)):
-                    if current_time.time() >= premium_start or current_time.time() < premium_end:
-                        premium_minutes += 1
-                    current_time += timedelta(minutes=1)
-                
-                normal_minutes = work_minutes - premium_minutes
-                
-                earnings = (normal_minutes * assign.member.hourly_wage) + (premium_minutes * assign.member.hourly_wage * 1.25)
-                earnings_map[assign.member.id] += earnings / 60
-        
-        for pl in paid_leaves:
-            if pl.member.employee_type == 'hourly' and pl.member.hourly_wage:
-                earnings_map[pl.member.id] += (pl.hours * pl.member.hourly_wage)
-        
-        return Response({
-            'assignments': assignment_serializer.data,
-            'fixed_assignments': fixed_assignment_serializer.data,
-            'leave_requests': leave_data,
-            'members': member_serializer.data,
-            'availabilities': availability_serializer.data,
-            'other_assignments': other_serializer.data,
-            'designated_holidays': designated_holiday_serializer.data,
-            'paid_leaves': paid_leave_serializer.data,
-            'earnings': {k: round(v) for k, v in earnings_map.items()},
-        })
-
-class GenerateShiftView(APIView):
+        window_start = max(start_date, shift_date - timedelta(days=radius))
+        window_end = min(end_date, shift_date + timedelta(days=radius))
+        result = generate_schedule(department_id, start_date_str, end_date_str, repair_window=(window_start, window_end))
+
+        if result.get('success'):
+            save_generated_assignments(department_id, start_date, end_date, result.get('assignments', []), request.user)
+            return Response({
+                'success': True,
+                'infeasible_days': result.get('infeasible_days', {}),
+                'diff': result.get('diff', {'added': [], 'removed': []}),
+            }, status=status.HTTP_200_OK)
+        return Response(result, status=status.HTTP_200_OK)
+
+class SolverJobCreateView(APIView):
+    """シフト生成をジョブとして登録し、ジョブIDをすぐに返す"""
     def post(self, request, *args, **kwargs):
         department_id = request.data.get('department_id')
         start_date_str = request.data.get('start_date')
         end_date_str = request.data.get('end_date')
         if not start_date_str or not end_date_str or not department_id:
             return Response({'error': 'department_id, start_date and end_date are required'}, status=status.HTTP_400_BAD_REQUEST)
-        
+
+        try:
+            start_date = date.fromisoformat(start_date_str)
+            end_date = date.fromisoformat(end_date_str)
+        except ValueError:
+            return Response({'error': 'start_date and end_date must be YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+
         if not Department.objects.filter(id=department_id, created_by=request.user).exists():
             return Response({'error': 'Invalid department'}, status=status.HTTP_403_FORBIDDEN)
 
-        # Run the solver
-        result = generate_schedule(department_id, start_date_str, end_date_str)
+        job = SolverJob.objects.create(
+            department_id=department_id,
+            start_date=start_date,
+            end_date=end_date,
+            created_by=request.user
+        )
+        enqueue_solver_job(job)
+        job.refresh_from_db()
+        return Response(SolverJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+class GenerateShiftView(SolverJobCreateView):
+    """
+    旧エンドポイント (/generate-shifts/)。
+    シフト生成でWebワーカーを占有しないよう、リクエスト内では実行せず /solver-jobs/ と同じくジョブを登録して 202 を返す。
+    結果は /solver-jobs/<id>/result/ で取得する。
+    """
+
+class SolverJobDetailView(generics.RetrieveAPIView):
+    """
+    ジョブの状態をポーリングするためのエンドポイント。
+    ?since=<受け取り済みの進捗の件数>&wait=<秒> を指定すると、新しい進捗が届くかジョブが終了するまで
+    最大 LONG_POLL_MAX_SECONDS 秒待ってから返す (ロングポーリング)。
+    Webワーカーを長時間占有しないよう、待ち時間は短く制限する。
+    """
+    queryset = SolverJob.objects.all()
+    serializer_class = SolverJobSerializer
+    LONG_POLL_MAX_SECONDS = 5
+    POLL_SECONDS = 0.5
 
-        if result.get('success'):
-            # Clear previous assignments for this period
-            start_date = date.fromisoformat(start_date_str)
-            end_date = date.fromisoformat(end_date_str)
-            Assignment.objects.filter(
-                shift_date__range=[start_date, end_date],
-                member__department_id=department_id,
-                created_by=request.user
-            ).delete()
-
-            # Create new assignments from solver result, adding the current user
-            assignments_data = result.get('assignments', [])
-            new_assignments = []
-            for assign_data in assignments_data:
-                new_assignments.append(
-                    Assignment(
-                        member_id=assign_data['member_id'],
-                        shift_pattern_id=assign_data['shift_pattern_id'],
-                        shift_date=assign_data['shift_date'],
-                        created_by=request.user
-                    )
-                )
-            
-            if new_assignments:
-                Assignment.objects.bulk_create(new_assignments)
-            
-            # Serialize the newly created objects to return to the frontend
-            serializer = AssignmentSerializer(new_assignments, many=True)
-            response_data = {
-                'success': True,
-                'infeasible_days': result.get('infeasible_days', {}),
-                'assignments': serializer.data
-            }
-            return Response(response_data, status=status.HTTP_200_OK)
-        else:
-            # If solver failed, just return the failure message
-            return Response(result, status=status.HTTP_200_OK)
+    def get_queryset(self):
+        fail_stale_jobs(SolverJob, settings.SOLVER_JOB_TIMEOUT_SECONDS, id=self.kwargs['pk'])
+        return self.queryset.filter(created_by=self.request.user)
 
-class ManualAssignmentView(APIView):
+    def get_object(self):
+        job = super().get_object()
+        try:
+            since = int(self.request.query_params['since'])
+            wait = min(float(self.request.query_params.get('wait', self.LONG_POLL_MAX_SECONDS)), self.LONG_POLL_MAX_SECONDS)
+        except (KeyError, ValueError):
+            return job
+
+        deadline = monotonic() + wait
+        while job.status in ('queued', 'running') and len(job.progress) <= since and monotonic() < deadline:
+            sleep(self.POLL_SECONDS)
+            job.refresh_from_db()
+        return job
+
+class SolverJobResultView(APIView):
+    def get(self, request, pk, *args, **kwargs):
+        fail_stale_jobs(SolverJob, settings.SOLVER_JOB_TIMEOUT_SECONDS, id=pk)
+        job = SolverJob.objects.filter(id=pk, created_by=request.user).first()
+        if job is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        if job.status in ('queued', 'running'):
+            return Response({'status': job.status}, status=status.HTTP_202_ACCEPTED)
+        if job.status == 'failed':
+            return Response({
+                'success': False,
+                'infeasible_days': {'general': ['シフト生成中にエラーが発生しました。']},
+                'assignments': [],
+            }, status=status.HTTP_200_OK)
+        return Response(job.result, status=status.HTTP_200_OK)
+
+class SolverJobStopView(APIView):
+    """実行中のジョブを、その時点の最良解で終了させる"""
+    def post(self, request, pk, *args, **kwargs):
+        job = SolverJob.objects.filter(id=pk, created_by=request.user).first()
+        if job is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        if job.status != 'running':
+            return Response({'error': 'Job is not running'}, status=status.HTTP_409_CONFLICT)
+
+        SolverJob.objects.filter(id=pk).update(stop_requested=True)
+        return Response({'status': 'stop_requested'}, status=status.HTTP_202_ACCEPTED)
+
+def apply_single_cell_operation(request, **operation):
+    """1セルの操作を /cells/batch/ と同じ処理で適用し、(結果, エラーのレスポンス) を返す"""
+    try:
+        return apply_cell_operations(request.user, [operation]), None
+    except CellOperationError as e:
+        return None, Response({'error': str(e)}, status=e.status_code)
+
+class CellBatchView(APIView):
+    """
+    複数セルの操作 (operations) をまとめて1つのトランザクションで適用する。
+    各操作は {type, member_id, date, pattern_id, activity_name}。type は core.cell_edits.apply_cell_operations を参照。
+    """
     def post(self, request, *args, **kwargs):
-        member_id = request.data.get('member_id')
-        shift_date = request.data.get('shift_date')
-        pattern_id = request.data.get('pattern_id')
-        
-        member = Member.objects.get(id=member_id)
-        if member.created_by != request.user:
-            return Response(status=status.HTTP_403_FORBIDDEN)
+        try:
+            result = apply_cell_operations(request.user, request.data.get('operations'))
+        except CellOperationError as e:
+            return Response({'error': str(e)}, status=e.status_code)
+        return Response({'status': 'success', **result}, status=status.HTTP_200_OK)
 
-        DesignatedHoliday.objects.filter(member_id=member_id, date=shift_date).delete()
-        PaidLeave.objects.filter(member_id=member_id, date=shift_date).delete()
-        
-        Assignment.objects.filter(member_id=member_id, shift_date=shift_date).delete()
-        OtherAssignment.objects.filter(member_id=member_id, shift_date=shift_date).delete()
-        if pattern_id:
-            Assignment.objects.create(member_id=member_id, shift_pattern_id=pattern_id, shift_date=shift_date, created_by=request.user)
-        return Response(status=status.HTTP_200_OK)
+class ManualAssignmentView(APIView):
+    def post(self, request, *args, **kwargs):
+        _, error = apply_single_cell_operation(
+            request, type='assignment', member_id=request.data.get('member_id'),
+            date=request.data.get('shift_date'), pattern_id=request.data.get('pattern_id')
+        )
+        return error or Response(status=status.HTTP_200_OK)
 
 class OtherAssignmentView(APIView):
     def post(self, request, *args, **kwargs):
-        member_id = request.data.get('member_id')
-        shift_date = request.data.get('shift_date')
-        activity_name = request.data.get('activity_name')
-        
-        member = Member.objects.get(id=member_id)
-        if member.created_by != request.user:
-            return Response(status=status.HTTP_403_FORBIDDEN)
-
-        DesignatedHoliday.objects.filter(member_id=member_id, date=shift_date).delete()
-        PaidLeave.objects.filter(member_id=member_id, date=shift_date).delete()
-        
-        Assignment.objects.filter(member_id=member_id, shift_date=shift_date).delete()
-        OtherAssignment.objects.filter(member_id=member_id, shift_date=shift_date).delete()
-        if activity_name:
-            OtherAssignment.objects.create(member_id=member_id, shift_date=shift_date, activity_name=activity_name, created_by=request.user)
-        return Response(status=status.HTTP_200_OK)
+        _, error = apply_single_cell_operation(
+            request, type='other', member_id=request.data.get('member_id'),
+            date=request.data.get('shift_date'), activity_name=request.data.get('activity_name')
+        )
+        return error or Response(status=status.HTTP_200_OK)
 
+@method_decorator(atomic_department_writes, name='post')
 class BulkFixedAssignmentView(APIView):
     def post(self, request, *args, **kwargs):
         assignments = request.data.get('assignments', [])
@@ -279,7 +307,10 @@ class BulkFixedAssignmentView(APIView):
 
         # Security check: ensure all members belong to the current user
         member_ids = {assign['member_id'] for assign in assignments}
-        if Member.objects.filter(id__in=member_ids, created_by=request.user).count() != len(member_ids):
+        member_departments = dict(
+            Member.objects.filter(id__in=member_ids, created_by=request.user).values_list('id', 'department_id')
+        )
+        if len(member_departments) != len(member_ids):
             return Response({'error': 'Invalid member ID included'}, status=status.HTTP_403_FORBIDDEN)
 
         fixed_assignments_to_create = []
@@ -287,6 +318,7 @@ class BulkFixedAssignmentView(APIView):
             fixed_assignments_to_create.append(
                 FixedAssignment(
                     member_id=assign['member_id'],
+                    department_id=member_departments[assign['member_id']],
                     shift_pattern_id=assign['shift_pattern_id'],
                     shift_date=assign['shift_date'],
                     created_by=request.user
@@ -294,6 +326,14 @@ class BulkFixedAssignmentView(APIView):
             )
         
         FixedAssignment.objects.bulk_create(fixed_assignments_to_create, ignore_conflicts=True)
+        # bulk_create はシグナルを送らず、ignore_conflicts では ID も返らないため、作成後の行を読み直して変更履歴に残す
+        cells = {(fixed.member_id, str(fixed.shift_date)) for fixed in fixed_assignments_to_create}
+        fixed_rows = FixedAssignment.objects.filter(
+            member_id__in=member_ids, shift_date__in={shift_date for _, shift_date in cells}
+        ).values_list('id', 'department_id', 'member_id', 'shift_date')
+        for fixed_id, department_id, member_id, shift_date in fixed_rows:
+            if (member_id, shift_date.isoformat()) in cells:
+                record_cell_change(department_id, 'fixed_assignments', 'insert', fixed_id, member_id, shift_date)
         
         return Response({'status': 'success'}, status=status.HTTP_201_CREATED)
 
@@ -301,30 +341,14 @@ class FixedAssignmentView(APIView):
     def post(self, request, *args, **kwargs):
         member_id = request.data.get('member_id')
         shift_date = request.data.get('shift_date')
-        pattern_id = request.data.get('pattern_id')
-        
+
         if not all([member_id, shift_date]):
             return Response({'error': 'member_id and shift_date are required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        member = Member.objects.get(id=member_id)
-        if member.created_by != request.user:
-            return Response(status=status.HTTP_403_FORBIDDEN)
-
-        DesignatedHoliday.objects.filter(member_id=member_id, date=shift_date).delete()
-        PaidLeave.objects.filter(member_id=member_id, date=shift_date).delete()
-        
-        Assignment.objects.filter(member_id=member_id, shift_date=shift_date).delete()
-        
-        if pattern_id:
-            FixedAssignment.objects.update_or_create(
-                member_id=member_id,
-                shift_date=shift_date,
-                defaults={'shift_pattern_id': pattern_id, 'created_by': request.user}
-            )
-        else:
-            FixedAssignment.objects.filter(member_id=member_id, shift_date=shift_date).delete()
-            
-        return Response(status=status.HTTP_200_OK)
+        _, error = apply_single_cell_operation(
+            request, type='fixed', member_id=member_id, date=shift_date, pattern_id=request.data.get('pattern_id')
+        )
+        return error or Response(status=status.HTTP_200_OK)
 
 class DesignatedHolidayView(APIView):
     def post(self, request, *args, **kwargs):
@@ -334,27 +358,13 @@ class DesignatedHolidayView(APIView):
         if not all([member_id, date]):
             return Response({'error': 'member_id and date are required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        member = Member.objects.get(id=member_id)
-        if member.created_by != request.user:
-            return Response(status=status.HTTP_403_FORBIDDEN)
-
-        holiday, created = DesignatedHoliday.objects.get_or_create(
-            member_id=member_id,
-            date=date,
-            defaults={'created_by': request.user}
-        )
-
-        if created:
-            Assignment.objects.filter(member_id=member_id, shift_date=date).delete()
-            FixedAssignment.objects.filter(member_id=member_id, shift_date=date).delete()
-            OtherAssignment.objects.filter(member_id=member_id, shift_date=date).delete()
-            PaidLeave.objects.filter(member_id=member_id, date=date).delete()
-            action = "created"
-        else:
-            action = "already_exists"
-            
+        result, error = apply_single_cell_operation(request, type='designated_holiday', member_id=member_id, date=date)
+        if error:
+            return error
+        action = "created" if result['created'] else "already_exists"
         return Response({'status': f'holiday {action}'}, status=status.HTTP_200_OK)
 
+@method_decorator(atomic_department_writes, name='delete')
 class PaidLeaveView(APIView):
     def post(self, request, *args, **kwargs):
         member_id = request.data.get('member_id')
@@ -363,27 +373,10 @@ class PaidLeaveView(APIView):
         if not all([member_id, date]):
             return Response({'error': 'member_id and date are required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        member = Member.objects.get(id=member_id)
-        if member.created_by != request.user:
-            return Response(status=status.HTTP_403_FORBIDDEN)
-
-        Assignment.objects.filter(member_id=member_id, shift_date=date).delete()
-        FixedAssignment.objects.filter(member_id=member_id, shift_date=date).delete()
-        OtherAssignment.objects.filter(member_id=member_id, shift_date=date).delete()
-        DesignatedHoliday.objects.filter(member_id=member_id, date=date).delete()
-        LeaveRequest.objects.filter(member_id=member_id, leave_date=date).delete()
-
-        paid_leave, created = PaidLeave.objects.get_or_create(
-            member_id=member_id,
-            date=date,
-            defaults={'created_by': request.user}
-        )
-
-        if created:
-            action = "created"
-        else:
-            action = "already_exists"
-            
+        result, error = apply_single_cell_operation(request, type='paid_leave', member_id=member_id, date=date)
+        if error:
+            return error
+        action = "created" if result['created'] else "already_exists"
         return Response({'status': f'paid_leave {action}'}, status=status.HTTP_200_OK)
 
     def delete(self, request, *args, **kwargs):
@@ -398,6 +391,7 @@ class PaidLeaveView(APIView):
             return Response({'status': 'deleted'}, status=status.HTTP_200_OK)
         return Response({'status': 'not_found'}, status=status.HTTP_404_NOT_FOUND)
 
+@method_decorator(department_etag, name='get')
 class SolverSettingsDetailView(generics.RetrieveUpdateAPIView):
     queryset = SolverSettings.objects.all()
     serializer_class = SolverSettingsSerializer
@@ -409,6 +403,7 @@ class SolverSettingsDetailView(generics.RetrieveUpdateAPIView):
     def perform_update(self, serializer):
         serializer.save(created_by=self.request.user)
 
+@method_decorator(department_etag, name='get')
 class SolverSettingsListView(generics.ListCreateAPIView):
     queryset = SolverSettings.objects.all()
     serializer_class = SolverSettingsSerializer
@@ -419,6 +414,7 @@ class SolverSettingsListView(generics.ListCreateAPIView):
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
+@method_decorator(atomic_department_writes, name='post')
 class BulkAssignmentDeleteView(APIView):
     def post(self, request, *args, **kwargs):
         assignment_ids = request.data.get('assignment_ids', [])
@@ -429,6 +425,7 @@ class BulkAssignmentDeleteView(APIView):
         
         return Response({'status': 'success'}, status=status.HTTP_200_OK)
 
+@method_decorator(atomic_department_writes, name='post')
 class BulkFixedAssignmentDeleteView(APIView):
     def post(self, request, *args, **kwargs):
         fixed_assignment_ids = request.data.get('fixed_assignment_ids', [])
@@ -439,6 +436,7 @@ class BulkFixedAssignmentDeleteView(APIView):
         
         return Response({'status': 'success'}, status=status.HTTP_200_OK)
 
+@method_decorator(atomic_department_writes, name='post')
 class BulkOtherAssignmentDeleteView(APIView):
     def post(self, request, *args, **kwargs):
         other_assignment_ids = request.data.get('other_assignment_ids', [])
@@ -449,6 +447,7 @@ class BulkOtherAssignmentDeleteView(APIView):
         
         return Response({'status': 'success'}, status=status.HTTP_200_OK)
 
+@method_decorator(atomic_department_writes, name='post')
 class BulkDesignatedHolidayDeleteView(APIView):
     def post(self, request, *args, **kwargs):
         designated_holiday_ids = request.data.get('designated_holiday_ids', [])
@@ -459,6 +458,7 @@ class BulkDesignatedHolidayDeleteView(APIView):
         
         return Response({'status': 'success'}, status=status.HTTP_200_OK)
 
+@method_decorator(atomic_department_writes, name='post')
 class BulkPaidLeaveDeleteView(APIView):
     def post(self, request, *args, **kwargs):
         paid_leave_ids = request.data.get('paid_leave_ids', [])
@@ -469,13 +469,67 @@ class BulkPaidLeaveDeleteView(APIView):
         
         return Response({'status': 'success'}, status=status.HTTP_200_OK)
 
-from django.http import HttpResponse
-import openpyxl
-from openpyxl import utils
-from openpyxl.styles import PatternFill, Alignment, Font, Border, Side
-from io import BytesIO
+def export_response(path, filename, content_type=XLSX_CONTENT_TYPE):
+    """キャッシュのファイルを FileResponse で少しずつ送る"""
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=filename, content_type=content_type)
+
+def grid_export_response(user, department_id, start_date, end_date, export_format):
+    """従業員×日付の表を csv・jsonl はストリーミングで、parquet はファイルに書き出してから返す"""
+    grid_rows = iter_shift_grid(user, department_id, start_date, end_date)
+    filename = export_filename(start_date, export_format)
+    if export_format == ParquetExportRenderer.format:
+        try:
+            file = write_parquet(start_date, end_date, grid_rows)
+        except ImportError:
+            return Response({'error': 'Parquet export requires pyarrow to be installed'}, status=status.HTTP_501_NOT_IMPLEMENTED)
+        return FileResponse(file, as_attachment=True, filename=filename, content_type=PARQUET_CONTENT_TYPE)
+
+    if export_format == CsvExportRenderer.format:
+        content, content_type = iter_csv(start_date, end_date, grid_rows), CSV_CONTENT_TYPE
+    else:
+        content, content_type = iter_jsonl(start_date, end_date, grid_rows), JSONL_CONTENT_TYPE
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+def save_export_job(job):
+    """ジョブを保存し、ファイルが作成済みであれば完了済みにする。なければジョブを実行キューに投入する"""
+    if get_cached_export(job.cache_key, job.layout):
+        job.status = 'succeeded'
+        job.cached = True
+        job.finished_at = timezone.now()
+        job.save()
+    else:
+        job.save()
+        enqueue_export_job(job)
+        job.refresh_from_db()
+    return Response(ExportJobSerializer(job).data, status=status.HTTP_201_CREATED)
+
+class GridExportRenderer(BaseRenderer):
+    """/shifts/export/ の出力形式 (?format=csv など) を選ぶためのレンダラー (エラー時はJSONを返す)"""
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data).encode()
+
+class CsvExportRenderer(GridExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+class JsonLinesExportRenderer(GridExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'jsonl'
+
+class ParquetExportRenderer(GridExportRenderer):
+    media_type = 'application/vnd.apache.parquet'
+    format = 'parquet'
 
 class ShiftExportExcelView(APIView):
+    """
+    同期版のエクスポート。同じ部門・期間・版数のファイルが作成済みであれば、そのファイルを返す。
+    ?format=csv|jsonl|parquet の場合は書式のない従業員×日付の表 (給与見込みを含む) を返す。
+    csv と jsonl はクエリの結果を読みながら1行ずつ送る。
+    """
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, CsvExportRenderer, JsonLinesExportRenderer, ParquetExportRenderer]
+
     def get(self, request, *args, **kwargs):
         try:
             department_id = self.request.query_params.get('department_id')
@@ -487,125 +541,14 @@ class ShiftExportExcelView(APIView):
 
             start_date = date.fromisoformat(start_date_str)
             end_date = date.fromisoformat(end_date_str)
-            user = self.request.user
-
-            # Data fetching
-            members = Member.objects.filter(created_by=user, department_id=department_id).order_by('sort_order', 'name')
-            assignments = Assignment.objects.filter(
-                created_by=user, member__department_id=department_id, shift_date__range=[start_date, end_date]
-            ).select_related('member', 'shift_pattern')
-            other_assignments = OtherAssignment.objects.filter(
-                created_by=user, member__department_id=department_id, shift_date__range=[start_date, end_date]
-            ).select_related('member')
-            paid_leaves = PaidLeave.objects.filter(
-                created_by=user, member__department_id=department_id, date__range=[start_date, end_date]
-            ).select_related('member')
-            designated_holidays = DesignatedHoliday.objects.filter(
-                created_by=user, member__department_id=department_id, date__range=[start_date, end_date]
-            ).select_related('member')
-            leave_requests = LeaveRequest.objects.filter(
-                created_by=user, member__department_id=department_id, leave_date__range=[start_date, end_date], status='approved'
-            ).select_related('member')
-
-            # Data processing with new symbols
-            shift_data = defaultdict(dict)
-            for assignment in assignments:
-                if assignment.shift_pattern:
-                    shift_data[assignment.shift_date][assignment.member_id] = assignment.shift_pattern.pattern_name
-            for other in other_assignments:
-                shift_data[other.shift_date][other.member_id] = other.activity_name
-            for leave in paid_leaves:
-                shift_data[leave.date][leave.member_id] = "有"
-            for holiday in designated_holidays:
-                shift_data[holiday.date][holiday.member_id] = "/"
-            for req in leave_requests:
-                shift_data[req.leave_date][req.member_id] = "❌"
-
-            # --- Create Excel workbook with pivoted layout ---
-            wb = openpyxl.Workbook()
-            ws = wb.active
-            ws.title = f"{start_date.strftime('%Y年%m月')} シフト表"
-
-            # Styles
-            header_font = Font(bold=True)
-            center_align = Alignment(horizontal='center', vertical='center')
-            thin_border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-            saturday_fill = PatternFill(start_color="ADD8E6", end_color="ADD8E6", fill_type="solid")
-            sunday_fill = PatternFill(start_color="FFC0CB", end_color="FFC0CB", fill_type="solid")
-
-            # Header Row (Dates)
-            date_headers = []
-            current_date = start_date
-            while current_date <= end_date:
-                date_headers.append(current_date)
-                current_date += timedelta(days=1)
-            
-            header_row = ['従業員名'] + [d.strftime('%d日(%a)') for d in date_headers]
-            ws.append(header_row)
-
-            # Style header row
-            for cell in ws[1]:
-                cell.font = header_font
-                cell.alignment = center_align
-                cell.border = thin_border
-
-            # Style date header cells based on weekday
-            for i, d in enumerate(date_headers, start=2):
-                if d.weekday() == 5: # Saturday
-                    ws.cell(row=1, column=i).fill = saturday_fill
-                elif d.weekday() == 6: # Sunday
-                    ws.cell(row=1, column=i).fill = sunday_fill
-
-            # Data Rows (Members)
-            for member in members:
-                row_data = [member.name]
-                for d in date_headers:
-                    row_data.append(shift_data[d].get(member.id, '/')) # Default to "/"
-                ws.append(row_data)
-
-            # Apply styles to all cells
-            for row_idx, row in enumerate(ws.iter_rows(), start=1):
-                for col_idx, cell in enumerate(row, start=1):
-                    cell.border = thin_border
-                    if row_idx > 1: # Skip header row for alignment
-                        cell.alignment = center_align
-                    # Apply weekend color to data cells
-                    if row_idx > 1 and col_idx > 1:
-                        # Subtract 1 from col_idx to get the correct index for date_headers
-                        if (col_idx - 2) < len(date_headers):
-                            current_date_for_col = date_headers[col_idx - 2]
-                            if current_date_for_col.weekday() == 5: # Saturday
-                                cell.fill = saturday_fill
-                            elif current_date_for_col.weekday() == 6: # Sunday
-                                cell.fill = sunday_fill
-
-            # Adjust column widths
-            for i, column_cells in enumerate(ws.columns):
-                is_date_col = i > 0
-                max_length = 0
-                column = utils.get_column_letter(i + 1)
-                for cell in column_cells:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                # Adjust width: date columns are narrower, name column is wider
-                adjusted_width = (max_length * 1.2) + 2 if is_date_col else max_length + 5
-                ws.column_dimensions[column].width = adjusted_width
-
-            # Save to buffer
-            buffer = BytesIO()
-            wb.save(buffer)
-            buffer.seek(0)
-
-            response = HttpResponse(
-                buffer.getvalue(),
-                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-            response['Content-Disposition'] = f'attachment; filename="shift_schedule_{start_date.strftime("%Y%m")}.xlsx"'
-            
-            return response
+
+            export_format = request.accepted_renderer.format
+            if export_format in (CsvExportRenderer.format, JsonLinesExportRenderer.format, ParquetExportRenderer.format):
+                return grid_export_response(request.user, department_id, start_date, end_date, export_format)
+
+            cache_key = export_key(request.user.pk, department_id, start_date, end_date, department_version(department_id))
+            path = get_cached_export(cache_key) or build_export(request.user, department_id, start_date, end_date, cache_key)
+            return export_response(path, export_filename(start_date))
 
         except Exception as e:
             import traceback
@@ -614,3 +557,115 @@ class ShiftExportExcelView(APIView):
                 'exception': str(e),
                 'traceback': traceback.format_exc()
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class ExportJobCreateView(APIView):
+    """
+    Excel エクスポートをジョブとして登録し、ジョブをすぐに返す。
+    同じ部門・期間・版数のファイルが作成済みであれば、完了済みのジョブを返す。
+    """
+    def post(self, request, *args, **kwargs):
+        department_id = request.data.get('department_id')
+        start_date_str = request.data.get('start_date')
+        end_date_str = request.data.get('end_date')
+        if not start_date_str or not end_date_str or not department_id:
+            return Response({'error': 'department_id, start_date and end_date are required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            start_date = date.fromisoformat(start_date_str)
+            end_date = date.fromisoformat(end_date_str)
+        except ValueError:
+            return Response({'error': 'start_date and end_date must be YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not Department.objects.filter(id=department_id, created_by=request.user).exists():
+            return Response({'error': 'Invalid department'}, status=status.HTTP_403_FORBIDDEN)
+
+        version = department_version(department_id)
+        cache_key = export_key(request.user.pk, department_id, start_date, end_date, version)
+        job = ExportJob(
+            department_id=department_id,
+            start_date=start_date,
+            end_date=end_date,
+            version=version,
+            cache_key=cache_key,
+            created_by=request.user
+        )
+        return save_export_job(job)
+
+class ExportJobBatchCreateView(APIView):
+    """
+    複数部門・複数月の Excel エクスポートをジョブとして登録する。
+    layout は workbook (部門・月ごとのシートを持つ1つのブック) か zip (部門ごとのブックの zip)。
+    department_ids を省略した場合は、ログインユーザーのすべての部門を出力する。
+    """
+    def post(self, request, *args, **kwargs):
+        department_ids = request.data.get('department_ids')
+        start_date_str = request.data.get('start_date')
+        end_date_str = request.data.get('end_date')
+        layout = request.data.get('layout', 'workbook')
+        if not start_date_str or not end_date_str:
+            return Response({'error': 'start_date and end_date are required'}, status=status.HTTP_400_BAD_REQUEST)
+        if layout not in ('workbook', 'zip'):
+            return Response({'error': 'layout must be workbook or zip'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            start_date = date.fromisoformat(start_date_str)
+            end_date = date.fromisoformat(end_date_str)
+        except ValueError:
+            return Response({'error': 'start_date and end_date must be YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+        if start_date > end_date:
+            return Response({'error': 'start_date must be on or before end_date'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # 部門の確認と版数の取得を1クエリで行う
+        departments = Department.objects.filter(created_by=request.user)
+        if department_ids is not None:
+            try:
+                department_ids = {int(department_id) for department_id in department_ids}
+            except (TypeError, ValueError):
+                return Response({'error': 'department_ids must be a list of IDs'}, status=status.HTTP_400_BAD_REQUEST)
+            departments = departments.filter(id__in=department_ids)
+        department_versions = list(departments.values_list('id', 'version__version'))
+        if department_ids is not None and len(department_versions) != len(department_ids):
+            return Response({'error': 'Invalid department ID included'}, status=status.HTTP_403_FORBIDDEN)
+        if not department_versions:
+            return Response({'error': 'No departments to export'}, status=status.HTTP_400_BAD_REQUEST)
+
+        job = ExportJob(
+            department_ids=sorted(department_id for department_id, _ in department_versions),
+            layout=layout,
+            start_date=start_date,
+            end_date=end_date,
+            cache_key=batch_export_key(request.user.pk, department_versions, start_date, end_date, layout),
+            created_by=request.user
+        )
+        return save_export_job(job)
+
+class ExportJobDetailView(generics.RetrieveAPIView):
+    """エクスポートジョブの状態をポーリングするためのエンドポイント"""
+    queryset = ExportJob.objects.all()
+    serializer_class = ExportJobSerializer
+
+    def get_queryset(self):
+        fail_stale_jobs(ExportJob, settings.EXPORT_JOB_TIMEOUT_SECONDS, id=self.kwargs['pk'])
+        return self.queryset.filter(created_by=self.request.user)
+
+class ExportJobDownloadView(APIView):
+    def get(self, request, pk, *args, **kwargs):
+        fail_stale_jobs(ExportJob, settings.EXPORT_JOB_TIMEOUT_SECONDS, id=pk)
+        job = ExportJob.objects.filter(id=pk, created_by=request.user).first()
+        if job is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        if job.status in ('queued', 'running'):
+            return Response({'status': job.status}, status=status.HTTP_202_ACCEPTED)
+        if job.status == 'failed':
+            return Response({'error': 'Export failed', 'exception': job.error_message}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        path = get_cached_export(job.cache_key, job.layout)
+        if path is None:
+            # キャッシュから削除された場合は、ジョブを登録し直してもらう
+            return Response({'error': 'Export file has expired'}, status=status.HTTP_410_GONE)
+        if job.layout == 'single':
+            return export_response(path, export_filename(job.start_date))
+        return export_response(
+            path, batch_export_filename(job.start_date, job.end_date, job.layout),
+            ZIP_CONTENT_TYPE if job.layout == 'zip' else XLSX_CONTENT_TYPE
+        )
@@ -0,0 +1,45 @@
+// /api/v1/schedule-data/?format=compact の列形式を、通常形式と同じ形の配列に展開する
+
+const offsetDate = (startDate, dayOffset) => {
+  const [year, month, day] = startDate.split('-').map(Number)
+  return new Date(Date.UTC(year, month - 1, day + dayOffset)).toISOString().slice(0, 10)
+}
+
+export const expandCompactSchedule = (payload) => {
+  const { members, patterns, start_date: startDate } = payload
+  const cellsOf = (table, toRow) => table.cells.map((cell, i) => toRow(members[cell[0]], offsetDate(startDate, cell[1]), cell, i))
+  const shiftRow = (table) => (member, date, cell, i) => ({
+    id: table.id[i],
+    shift_date: date,
+    member_id: member.id,
+    member_name: member.name,
+    shift_pattern: patterns[cell[2]].id,
+    shift_pattern_name: patterns[cell[2]].pattern_name,
+  })
+
+  return {
+    members,
+    availabilities: payload.availabilities,
+    earnings: payload.earnings,
+    assignments: cellsOf(payload.assignments, shiftRow(payload.assignments)),
+    fixed_assignments: cellsOf(payload.fixed_assignments, shiftRow(payload.fixed_assignments)),
+    leave_requests: cellsOf(payload.leave_requests, (member, date) => ({ leave_date: date, member_id: member.id })),
+    other_assignments: cellsOf(payload.other_assignments, (member, date, cell, i) => ({
+      id: payload.other_assignments.id[i],
+      member: member.id,
+      shift_date: date,
+      activity_name: payload.other_assignments.activity_name[i],
+    })),
+    designated_holidays: cellsOf(payload.designated_holidays, (member, date, cell, i) => ({
+      id: payload.designated_holidays.id[i],
+      member: member.id,
+      date,
+    })),
+    paid_leaves: cellsOf(payload.paid_leaves, (member, date, cell, i) => ({
+      id: payload.paid_leaves.id[i],
+      member: member.id,
+      date,
+      hours: payload.paid_leaves.hours[i],
+    })),
+  }
+}
@@ -0,0 +1,30 @@
+// /api/v1/schedule-data/changes/ の差分を、画面で持っているセルの配列に適用する
+
+// 希望休の行には ID がないため、従業員と日付で同じセルかどうかを判定する
+const leaveKey = (memberId, date) => `${memberId}_${date}`
+
+/**
+ * cells: { assignments, fixed_assignments, leave_requests, other_assignments, designated_holidays, paid_leaves }
+ * 削除を取り除いてから追加を適用した、新しい配列のオブジェクトを返す (変わらない種類は同じ配列のまま)。
+ */
+export const applyScheduleChanges = (cells, changes) => {
+  const result = { ...cells }
+  const kinds = new Set([...Object.keys(changes.deleted), ...Object.keys(changes.inserted)])
+
+  kinds.forEach((kind) => {
+    const deleted = changes.deleted[kind] || []
+    const inserted = changes.inserted[kind] || []
+    if (kind === 'leave_requests') {
+      const removed = new Set([
+        ...deleted.map((row) => leaveKey(row.member_id, row.date)),
+        ...inserted.map((row) => leaveKey(row.member_id, row.leave_date)),
+      ])
+      result[kind] = cells[kind].filter((row) => !removed.has(leaveKey(row.member_id, row.leave_date))).concat(inserted)
+    } else {
+      // 追加の行は現在の内容なので、同じ ID の古い行は置き換える
+      const removed = new Set([...deleted.map((row) => row.id), ...inserted.map((row) => row.id)])
+      result[kind] = cells[kind].filter((row) => !removed.has(row.id)).concat(inserted)
+    }
+  })
+  return result
+}